@@ -1,38 +1,85 @@
 import bpy
+import math
+import numpy
 import os
 import shutil
 import atexit
+import threading
+import time
 from bpy.app.handlers import persistent
 
 
 class CenterView(bpy.types.Operator):
     bl_idname = "view3d.center_view"
     bl_label = "Center View to selected object"
-    bl_description = "Centers the viewport on the active object and resets zoom."
+    bl_description = "Centers the viewport on the selected objects and resets zoom."
     bl_options = {'REGISTER', 'UNDO'}
 
     # Stores hotkeys.
     addon_keymaps = []
 
+    @classmethod
+    def poll(cls, context):
+        """Checks there is a 3D viewport to center."""
+        return context.region_data is not None
+
     @staticmethod
     def execute(self, context):
-        """Centers the viewport on the active object and resets zoom."""
-        # Store the current cursor location.
-        cursor_location = context.scene.cursor.location.copy()
+        """Centers the viewport on the selection and zooms to fit it."""
+        # Use the selection, or the active object when nothing is selected.
+        objects = context.selected_objects
+        if not objects and context.active_object is not None:
+            objects = [context.active_object]
+
+        if not objects:
+            self.report({'WARNING'}, "Nothing selected to center on.")
+            return {'CANCELLED'}
+
+        # Combined world space bounding box of every object.
+        bound_min, bound_max = get_world_bounds(objects)
+        center = (bound_min + bound_max) / 2
+        radius = max(numpy.linalg.norm(bound_max - bound_min) / 2, MINIMUM_VIEW_RADIUS)
+
+        # Move the view straight there, without touching the cursor.
+        region_3d = context.region_data
+        if region_3d.view_perspective == 'CAMERA':
+            # Leave the camera view, it cannot be moved.
+            region_3d.view_perspective = 'PERSP'
+        region_3d.view_location = center.tolist()
+        region_3d.view_distance = get_view_distance(context.space_data, region_3d, radius)
 
-        # Center the cursor on the active item.
-        bpy.ops.view3d.snap_cursor_to_selected()
+        return {'FINISHED'}
 
-        # Center the view on the cursor.
-        bpy.ops.view3d.view_center_cursor()
 
-        # Zoom into active item.
-        bpy.ops.view3d.view_selected()
+# Smallest radius zoomed to, so empties and single vertices do not zoom in forever.
+MINIMUM_VIEW_RADIUS = 0.5
 
-        # Reset the cursor location.
-        context.scene.cursor.location = cursor_location
+# Sensor width Blender uses for the viewport lens, in millimeters.
+VIEWPORT_SENSOR_WIDTH = 36.0
 
-        return {'FINISHED'}
+
+def get_world_bounds(objects):
+    """Returns the world space (min, max) corners of the bounding boxes of all objects."""
+    # Gather every object's bound box corners and matrix in one go.
+    corners = numpy.array([obj.bound_box for obj in objects], dtype=numpy.float64)
+    matrices = numpy.array([obj.matrix_world for obj in objects], dtype=numpy.float64)
+
+    # Transform all (N, 8) corners into world space at once.
+    world_corners = numpy.einsum('nij,nkj->nki', matrices[:, :3, :3], corners) + matrices[:, None, :3, 3]
+    world_corners = world_corners.reshape(-1, 3)
+
+    return world_corners.min(axis=0), world_corners.max(axis=0)
+
+
+def get_view_distance(space, region_3d, radius):
+    """Returns the view distance that fits a sphere of the given radius in the viewport."""
+    if region_3d.is_perspective:
+        # Distance at which the sphere fills the field of view.
+        fov = 2 * math.atan(VIEWPORT_SENSOR_WIDTH / (2 * space.lens))
+        return radius / math.sin(fov / 2)
+
+    # Orthographic views show a width proportional to the distance.
+    return 2 * radius * space.lens / VIEWPORT_SENSOR_WIDTH
 
 
 @persistent
@@ -42,9 +89,16 @@ def on_start(dummy):
         # get the default workspace
         default = bpy.data.workspaces.get("Layout")
 
+        # Only duplicate once per file, the workspace is saved with it.
         if "Minimal" not in bpy.data.workspaces:
+            existing = set(bpy.data.workspaces.keys())
             bpy.ops.workspace.duplicate({"workspace": default})
-            bpy.data.workspaces["Layout.001"].name = "Minimal"
+
+            # The duplicate is the only workspace that did not exist before.
+            for workspace in bpy.data.workspaces:
+                if workspace.name not in existing:
+                    workspace.name = "Minimal"
+                    break
 
         # May be already done, but explicitly make this workspace the active one
         bpy.context.window.workspace = bpy.data.workspaces["Minimal"]
@@ -53,20 +107,117 @@ def on_start(dummy):
         print("An exception occurred.")
 
 
-def clear_blender_cache():
-    """Locates the Blender temp/cache files and clears them."""
-    # Get the path to the Blender temp/cache directory
-    cache_dir = os.path.join(os.path.expanduser(
-        "~"), ".config", "blender", "cache")
+# Size budget for the Blender cache directory, in bytes.
+CACHE_SIZE_BUDGET = 2 * 1024 ** 3
+
+# Which timestamp decides how recently a cache entry was used, 'atime' or 'mtime'.
+CACHE_RECENCY_KEY = 'atime'
+
+
+class CacheManager:
+    """Keeps the Blender cache under a size budget by evicting least recently used entries."""
+
+    def __init__(self, cache_dir, budget=CACHE_SIZE_BUDGET, recency_key=CACHE_RECENCY_KEY):
+        self.cache_dir = cache_dir
+        self.budget = budget
+        self.recency_key = recency_key
+
+        # Filled in by the last eviction run.
+        self.bytes_freed = 0
+        self.entries_kept = 0
+        self.entries_evicted = 0
+
+        # Entries used since this session started may be open, never evict them.
+        self.session_start = time.time()
+
+        self._thread = None
+
+    def scan(self):
+        """Returns a list of (last_used, size, path) for every top level cache entry."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # A directory counts as one entry, used as recently as its newest file.
+                    # Its own atime is no use, walking it, in this scan or the last, updates that.
+                    size = 0
+                    last_used = None
+                    for root, _dirs, files in os.walk(entry.path):
+                        for name in files:
+                            stat = os.lstat(os.path.join(root, name))
+                            size += stat.st_size
+                            used = getattr(stat, "st_" + self.recency_key)
+                            last_used = used if last_used is None else max(last_used, used)
+
+                    # An empty directory was last used when its contents last changed.
+                    if last_used is None:
+                        last_used = entry.stat(follow_symlinks=False).st_mtime
+                else:
+                    stat = entry.stat(follow_symlinks=False)
+                    size = stat.st_size
+                    last_used = getattr(stat, "st_" + self.recency_key)
+            except OSError:
+                # The entry vanished or is unreadable, leave it alone.
+                continue
+
+            entries.append((last_used, size, entry.path))
+
+        return entries
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in the budget."""
+        self.bytes_freed = 0
+        self.entries_kept = 0
+        self.entries_evicted = 0
 
-    # Check if the directory exists
-    if os.path.exists(cache_dir):
-        # Clear the directory
-        shutil.rmtree(cache_dir)
-        os.makedirs(cache_dir)
-        print("Blender cache cleared successfully.")
-    else:
-        print("Blender cache directory not found.")
+        if not os.path.isdir(self.cache_dir):
+            print("Blender cache directory not found.")
+            return
+
+        # Oldest entries first.
+        entries = sorted(self.scan())
+        total_size = sum(size for _last_used, size, _path in entries)
+
+        for last_used, size, path in entries:
+            if total_size <= self.budget or last_used >= self.session_start:
+                break
+
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            except OSError:
+                continue
+
+            total_size -= size
+            self.bytes_freed += size
+            self.entries_evicted += 1
+
+        self.entries_kept = len(entries) - self.entries_evicted
+
+        print("Blender cache trimmed: freed {0} bytes, kept {1} entries ({2} bytes).".format(
+            self.bytes_freed, self.entries_kept, total_size))
+
+    def start(self):
+        """Runs the eviction in a background thread so it never blocks Blender."""
+        if self._thread is not None and self._thread.is_alive():
+            return self._thread
+
+        self._thread = threading.Thread(
+            target=self.evict, name="Blender Cache Eviction", daemon=True)
+        self._thread.start()
+        return self._thread
+
+
+def get_blender_cache_dir():
+    """Returns the path to the Blender temp/cache directory."""
+    return os.path.join(os.path.expanduser("~"), ".config", "blender", "cache")
+
+
+def trim_blender_cache():
+    """Trims the Blender cache down to its size budget in the background."""
+    return CacheManager(get_blender_cache_dir()).start()
 
 
 def register_center_view_hotkey():
@@ -91,10 +242,25 @@ def remove_center_view_hotkey():
     CenterView.addon_keymaps.clear()
 
 
+def on_exit():
+    """Removes the load handler and hotkey when Blender exits, unless unregister already did."""
+    if on_start in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(on_start)
+    remove_center_view_hotkey()
+
+
+# Operators registered by this addon.
+classes = (CenterView,)
+
+# Whether on_exit is registered with atexit.
+_exit_registered = False
+
+
 def register():
     """Registers operators and hotkeys."""
     # Register the operator
-    bpy.utils.register_class(CenterView)
+    for cls in classes:
+        bpy.utils.register_class(cls)
 
     # Add the hotkey.
     register_center_view_hotkey()
@@ -102,19 +268,29 @@ def register():
     # Register on_start to run when Blender finishes loading.
     bpy.app.handlers.load_post.append(on_start)
 
-    # Register functions to run when Blender exits.
-    atexit.register(bpy.app.handlers.load_post.remove,
-                    clear_blender_cache, remove_center_view_hotkey)
+    # Trim the cache left by previous sessions without delaying startup or shutdown.
+    trim_blender_cache()
+
+    # Register the exit cleanup once, however often the add-on is enabled.
+    global _exit_registered
+    if not _exit_registered:
+        atexit.register(on_exit)
+        _exit_registered = True
 
 
 def unregister():
     """Unregisters operators and hotkeys."""
     # Unregister the operator
-    bpy.utils.unregister_class(CenterView)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
 
     # Remove the hotkey.
     remove_center_view_hotkey()
 
+    # Stop creating the workspace on file load.
+    if on_start in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(on_start)
+
 
 if __name__ == "__main__":
     register()
@@ -4,6 +4,42 @@ A Blender addon to apply a rain emitter to all selected meshes.
 
 import bpy
 
+try:
+    from weather_suite.assets import link_asset
+    from weather_suite.dynamic_paint import get_dynamic_paint, remove_if_empty
+    from weather_suite.instrumentation import timed_section
+    from weather_suite.modal_runner import TimeSlicedOperator
+except ImportError:
+    # Without the weather suite installed nothing is measured, assets are always
+    # created locally and the whole selection runs at once.
+    from contextlib import nullcontext as timed_section
+
+    def link_asset(collection, name):
+        """Has no library to link from."""
+        return None
+
+    def get_dynamic_paint(obj):
+        """Returns the object's dynamic paint modifier, or None."""
+        return next((modifier for modifier in obj.modifiers if modifier.type == 'DYNAMIC_PAINT'), None)
+
+    def remove_if_empty(obj, dynamic_paint_modifier):
+        """Removes a dynamic paint modifier that has neither a canvas nor a brush left."""
+        if dynamic_paint_modifier.canvas_settings is None and dynamic_paint_modifier.brush_settings is None:
+            obj.modifiers.remove(dynamic_paint_modifier)
+
+    class TimeSlicedOperator:
+        """Runs apply on every selected mesh in one go."""
+
+        def execute(self, context):
+            """Sets up the shared data, then applies the effect to every selected mesh."""
+            # Setup may change the selection, so collect the targets first.
+            targets = [obj for obj in context.selected_objects if obj.type == 'MESH']
+            self.setup(context)
+            for obj in targets:
+                self.apply(context, obj)
+            return {'FINISHED'}
+
+
 bl_info = {
     "name": "Apply Rain",
     "blender": (2, 80, 0),  # Minimum Blender version required
@@ -19,8 +55,33 @@ bl_info = {
     "warning": "This addon is still under development.",
 }
 
+# Settings of every rain emitter. Changing them updates existing emitters on the next Apply Rain.
+RAIN_CONFIG = {
+    "particle_size": 0.01,
+    "size_random": 1.0,
+    "count": 10000,
+    "impact_count": 1000,
+    "emit_from": 'VOLUME',
+    "solid_radius": 0.05,
+}
+
+# Particle settings the impact system copies from the visible rain, so both fall the same way.
+MATCHED_SETTINGS = (
+    "emit_from", "distribution", "frame_start", "frame_end", "lifetime", "lifetime_random",
+    "normal_factor", "physics_type", "mass", "particle_size", "size_random",
+)
+
+# Custom property recording what Apply Rain added to an object.
+STATE_PROPERTY = "weather_rain"
 
-class ApplyRain(bpy.types.Operator):
+# Names Apply Rain gives the visible rain and the impact particle systems.
+SYSTEM_NAMES = ("Rain Particle System", "Rain Impact System")
+
+# Custom property tagging the data this add-on creates, so the weather suite can clean it up.
+OWNER_PROPERTY = "weather_owner"
+
+
+class ApplyRain(TimeSlicedOperator, bpy.types.Operator):
     """
     This operator applies a rain emitter to all selected mesh objects.
     It creates a raindrop object and a glass material for the rain drops.
@@ -32,91 +93,118 @@ class ApplyRain(bpy.types.Operator):
     bl_description = "Applies a rain emitter to all selected objects."
     bl_options = {'REGISTER', 'UNDO'}
 
-    @staticmethod
-    def execute(self, context):
-        """Applies a rain emitter to all selected mesh objects."""
-        # Get all selected mesh objects from the outliner.
-        selected_objects = [
-            obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
-
+    def setup(self, context):
+        """Creates the raindrop and its glass material, shared by every emitter."""
         # ------------------- #SECTION - Raindrop Mesh ------------------ #
-        # Check if the raindrop already exists. If not, create it.
-        raindrop_obj = bpy.data.objects.get("Raindrop")
-        if raindrop_obj is None:
-            # Create the raindrop object.
-            bpy.ops.mesh.primitive_ico_sphere_add(
-                radius=1, enter_editmode=False, align='WORLD', location=(0, 0, 1), scale=(1, 1, 1))
-            raindrop_obj = bpy.context.active_object
-            raindrop_obj.name = "Raindrop"
-
-            # Add a Decimate modifier to the raindrop object.
-            bpy.ops.object.modifier_add(type='DECIMATE')
-            bpy.context.object.modifiers["Decimate"].ratio = 0.25
-            bpy.ops.object.shade_smooth()
-            # raindrop_obj.hide_viewport = True
-
-            #!SECTION
+        with timed_section("Raindrop Mesh"):
+            # Check if the raindrop already exists. If not, link or create it.
+            raindrop_obj = bpy.data.objects.get("Raindrop")
+            if raindrop_obj is None:
+                # Link the raindrop from the weather asset library, when there is one.
+                raindrop_obj = link_asset("objects", "Raindrop")
+
+            if raindrop_obj is None:
+                # Create the raindrop object.
+                bpy.ops.mesh.primitive_ico_sphere_add(
+                    radius=1, enter_editmode=False, align='WORLD', location=(0, 0, 1), scale=(1, 1, 1))
+                raindrop_obj = bpy.context.active_object
+                raindrop_obj.name = "Raindrop"
+                raindrop_obj.data[OWNER_PROPERTY] = "apply_rain"
+
+                # Add a Decimate modifier to the raindrop object.
+                bpy.ops.object.modifier_add(type='DECIMATE')
+                bpy.context.object.modifiers["Decimate"].ratio = 0.25
+                bpy.ops.object.shade_smooth()
+                # raindrop_obj.hide_viewport = True
+
+                #!SECTION
+
+        # A linked raindrop brings its own material.
+        if raindrop_obj.library is not None:
+            return
 
         # ------------------- #SECTION - Rain Material------------------ #
-        # Create glass material for Rain Drops.
-        mat = bpy.data.materials.get("Rain")
-        if mat is None:
-            # Create material.
-            mat = bpy.data.materials.new(name="Rain")
+        with timed_section("Rain Material"):
+            # Create glass material for Rain Drops.
+            mat = bpy.data.materials.get("Rain")
+            if mat is None:
+                # Create material.
+                mat = bpy.data.materials.new(name="Rain")
+                mat[OWNER_PROPERTY] = "apply_rain"
 
-            mat.use_nodes = True
-            nodes = mat.node_tree.nodes
+                mat.use_nodes = True
+                nodes = mat.node_tree.nodes
 
-            # Clear existing nodes
-            for node in nodes:
-                nodes.remove(node)
+                # Clear existing nodes
+                for node in nodes:
+                    nodes.remove(node)
 
-            # Create a Glass BSDF node
-            glass_node = nodes.new(type="ShaderNodeBsdfGlass")
-            glass_node.location = (0, 0)
+                # Create a Glass BSDF node
+                glass_node = nodes.new(type="ShaderNodeBsdfGlass")
+                glass_node.location = (0, 0)
 
-            # Create a Material Output node
-            output_node = nodes.new(type="ShaderNodeOutputMaterial")
-            output_node.location = (400, 0)
+                # Create a Material Output node
+                output_node = nodes.new(type="ShaderNodeOutputMaterial")
+                output_node.location = (400, 0)
 
-            # Connect the Glass BSDF node to the Material Output node
-            material_output = output_node.inputs['Surface']
-            glass_output = glass_node.outputs['BSDF']
-            mat.node_tree.links.new(material_output, glass_output)
+                # Connect the Glass BSDF node to the Material Output node
+                material_output = output_node.inputs['Surface']
+                glass_output = glass_node.outputs['BSDF']
+                mat.node_tree.links.new(material_output, glass_output)
 
-            mat.use_screen_refraction = True
+                mat.use_screen_refraction = True
 
-            #!SECTION
+                #!SECTION
 
         # ------------------- #SECTION - Apply Material------------------ #
-        # Assign rain material to raindrop object.
-        if raindrop_obj.data.materials:
-            # Assign to 1st material slot.
-            raindrop_obj.data.materials[0] = mat
-        else:
-            # No slots.
-            raindrop_obj.data.materials.append(mat)
-
-            #!SECTION
+        with timed_section("Apply Material"):
+            # Assign rain material to raindrop object.
+            if raindrop_obj.data.materials:
+                # Assign to 1st material slot.
+                raindrop_obj.data.materials[0] = mat
+            else:
+                # No slots.
+                raindrop_obj.data.materials.append(mat)
+
+                #!SECTION
+
+    def apply(self, context, obj):
+        """Turns a mesh object into a rain emitter, or brings an existing one up to date."""
+        state = obj.get(STATE_PROPERTY)
+
+        # Already a rain emitter with these settings, nothing to do.
+        if state is not None and state["config"].to_dict() == RAIN_CONFIG:
+            return None
+
+        # Already a rain emitter, only update the settings that changed.
+        if state is not None:
+            previous = state["config"].to_dict()
+            update_rain(obj, state)
+            return previous
+
+        # Set up by an older version without a record, leave it alone.
+        if SYSTEM_NAMES[0] in obj.particle_systems:
+            return None
 
         # ------------------- #SECTION - Particle System ------------------ #
-        # Add a rain emmitter to every selected mesh object.
-        for obj in selected_objects:
+        with timed_section("Particle System"):
             # Set the active object to the current object.
             bpy.context.view_layer.objects.active = obj
 
             # Add a particle system to the emitter object
             rain_system = add_particle_system(obj)
 
+            rain_system.settings[OWNER_PROPERTY] = "apply_rain"
+
             # Change the render type of particles to 'OBJECT'
             rain_system.settings.render_type = 'OBJECT'
 
             # Configure the rain particle system
             rain_system.settings.instance_object = bpy.data.objects["Raindrop"]
-            rain_system.settings.particle_size = 0.01
-            rain_system.settings.size_random = 1
-            rain_system.settings.count = 10000
-            rain_system.settings.emit_from = 'VOLUME'
+            rain_system.settings.particle_size = RAIN_CONFIG["particle_size"]
+            rain_system.settings.size_random = RAIN_CONFIG["size_random"]
+            rain_system.settings.count = RAIN_CONFIG["count"]
+            rain_system.settings.emit_from = RAIN_CONFIG["emit_from"]
 
             # Set the emitter to not be visible in viewport and render
             obj.show_instancer_for_viewport = False
@@ -124,84 +212,203 @@ class ApplyRain(bpy.types.Operator):
 
             #!SECTION
 
-            # ------------------- #SECTION - Dynamic Paint ------------------ #
-            # Setup the dynamic paint modifier
-            dynamic_paint_modifier = obj.modifiers.new(
-                name="Dynamic Paint", type='DYNAMIC_PAINT')
+        # ------------------- #SECTION - Impact System ------------------ #
+        with timed_section("Impact System"):
+            # A small invisible system with the same distribution drives the brush,
+            # so the visible rain can be dense without slowing down Dynamic Paint.
+            impact_system = add_impact_system(obj, rain_system)
+
+            #!SECTION
+
+        # ------------------- #SECTION - Dynamic Paint ------------------ #
+        with timed_section("Dynamic Paint"):
+            # An object has a single dynamic paint modifier, reuse it if it is already a canvas.
+            dynamic_paint_modifier = get_dynamic_paint(obj)
+            if dynamic_paint_modifier is None:
+                # Setup the dynamic paint modifier
+                dynamic_paint_modifier = obj.modifiers.new(
+                    name="Dynamic Paint", type='DYNAMIC_PAINT')
             dynamic_paint_modifier.ui_type = 'BRUSH'
 
             # Set the brush type to 'PAINT'
-            bpy.ops.dpaint.type_toggle(type='BRUSH')
-
-            # Get the active object
-            active_obj = bpy.context.active_object
+            added_brush = dynamic_paint_modifier.brush_settings is None
+            if added_brush:
+                bpy.ops.dpaint.type_toggle(type='BRUSH')
 
             # Modify the brush settings to use the emitter particle system as the paint source
-            obj.modifiers["Dynamic Paint"].brush_settings.paint_source = "PARTICLE_SYSTEM"
-            obj.modifiers["Dynamic Paint"].brush_settings.particle_system = \
-                active_obj.particle_systems["Rain Particle System"]
-            obj.modifiers["Dynamic Paint"].brush_settings.solid_radius = 0.05
+            dynamic_paint_modifier.brush_settings.paint_source = "PARTICLE_SYSTEM"
+            dynamic_paint_modifier.brush_settings.particle_system = impact_system
+            dynamic_paint_modifier.brush_settings.solid_radius = RAIN_CONFIG["solid_radius"]
 
             #!SECTION
 
-        return {'FINISHED'}
+        # Record what was added, so it can be updated and reverted exactly.
+        obj[STATE_PROPERTY] = {
+            "config": RAIN_CONFIG,
+            "particle_system": rain_system.name,
+            "impact_system": impact_system.name,
+            "modifier": dynamic_paint_modifier.name,
+            "added_brush": added_brush,
+        }
+        return True
+
+    def revert(self, context, obj):
+        """Removes the rain emitter from a mesh object."""
+        remove_rain(obj)
+
+    def restore(self, context, obj, config):
+        """Puts the rain settings an emitter had before back."""
+        update_rain(obj, obj[STATE_PROPERTY], config)
 
 
-class RevertRain(bpy.types.Operator):
+class RevertRain(TimeSlicedOperator, bpy.types.Operator):
     bl_idname = "object.revert_rain"
     bl_label = "Revert Rain"
     bl_description = "Reverts the effects of Apply Rain operator on meshes."
     bl_options = {'REGISTER', 'UNDO'}
 
-    @staticmethod
-    def execute(self, context):
-        """Reverts the effects of Apply Rain operator on meshes."""
-        # Get all selected mesh objects from the outliner.
-        selected_objects = [
-            obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
-
-        # Add a Dynamic Canvas to every selected mesh object.
-        for obj in selected_objects:
-            # Set the active object to the current object.
-            bpy.context.view_layer.objects.active = obj
-
-            # Delete the particle system
-            bpy.ops.object.particle_system_remove()
-
-            # Remove dynamic paint from object
-            bpy.ops.object.modifier_remove(modifier="Dynamic Paint")
-
-        return {'FINISHED'}
-
-
-def add_particle_system(emitter_obj):
+    def apply(self, context, obj):
+        """Reverts the effects of Apply Rain operator on a mesh."""
+        remove_rain(obj)
+
+
+def update_rain(obj, state, config=RAIN_CONFIG):
+    """Changes only the rain settings that differ from the recorded ones."""
+    recorded = state["config"].to_dict()
+    rain_system = obj.particle_systems.get(state["particle_system"])
+    impact_system = obj.particle_systems.get(state.get("impact_system", ""))
+    dynamic_paint_modifier = obj.modifiers.get(state["modifier"])
+    has_brush = dynamic_paint_modifier is not None and dynamic_paint_modifier.brush_settings is not None
+
+    # Emitters from before the impact system was split off paint with the visible rain.
+    if impact_system is None and rain_system is not None:
+        bpy.context.view_layer.objects.active = obj
+        impact_system = add_impact_system(obj, rain_system)
+        state["impact_system"] = impact_system.name
+        if has_brush:
+            dynamic_paint_modifier.brush_settings.particle_system = impact_system
+
+    for key, value in config.items():
+        if recorded.get(key) == value:
+            continue
+        if key == "solid_radius":
+            if has_brush:
+                dynamic_paint_modifier.brush_settings.solid_radius = value
+        elif key == "impact_count":
+            if impact_system is not None:
+                impact_system.settings.count = value
+        elif rain_system is not None:
+            setattr(rain_system.settings, key, value)
+            # Keep the impacts falling like the visible rain.
+            if impact_system is not None and key in MATCHED_SETTINGS:
+                setattr(impact_system.settings, key, value)
+
+    state["config"] = config
+
+
+def remove_rain(obj):
+    """Removes exactly what Apply Rain added to an object."""
+    state = obj.get(STATE_PROPERTY)
+
+    # Set the active object to the current object.
+    bpy.context.view_layer.objects.active = obj
+
+    if state is None:
+        # Set up by an older version without a record, find the rain by name.
+        particle_systems = [obj.particle_systems[name] for name in SYSTEM_NAMES if name in obj.particle_systems]
+        if not particle_systems:
+            return
+
+        # Older versions always added a brush painting with the rain.
+        dynamic_paint_modifier = get_dynamic_paint(obj)
+        if (dynamic_paint_modifier is not None and dynamic_paint_modifier.brush_settings is not None
+                and dynamic_paint_modifier.brush_settings.particle_system in particle_systems):
+            remove_brush(obj, dynamic_paint_modifier, True)
+
+        for particle_system in particle_systems:
+            remove_particle_system(obj, particle_system)
+        return
+
+    # Delete the rain and impact particle systems
+    for name in (state["particle_system"], state.get("impact_system", "")):
+        particle_system = obj.particle_systems.get(name)
+        if particle_system is not None:
+            remove_particle_system(obj, particle_system)
+
+    # Remove the brush if it was added, and the modifier too if nothing else is left on it.
+    dynamic_paint_modifier = obj.modifiers.get(state["modifier"])
+    if dynamic_paint_modifier is not None:
+        remove_brush(obj, dynamic_paint_modifier, state.get("added_brush", True))
+
+    del obj[STATE_PROPERTY]
+
+
+def remove_particle_system(obj, particle_system):
+    """Removes a particle system along with its modifier."""
+    for modifier in obj.modifiers:
+        if modifier.type == 'PARTICLE_SYSTEM' and modifier.particle_system == particle_system:
+            obj.modifiers.remove(modifier)
+            break
+
+
+def remove_brush(obj, dynamic_paint_modifier, added_brush):
+    """Turns off a brush that was added, and removes the modifier once it is neither canvas nor brush."""
+    if added_brush and dynamic_paint_modifier.brush_settings is not None:
+        bpy.ops.dpaint.type_toggle(type='BRUSH')
+
+    # Canvas surfaces other effects added keep the modifier.
+    remove_if_empty(obj, dynamic_paint_modifier)
+
+
+def add_particle_system(emitter_obj, name="Rain Particle System"):
     """Adds a particle system to the emitter object and returns it."""
     # Add a particle system to the emitter object
     bpy.ops.object.particle_system_add()
     # Get the last added particle system
     particle_system = emitter_obj.particle_systems[-1]
-    particle_system.name = "Rain Particle System"
+    particle_system.name = name
     return particle_system
 
 
+def add_impact_system(emitter_obj, rain_system):
+    """Adds the invisible particle system that drives the Dynamic Paint brush and returns it."""
+    impact_system = add_particle_system(emitter_obj, "Rain Impact System")
+    impact_system.settings[OWNER_PROPERTY] = "apply_rain"
+
+    # Fall the same way as the visible rain, only fewer and without drawing anything.
+    for key in MATCHED_SETTINGS:
+        setattr(impact_system.settings, key, getattr(rain_system.settings, key))
+    impact_system.settings.count = RAIN_CONFIG["impact_count"]
+    impact_system.settings.render_type = 'NONE'
+    impact_system.settings.display_method = 'NONE'
+
+    # A different seed, so the impacts are not just the first of the visible drops.
+    impact_system.seed = rain_system.seed + 1
+    return impact_system
+
+
 def draw_menu(self, context):
     """Draws the menu for the Apply Rain operator."""
     self.layout.operator(ApplyRain.bl_idname, icon="MOD_FLUIDSIM")
     self.layout.operator(RevertRain.bl_idname, icon="MOD_FLUIDSIM")
 
 
+# Operators registered by this addon.
+classes = (ApplyRain, RevertRain)
+
+
 def register():
     """Registers the Apply Rain operator."""
-    bpy.utils.register_class(ApplyRain)
-    bpy.utils.register_class(RevertRain)
+    for cls in classes:
+        bpy.utils.register_class(cls)
 
     bpy.types.VIEW3D_MT_add.append(draw_menu)
 
 
 def unregister():
     """Unregisters the Apply Rain operator."""
-    bpy.utils.unregister_class(ApplyRain)
-    bpy.utils.unregister_class(RevertRain)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
     bpy.types.VIEW3D_MT_add.remove(draw_menu)
 
 
@@ -7,6 +7,14 @@ import shutil
 import datetime
 import os
 
+try:
+    from weather_suite.instrumentation import timed_operator
+except ImportError:
+    # Without the weather suite installed nothing is measured.
+    def timed_operator(execute):
+        """Leaves execute untouched."""
+        return execute
+
 bl_info = {
     "name": "Backup",
     "blender": (2, 80, 0),  # Minimum Blender version required
@@ -32,6 +40,7 @@ class Backup(bpy.types.Operator):
     filepath: bpy.props.StringProperty(subtype="FILE_PATH")
 
     @staticmethod
+    @timed_operator
     def execute(self, context):
         """Creates a copy of the .blend file, timestamps it and moves it into the selected folder."""
         # Make sure the project has been named and saved at least once.
@@ -82,15 +91,21 @@ def draw_menu(self, context):
     self.layout.operator(Backup.bl_idname)
 
 
+# Operators registered by this addon.
+classes = (Backup,)
+
+
 def register():
     """Registers the operator."""
-    bpy.utils.register_class(Backup)
+    for cls in classes:
+        bpy.utils.register_class(cls)
     bpy.types.TOPBAR_MT_file.append(draw_menu)
 
 
 def unregister():
     """Unregisters the operator."""
-    bpy.utils.unregister_class(Backup)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
     bpy.types.TOPBAR_MT_file.remove(draw_menu)
 
 
@@ -4,6 +4,34 @@ A Blender addon to apply dynamic canvas to a meshes to interact with rain and cr
 
 import bpy
 
+try:
+    from weather_suite.dynamic_paint import get_dynamic_paint, remove_surface
+    from weather_suite.modal_runner import TimeSlicedOperator
+except ImportError:
+    # Without the weather suite installed the whole selection runs at once, and
+    # Revert leaves an emptied canvas and modifier on the object.
+    def get_dynamic_paint(obj):
+        """Returns the object's dynamic paint modifier, or None."""
+        return next((modifier for modifier in obj.modifiers if modifier.type == 'DYNAMIC_PAINT'), None)
+
+    def remove_surface(obj, modifier_name, surface_name):
+        """Removes only the canvas surface, leaving the canvas and modifier in place."""
+        canvas_settings = getattr(obj.modifiers.get(modifier_name), "canvas_settings", None)
+        index = canvas_settings.canvas_surfaces.find(surface_name) if canvas_settings is not None else -1
+        if index >= 0:
+            canvas_settings.canvas_surfaces.active_index = index
+            bpy.ops.dpaint.surface_slot_remove()
+
+    class TimeSlicedOperator:
+        """Runs apply on every selected mesh in one go."""
+
+        def execute(self, context):
+            """Applies the effect to every selected mesh."""
+            for obj in [obj for obj in context.selected_objects if obj.type == 'MESH']:
+                self.apply(context, obj)
+            return {'FINISHED'}
+
+
 bl_info = {
     "name": "Apply Waves",
     "blender": (2, 80, 0),  # Minimum Blender version required
@@ -19,64 +47,150 @@ bl_info = {
     "warning": "This addon is still under development.",
 }
 
+# Settings of every wave surface. Changing them updates existing surfaces on the next Apply Waves.
+WAVES_CONFIG = {
+    "surface_type": 'WAVE',
+    "brush_radius_scale": 0.35,
+    "brush_influence_scale": 0.25089,
+    "wave_timescale": 3.0,
+    "wave_speed": 0.67,
+}
+
+# Custom property recording what Apply Waves added to an object.
+STATE_PROPERTY = "weather_waves"
 
-class ApplyWaves(bpy.types.Operator):
+
+class ApplyWaves(TimeSlicedOperator, bpy.types.Operator):
     bl_idname = "object.apply_waves"
     bl_label = "Apply Waves"
     bl_description = "Creates a dynamic canvas to produces waves/ripples."
     bl_options = {'REGISTER', 'UNDO'}
 
-    @staticmethod
-    def execute(self, context):
-        """Applies a wave dynamic canvas to all selected mesh objects."""
-        # Get all selected mesh objects from the outliner.
-        selected_objects = [
-            obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
+    def apply(self, context, obj):
+        """Applies a wave dynamic canvas to a mesh object, or brings an existing one up to date."""
+        state = obj.get(STATE_PROPERTY)
+
+        # The surface was removed by hand, forget it and start over.
+        if state is not None and get_wave_surface(obj, state) is None:
+            del obj[STATE_PROPERTY]
+            state = None
+
+        # Already has waves with these settings, nothing to do.
+        if state is not None and state["config"].to_dict() == WAVES_CONFIG:
+            return None
 
-        # Add a Dynamic Canvas to every selected mesh object.
-        for obj in selected_objects:
-            # Set the active object to the current object.
-            bpy.context.view_layer.objects.active = obj
+        # Set the active object to the current object.
+        bpy.context.view_layer.objects.active = obj
 
+        # Already has waves, only update the settings that changed.
+        if state is not None:
+            previous = state["config"].to_dict()
+            update_waves(obj, state)
+            return previous
+
+        # An object has a single dynamic paint modifier, add a surface to it if it exists.
+        dynamic_paint_modifier = get_dynamic_paint(obj)
+
+        # Set up by an older version without a record, leave it alone.
+        if get_legacy_surfaces(dynamic_paint_modifier):
+            return None
+        added_modifier = dynamic_paint_modifier is None
+        added_canvas = added_modifier or dynamic_paint_modifier.canvas_settings is None
+
+        if added_modifier:
             # Apply dynamic brush canvas to water surface
             bpy.ops.object.modifier_add(type='DYNAMIC_PAINT')
-            obj.modifiers["Dynamic Paint"].ui_type = 'CANVAS'
+            dynamic_paint_modifier = get_dynamic_paint(obj)
+
+        dynamic_paint_modifier.ui_type = 'CANVAS'
+        if added_canvas:
+            # A new canvas comes with its first surface.
             bpy.ops.dpaint.type_toggle(type='CANVAS')
+        else:
+            bpy.ops.dpaint.surface_slot_add()
+
+        # Most recent canvas surface is the wave surface.
+        surface = dynamic_paint_modifier.canvas_settings.canvas_surfaces[-1]
+
+        # Record what was added, so it can be updated and reverted exactly.
+        obj[STATE_PROPERTY] = {
+            "config": {},
+            "modifier": dynamic_paint_modifier.name,
+            "surface": surface.name,
+        }
 
-            # Set canvas settings
-            obj.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].surface_type = 'WAVE'
-            obj.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].brush_radius_scale = 0.35
-            obj.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].brush_influence_scale = 0.5
-            obj.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].wave_timescale = 3
-            obj.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Surface"].wave_speed = 0.67
-            obj.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces[
-                "Surface"].brush_influence_scale = 0.25089
+        # Set every canvas setting on the new surface.
+        update_waves(obj, obj[STATE_PROPERTY])
+        return True
 
-        return {'FINISHED'}
+    def revert(self, context, obj):
+        """Removes the wave dynamic canvas from a mesh object."""
+        remove_waves(obj)
 
+    def restore(self, context, obj, config):
+        """Puts the wave settings an object had before back."""
+        update_waves(obj, obj[STATE_PROPERTY], config)
 
-class RevertWaves(bpy.types.Operator):
+
+class RevertWaves(TimeSlicedOperator, bpy.types.Operator):
     bl_idname = "object.revert_waves"
     bl_label = "Revert Waves"
     bl_description = "Reverts the effects of Apply Waves operator on meshes."
     bl_options = {'REGISTER', 'UNDO'}
 
-    @staticmethod
-    def execute(self, context):
-        """Removes the wave dynamic canvas on all selected mesh objects."""
-        # Get all selected mesh objects from the outliner.
-        selected_objects = [
-            obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
+    def apply(self, context, obj):
+        """Removes the wave dynamic canvas from a mesh object."""
+        remove_waves(obj)
+
+
+def get_wave_surface(obj, state):
+    """Returns the canvas surface recorded in the wave state, or None if it is gone."""
+    dynamic_paint_modifier = obj.modifiers.get(state["modifier"])
+    if dynamic_paint_modifier is None or dynamic_paint_modifier.canvas_settings is None:
+        return None
+    return dynamic_paint_modifier.canvas_settings.canvas_surfaces.get(state["surface"])
+
+
+def update_waves(obj, state, config=WAVES_CONFIG):
+    """Changes only the wave surface settings that differ from the recorded ones."""
+    surface = get_wave_surface(obj, state)
+    recorded = state["config"].to_dict()
+    for key, value in config.items():
+        if recorded.get(key) != value:
+            setattr(surface, key, value)
+
+    state["config"] = config
+
 
-        # Add a Dynamic Canvas to every selected mesh object.
-        for obj in selected_objects:
-            # Set the active object to the current object.
-            bpy.context.view_layer.objects.active = obj
+def get_legacy_surfaces(dynamic_paint_modifier):
+    """Returns the names of the wave surfaces on a canvas, as older versions left them without a record."""
+    if dynamic_paint_modifier is None or dynamic_paint_modifier.canvas_settings is None:
+        return []
+    return [surface.name for surface in dynamic_paint_modifier.canvas_settings.canvas_surfaces
+            if surface.surface_type == 'WAVE']
 
-            # remove dynamic brush canvas from water surface
-            bpy.ops.object.modifier_remove(modifier="Dynamic Paint")
 
-        return {'FINISHED'}
+def remove_waves(obj):
+    """Removes exactly what Apply Waves added to an object."""
+    state = obj.get(STATE_PROPERTY)
+
+    # Set the active object to the current object.
+    bpy.context.view_layer.objects.active = obj
+
+    if state is None:
+        # Set up by an older version without a record, find its surfaces by type.
+        dynamic_paint_modifier = get_dynamic_paint(obj)
+        names = get_legacy_surfaces(dynamic_paint_modifier)
+        if names:
+            # The modifier may go with the last surface, so hold on to its name.
+            modifier_name = dynamic_paint_modifier.name
+            for name in names:
+                remove_surface(obj, modifier_name, name)
+        return
+
+    remove_surface(obj, state["modifier"], state["surface"])
+
+    del obj[STATE_PROPERTY]
 
 
 def draw_menu(self, context):
@@ -85,17 +199,21 @@ def draw_menu(self, context):
     self.layout.operator(RevertWaves.bl_idname, icon="MOD_FLUIDSIM")
 
 
+# Operators registered by this addon.
+classes = (ApplyWaves, RevertWaves)
+
+
 def register():
     """Registers the Apply Waves operator."""
-    bpy.utils.register_class(ApplyWaves)
-    bpy.utils.register_class(RevertWaves)
+    for cls in classes:
+        bpy.utils.register_class(cls)
     bpy.types.VIEW3D_MT_add.append(draw_menu)
 
 
 def unregister():
     """Unregisters the Apply Waves operator."""
-    bpy.utils.unregister_class(ApplyWaves)
-    bpy.utils.unregister_class(RevertWaves)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
     bpy.types.VIEW3D_MT_add.remove(draw_menu)
 
 
@@ -4,6 +4,37 @@ A Blender addon set up meshes to interact with rain and create wet effects.
 
 import bpy
 
+try:
+    from weather_suite.dynamic_paint import get_dynamic_paint, remove_surface
+    from weather_suite.instrumentation import timed_section
+    from weather_suite.modal_runner import TimeSlicedOperator
+except ImportError:
+    # Without the weather suite installed nothing is measured, the whole selection
+    # runs at once and Revert leaves an emptied canvas and modifier on the object.
+    from contextlib import nullcontext as timed_section
+
+    def get_dynamic_paint(obj):
+        """Returns the object's dynamic paint modifier, or None."""
+        return next((modifier for modifier in obj.modifiers if modifier.type == 'DYNAMIC_PAINT'), None)
+
+    def remove_surface(obj, modifier_name, surface_name):
+        """Removes only the canvas surface, leaving the canvas and modifier in place."""
+        canvas_settings = getattr(obj.modifiers.get(modifier_name), "canvas_settings", None)
+        index = canvas_settings.canvas_surfaces.find(surface_name) if canvas_settings is not None else -1
+        if index >= 0:
+            canvas_settings.canvas_surfaces.active_index = index
+            bpy.ops.dpaint.surface_slot_remove()
+
+    class TimeSlicedOperator:
+        """Runs apply on every selected mesh in one go."""
+
+        def execute(self, context):
+            """Applies the effect to every selected mesh."""
+            for obj in [obj for obj in context.selected_objects if obj.type == 'MESH']:
+                self.apply(context, obj)
+            return {'FINISHED'}
+
+
 bl_info = {
     "name": "Apply Wet FX",
     "blender": (2, 80, 0),  # Minimum Blender version required
@@ -19,6 +50,21 @@ bl_info = {
     "warning": "This addon is still under development.",
 }
 
+# Settings of every wet layer. Changing them updates existing layers on the next Apply Wet FX.
+WET_CONFIG = {
+    "brush_radius_scale": 0.7,
+    "brush_influence_scale": 0.9,
+    "use_drying": False,
+    "use_spread": True,
+    "spread_speed": 0.1,
+}
+
+# Custom property recording what Apply Wet FX added to an object.
+STATE_PROPERTY = "weather_wet_fx"
+
+# Custom property tagging the data this add-on creates, so the weather suite can clean it up.
+OWNER_PROPERTY = "weather_owner"
+
 # Program Logic:
 # check if any objects are selected
 # for each selected object check that it is a mesh
@@ -36,95 +82,127 @@ bl_info = {
 # connect them all up, and if there are existing textures, intercept them with the mix shaders.
 
 
-class ApplyWetFX(bpy.types.Operator):
+class ApplyWetFX(TimeSlicedOperator, bpy.types.Operator):
     bl_idname = "object.apply_wet_fx"
     bl_label = "Apply Wet FX"
     bl_description = "Sets up meshes to interact with rain and create wet effects."
     bl_options = {'REGISTER', 'UNDO'}
 
-    # The origin
-    original_materials = {}
+    def apply(self, context, obj):
+        """Applies a wet FX to a mesh object, or brings an existing one up to date."""
+        state = obj.get(STATE_PROPERTY)
+
+        # The wet layer was removed by hand, take the rest off too and start over.
+        if state is not None and get_wet_layer(obj, state) is None:
+            remove_wet_fx(obj)
+            state = None
 
-    @staticmethod
-    def execute(self, context):
-        """Applies a wet FX to all selected mesh objects."""
+        # Already wet with these settings, nothing to do.
+        if state is not None and state["config"].to_dict() == WET_CONFIG:
+            return None
 
         # ---------------------------------------------------------------------------- #
         #                           #SECTION - Object Setup                            #
         # ---------------------------------------------------------------------------- #
-        # Get all selected mesh objects from the outliner.
-        selected_objects = [
-            obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
+        # Set the active object to the current object.
+        bpy.context.view_layer.objects.active = obj
 
-        # Add a Dynamic Canvas to every selected mesh object.
-        for obj in selected_objects:
+        if state is not None:
+            # Only the wet layer settings can change, the material is left as it is.
+            previous = state["config"].to_dict()
+            update_wet_fx(obj, state)
+            return previous
 
-            # Set the active object to the current object.
-            bpy.context.view_layer.objects.active = obj
+        dynamic_paint_modifier = get_dynamic_paint(obj)
+
+        # Set up by an older version without a record, leave it alone.
+        if (dynamic_paint_modifier is not None and dynamic_paint_modifier.canvas_settings is not None
+                and dynamic_paint_modifier.canvas_settings.canvas_surfaces.get("Wet Layer") is not None):
+            return None
+
+        # ---------------------------- #SECTION - Material ---------------------------- #
+        with timed_section("Material"):
+            original_material = obj.active_material
+            added_slot = len(obj.material_slots) == 0
 
-            # ---------------------------- #SECTION - Material ---------------------------- #
             # Check for existing material, if none, create one.
-            if obj.active_material is None:
+            if original_material is None:
                 # Create material.
                 mat = bpy.data.materials.new(name="Wet")
                 obj.active_material = mat
 
             # If there is an existing material, duplicate it.
             else:
-                self.original_materials[obj.name] = obj.active_material
-
-                mat = obj.active_material.copy()
+                mat = original_material.copy()
                 obj.active_material = mat
 
-            #!SECTION
+            mat[OWNER_PROPERTY] = "apply_wet_fx"
 
-            # ---------------------------- #SECTION - Dynamic Canvas ---------------------------- #
-            # Check for existing dynamic canvas.
-            if obj.modifiers.get("Dynamic Paint") is not None:
-                # Check if there is a canvas surface with name "Wet Layer"
-                if obj.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces.get("Wet Layer") is None:
-                    # If it doesn't exist, add a new canvas surface.
-                    bpy.ops.dpaint.surface_slot_add()
+            #!SECTION
 
-                else:
-                    # If it exists, return finished.
-                    return {'FINISHED'}
+        # ---------------------------- #SECTION - Dynamic Canvas ---------------------------- #
+        with timed_section("Dynamic Canvas"):
+            added_modifier = dynamic_paint_modifier is None
+            added_canvas = added_modifier or dynamic_paint_modifier.canvas_settings is None
 
-            else:
+            if added_modifier:
                 # Apply dynamic canvas.
                 bpy.ops.object.modifier_add(type='DYNAMIC_PAINT')
-                bpy.context.object.modifiers["Dynamic Paint"].ui_type = 'CANVAS'
+                dynamic_paint_modifier = get_dynamic_paint(obj)
+
+            dynamic_paint_modifier.ui_type = 'CANVAS'
+            if added_canvas:
+                # A new canvas comes with its first surface.
                 bpy.ops.dpaint.type_toggle(type='CANVAS')
+            else:
+                # Add a new canvas surface next to the existing ones.
+                bpy.ops.dpaint.surface_slot_add()
 
             # Most recent canvas surface is the one we want to modify.
-            bpy.context.object.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces[-1].name = "Wet Layer"
-            wet_layer = bpy.context.object.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces["Wet Layer"]
+            wet_layer = dynamic_paint_modifier.canvas_settings.canvas_surfaces[-1]
+            wet_layer.name = "Wet Layer"
             wet_layer.surface_type = 'PAINT'
 
-            wet_layer.brush_radius_scale = 0.7
-            wet_layer.brush_influence_scale = 0.9
-
-            wet_layer.use_drying = False
-
-            wet_layer.use_spread = True
-            wet_layer.spread_speed = 0.1
+            for key, value in WET_CONFIG.items():
+                setattr(wet_layer, key, value)
 
             bpy.ops.dpaint.output_toggle(output='B')
 
             #!SECTION
 
-            # ---------------------------- #SECTION - Collision ---------------------------- #
+        # ---------------------------- #SECTION - Collision ---------------------------- #
+        with timed_section("Collision"):
+            collision_modifier = next((modifier for modifier in obj.modifiers if modifier.type == 'COLLISION'), None)
+            added_collision = collision_modifier is None
 
             # Add a collision modifier and set it to kill particles
-            bpy.ops.object.modifier_add(type='COLLISION')
+            if added_collision:
+                bpy.ops.object.modifier_add(type='COLLISION')
+                collision_modifier = obj.modifiers[-1]
+            particle_kill = obj.collision.use_particle_kill
             obj.collision.use_particle_kill = True
 
             #!SECTION
-            #!SECTION
+        #!SECTION
+
+        # Record what was added, so it can be updated and reverted exactly.
+        obj[STATE_PROPERTY] = {
+            "config": WET_CONFIG,
+            "material": mat.name,
+            "original_material": original_material.name if original_material is not None else "",
+            "slot": obj.active_material_index,
+            "added_slot": added_slot,
+            "modifier": dynamic_paint_modifier.name,
+            "surface": wet_layer.name,
+            "collision": collision_modifier.name,
+            "added_collision": added_collision,
+            "particle_kill": particle_kill,
+        }
 
-            # ---------------------------------------------------------------------------- #
-            #                          #SECTION - Material Nodes                           #
-            # ---------------------------------------------------------------------------- #
+        # ---------------------------------------------------------------------------- #
+        #                          #SECTION - Material Nodes                           #
+        # ---------------------------------------------------------------------------- #
+        with timed_section("Material Nodes"):
             # Start setting up the node network.
             bpy.context.object.active_material.use_nodes = True
 
@@ -141,218 +219,258 @@ class ApplyWetFX(bpy.types.Operator):
             wetmap_node.location = (-1600, 0)
 
             # --------------------------- #SECTION - Base Color --------------------------- #
+            with timed_section("Base Color"):
 
-            # Create a color mix node
-            base_color_mix_node = mat.node_tree.nodes.new(
-                type="ShaderNodeMixRGB")
-            base_color_mix_node.blend_type = 'DARKEN'
+                # Create a color mix node
+                base_color_mix_node = mat.node_tree.nodes.new(
+                    type="ShaderNodeMixRGB")
+                base_color_mix_node.blend_type = 'DARKEN'
 
-            # Add the attribute node to the mix node factor
-            mat.node_tree.links.new(
-                base_color_mix_node.inputs[0], wetmap_node.outputs[0])
+                # Add the attribute node to the mix node factor
+                mat.node_tree.links.new(
+                    base_color_mix_node.inputs[0], wetmap_node.outputs[0])
 
-            # Set the secondary mix colour to black
-            base_color_mix_node.inputs[2].default_value = (0, 0, 0.02, 1)
+                # Set the secondary mix colour to black
+                base_color_mix_node.inputs[2].default_value = (0, 0, 0.02, 1)
 
-            # Check if there is anything connected to the base color
-            if mat.node_tree.nodes.get("Principled BSDF").inputs[0].links:
-                # If there is, connect it to the mix node
-                mat.node_tree.links.new(
-                    base_color_mix_node.inputs[1], mat.node_tree.nodes.get("Principled BSDF").inputs[0].links[0].from_socket)
+                # Check if there is anything connected to the base color
+                if mat.node_tree.nodes.get("Principled BSDF").inputs[0].links:
+                    # If there is, connect it to the mix node
+                    mat.node_tree.links.new(
+                        base_color_mix_node.inputs[1], mat.node_tree.nodes.get("Principled BSDF").inputs[0].links[0].from_socket)
 
-                # Disconnect the existing link
-                mat.node_tree.links.remove(
-                    mat.node_tree.nodes.get("Principled BSDF").inputs[0].links[0])
+                    # Disconnect the existing link
+                    mat.node_tree.links.remove(
+                        mat.node_tree.nodes.get("Principled BSDF").inputs[0].links[0])
 
-            # Link the mix node output to the base color input
-            mat.node_tree.links.new(
-                mat.node_tree.nodes.get("Principled BSDF").inputs[0], base_color_mix_node.outputs[0])
+                # Link the mix node output to the base color input
+                mat.node_tree.links.new(
+                    mat.node_tree.nodes.get("Principled BSDF").inputs[0], base_color_mix_node.outputs[0])
 
-            # Move the node into the frame
-            base_color_mix_node.parent = wet_fx_frame
+                # Move the node into the frame
+                base_color_mix_node.parent = wet_fx_frame
 
-            base_color_mix_node.location = (-1200, 0)
+                base_color_mix_node.location = (-1200, 0)
 
-            #!SECTION
+                #!SECTION
 
             # --------------------------- #SECTION - Specular --------------------------- #
+            with timed_section("Specular"):
 
-            # Create a color mix node
-            specular_mix_node = mat.node_tree.nodes.new(
-                type="ShaderNodeMixRGB")
-            specular_mix_node.blend_type = 'MIX'
+                # Create a color mix node
+                specular_mix_node = mat.node_tree.nodes.new(
+                    type="ShaderNodeMixRGB")
+                specular_mix_node.blend_type = 'MIX'
 
-            # run the attribute node through the primary input
-            mat.node_tree.links.new(
-                specular_mix_node.inputs[1], wetmap_node.outputs[0])
+                # run the attribute node through the primary input
+                mat.node_tree.links.new(
+                    specular_mix_node.inputs[1], wetmap_node.outputs[0])
 
-            # Set the secondary mix colour to white
-            specular_mix_node.inputs[2].default_value = (1, 1, 1, 1)
+                # Set the secondary mix colour to white
+                specular_mix_node.inputs[2].default_value = (1, 1, 1, 1)
 
-            # Set the factor to 0.5
-            specular_mix_node.inputs[0].default_value = 0.5
+                # Set the factor to 0.5
+                specular_mix_node.inputs[0].default_value = 0.5
 
-            # Check if there is anything connected to the specular
-            if mat.node_tree.nodes.get("Principled BSDF").inputs[7].links:
-                # If there is, connect it to the mix node
-                mat.node_tree.links.new(
-                    specular_mix_node.inputs[0], mat.node_tree.nodes.get("Principled BSDF").inputs[7].links[0].from_socket)
+                # Check if there is anything connected to the specular
+                if mat.node_tree.nodes.get("Principled BSDF").inputs[7].links:
+                    # If there is, connect it to the mix node
+                    mat.node_tree.links.new(
+                        specular_mix_node.inputs[0], mat.node_tree.nodes.get("Principled BSDF").inputs[7].links[0].from_socket)
 
-                # Disconnect the existing link
-                mat.node_tree.links.remove(
-                    mat.node_tree.nodes.get("Principled BSDF").inputs[7].links[0])
+                    # Disconnect the existing link
+                    mat.node_tree.links.remove(
+                        mat.node_tree.nodes.get("Principled BSDF").inputs[7].links[0])
 
-            # Link the mix node output to the specular input
-            mat.node_tree.links.new(
-                mat.node_tree.nodes.get("Principled BSDF").inputs[7], specular_mix_node.outputs[0])
+                # Link the mix node output to the specular input
+                mat.node_tree.links.new(
+                    mat.node_tree.nodes.get("Principled BSDF").inputs[7], specular_mix_node.outputs[0])
 
-            # Move the node into the frame
-            specular_mix_node.parent = wet_fx_frame
+                # Move the node into the frame
+                specular_mix_node.parent = wet_fx_frame
 
-            specular_mix_node.location = (-1200, -200)
+                specular_mix_node.location = (-1200, -200)
 
-            #!SECTION
+                #!SECTION
 
             # --------------------------- #SECTION - Roughness --------------------------- #
+            with timed_section("Roughness"):
 
-            # Create a color mix node
-            roughness_mix_node = mat.node_tree.nodes.new(
-                type="ShaderNodeMixRGB")
-            roughness_mix_node.blend_type = 'MIX'
+                # Create a color mix node
+                roughness_mix_node = mat.node_tree.nodes.new(
+                    type="ShaderNodeMixRGB")
+                roughness_mix_node.blend_type = 'MIX'
 
-            # Set the secondary mix colour to grey, value 0.2
-            roughness_mix_node.inputs[2].default_value = (0.2, 0.2, 0.2, 1)
+                # Set the secondary mix colour to grey, value 0.2
+                roughness_mix_node.inputs[2].default_value = (0.2, 0.2, 0.2, 1)
 
-            # run the attribute node through the factor
-            mat.node_tree.links.new(
-                roughness_mix_node.inputs[0], wetmap_node.outputs[0])
-
-            # Check if there is anything connected to the roughness
-            if mat.node_tree.nodes.get("Principled BSDF").inputs[9].links:
-                # If there is, connect it to the mix node
+                # run the attribute node through the factor
                 mat.node_tree.links.new(
-                    roughness_mix_node.inputs[1], mat.node_tree.nodes.get("Principled BSDF").inputs[9].links[0].from_socket)
+                    roughness_mix_node.inputs[0], wetmap_node.outputs[0])
 
-                # Disconnect the existing link
-                mat.node_tree.links.remove(
-                    mat.node_tree.nodes.get("Principled BSDF").inputs[9].links[0])
+                # Check if there is anything connected to the roughness
+                if mat.node_tree.nodes.get("Principled BSDF").inputs[9].links:
+                    # If there is, connect it to the mix node
+                    mat.node_tree.links.new(
+                        roughness_mix_node.inputs[1], mat.node_tree.nodes.get("Principled BSDF").inputs[9].links[0].from_socket)
 
-            # Link the mix node output to the roughness input
-            mat.node_tree.links.new(
-                mat.node_tree.nodes.get("Principled BSDF").inputs[9], roughness_mix_node.outputs[0])
+                    # Disconnect the existing link
+                    mat.node_tree.links.remove(
+                        mat.node_tree.nodes.get("Principled BSDF").inputs[9].links[0])
 
-            # Move the node into the frame
-            roughness_mix_node.parent = wet_fx_frame
+                # Link the mix node output to the roughness input
+                mat.node_tree.links.new(
+                    mat.node_tree.nodes.get("Principled BSDF").inputs[9], roughness_mix_node.outputs[0])
 
-            roughness_mix_node.location = (-1200, -400)
+                # Move the node into the frame
+                roughness_mix_node.parent = wet_fx_frame
 
-            #!SECTION
+                roughness_mix_node.location = (-1200, -400)
+
+                #!SECTION
 
             # --------------------------- #SECTION - Normals --------------------------- #
+            with timed_section("Normals"):
 
-            # Create a color mix node
-            normal_mix_node = mat.node_tree.nodes.new(
-                type="ShaderNodeMixRGB")
-            normal_mix_node.blend_type = 'MIX'
+                # Create a color mix node
+                normal_mix_node = mat.node_tree.nodes.new(
+                    type="ShaderNodeMixRGB")
+                normal_mix_node.blend_type = 'MIX'
 
-            # run the attribute node through the factor
-            mat.node_tree.links.new(
-                normal_mix_node.inputs[0], wetmap_node.outputs[0])
+                # run the attribute node through the factor
+                mat.node_tree.links.new(
+                    normal_mix_node.inputs[0], wetmap_node.outputs[0])
 
-            # Set the secondary mix colour to grey, value 0.25
-            normal_mix_node.inputs[2].default_value = (0.25, 0.25, 0.25, 1)
+                # Set the secondary mix colour to grey, value 0.25
+                normal_mix_node.inputs[2].default_value = (0.25, 0.25, 0.25, 1)
 
-            # Check if there is anything connected to the normals
-            if mat.node_tree.nodes.get("Principled BSDF").inputs[22].links:
-                # If there is, connect it to the mix node
-                mat.node_tree.links.new(
-                    normal_mix_node.inputs[1], mat.node_tree.nodes.get("Principled BSDF").inputs[22].links[0].from_socket)
+                # Check if there is anything connected to the normals
+                if mat.node_tree.nodes.get("Principled BSDF").inputs[22].links:
+                    # If there is, connect it to the mix node
+                    mat.node_tree.links.new(
+                        normal_mix_node.inputs[1], mat.node_tree.nodes.get("Principled BSDF").inputs[22].links[0].from_socket)
 
-                # Disconnect the existing link
-                mat.node_tree.links.remove(
-                    mat.node_tree.nodes.get("Principled BSDF").inputs[22].links[0])
+                    # Disconnect the existing link
+                    mat.node_tree.links.remove(
+                        mat.node_tree.nodes.get("Principled BSDF").inputs[22].links[0])
 
-            # Link the mix node output to the normals input
-            mat.node_tree.links.new(
-                mat.node_tree.nodes.get("Principled BSDF").inputs[22], normal_mix_node.outputs[0])
+                # Link the mix node output to the normals input
+                mat.node_tree.links.new(
+                    mat.node_tree.nodes.get("Principled BSDF").inputs[22], normal_mix_node.outputs[0])
 
-            # Move the node into the frame
-            normal_mix_node.parent = wet_fx_frame
+                # Move the node into the frame
+                normal_mix_node.parent = wet_fx_frame
 
-            normal_mix_node.location = (-1200, -600)
+                normal_mix_node.location = (-1200, -600)
 
-            #!SECTION
+                #!SECTION
 
             #!SECTION
 
-        return {'FINISHED'}
+        return True
+
+    def revert(self, context, obj):
+        """Reverts the wet FX on a mesh object."""
+        remove_wet_fx(obj)
+
+    def restore(self, context, obj, config):
+        """Puts the wet layer settings an object had before back."""
+        update_wet_fx(obj, obj[STATE_PROPERTY], config)
 
 
-class RevertWetFX(bpy.types.Operator):
+class RevertWetFX(TimeSlicedOperator, bpy.types.Operator):
     bl_idname = "object.revert_wet_fx"
     bl_label = "Revert Wet FX"
     bl_description = "Reverts the effects of the Apply Wet FX operator."
     bl_options = {'REGISTER', 'UNDO'}
 
-    def execute(self, context):
-        """Reverts the effects of the Apply Wet FX operator."""
-        # Get all selected mesh objects from the outliner.
-        selected_objects = [
-            obj for obj in bpy.context.selected_objects if obj.type == 'MESH']
+    def apply(self, context, obj):
+        """Reverts the effects of the Apply Wet FX operator on a mesh object."""
+        remove_wet_fx(obj)
 
-        # For each object in the selection, revert the effects of the operator
-        for obj in selected_objects:
-            # ------------------------- #SECTION - Revert material ------------------------ #
 
-            # If the mesh has a material
-            if obj.active_material is not None:
-                # Delete the wet material
-                bpy.data.materials.remove(obj.active_material)
+def get_wet_layer(obj, state):
+    """Returns the canvas surface recorded in the wet FX state, or None if it is gone."""
+    dynamic_paint_modifier = obj.modifiers.get(state["modifier"])
+    if dynamic_paint_modifier is None or dynamic_paint_modifier.canvas_settings is None:
+        return None
+    return dynamic_paint_modifier.canvas_settings.canvas_surfaces.get(state["surface"])
 
-                # If the original material exists
-                if obj.name in ApplyWetFX.original_materials:
 
-                    # Restore the original material
-                    obj.data.materials[0] = ApplyWetFX.original_materials[obj.name]
+def update_wet_fx(obj, state, config=WET_CONFIG):
+    """Changes only the wet layer settings that differ from the recorded ones."""
+    wet_layer = get_wet_layer(obj, state)
+    recorded = state["config"].to_dict()
+    for key, value in config.items():
+        if recorded.get(key) != value:
+            setattr(wet_layer, key, value)
 
-                    # Remove the original material from the list
-                    ApplyWetFX.original_materials.pop(obj.name)
+    state["config"] = config
 
-                    # Set the original material to the active material
-                    obj.active_material = obj.data.materials[0]
 
-            #!SECTION
+def remove_wet_fx(obj):
+    """Removes exactly what Apply Wet FX added to an object."""
+    state = obj.get(STATE_PROPERTY)
+    if state is None:
+        return
 
-            # -------------------------- #SECTION - Remove wetmap ------------------------- #
-            # Check if there is a wetmap
-            if obj.data.vertex_colors.get("dp_wetmap") is not None:
-                # If it exists, remove it.
-                bpy.ops.dpaint.output_toggle(output='B')
+    # Set the active object to the current object.
+    bpy.context.view_layer.objects.active = obj
 
-            #!SECTION
+    # ------------------------- #SECTION - Revert material ------------------------ #
+    with timed_section("Revert material"):
+        wet_material = bpy.data.materials.get(state["material"])
+        original_material = bpy.data.materials.get(state["original_material"]) \
+            if state["original_material"] else None
 
-            # ------------------------- #SECTION - Revert canvas ------------------------ #
-            # Check if there is a dynamic canvas
-            if obj.modifiers.get("Dynamic Paint") is not None:
-                # Check if there is a canvas surface with name "Wet Layer"
-                if obj.modifiers["Dynamic Paint"].canvas_settings.canvas_surfaces.get("Wet Layer") is not None:
-                    # If it exists, delete it.
-                    bpy.ops.dpaint.surface_slot_remove()
+        if state["slot"] < len(obj.material_slots):
+            if state["added_slot"]:
+                # The object had no material slot, so remove the one added.
+                obj.data.materials.pop(index=state["slot"])
+            else:
+                # Restore the original material
+                obj.material_slots[state["slot"]].material = original_material
 
-                # Delete the dynamic canvas
-                bpy.ops.object.modifier_remove(modifier="Dynamic Paint")
+        # Delete the wet material, unless something else uses it.
+        if wet_material is not None and wet_material.users == 0:
+            bpy.data.materials.remove(wet_material)
 
-            #!SECTION
+        #!SECTION
 
-            # ------------------------ #SECTION - Remove collision ------------------------ #
-            # Check if there is a collision modifier
-            if obj.modifiers.get("Collision") is not None:
-                # If it exists, delete it.
-                bpy.ops.object.modifier_remove(modifier="Collision")
+    # -------------------------- #SECTION - Remove wetmap ------------------------- #
+    with timed_section("Remove wetmap"):
+        wet_layer = get_wet_layer(obj, state)
 
-            #!SECTION
+        # Check if there is a wetmap
+        if wet_layer is not None and obj.data.vertex_colors.get("dp_wetmap") is not None:
+            # The output toggle works on the active surface.
+            surfaces = obj.modifiers[state["modifier"]].canvas_settings.canvas_surfaces
+            surfaces.active_index = surfaces.find(state["surface"])
+            bpy.ops.dpaint.output_toggle(output='B')
+
+        #!SECTION
 
-        return {'FINISHED'}
+    # ------------------------- #SECTION - Revert canvas ------------------------ #
+    with timed_section("Revert canvas"):
+        # Surfaces and brushes other effects added keep the canvas and modifier.
+        remove_surface(obj, state["modifier"], state["surface"])
+
+        #!SECTION
+
+    # ------------------------ #SECTION - Remove collision ------------------------ #
+    with timed_section("Remove collision"):
+        collision_modifier = obj.modifiers.get(state["collision"])
+        if collision_modifier is not None:
+            if state["added_collision"]:
+                # Delete the collision modifier added.
+                obj.modifiers.remove(collision_modifier)
+            else:
+                # Leave the existing collision as it was.
+                obj.collision.use_particle_kill = state["particle_kill"]
+
+        #!SECTION
+
+    del obj[STATE_PROPERTY]
 
 
 def draw_menu(self, context):
@@ -361,17 +479,21 @@ def draw_menu(self, context):
     self.layout.operator(RevertWetFX.bl_idname, icon="MOD_FLUIDSIM")
 
 
+# Operators registered by this addon.
+classes = (ApplyWetFX, RevertWetFX)
+
+
 def register():
     """Registers the Apply Wet FX operator."""
-    bpy.utils.register_class(ApplyWetFX)
-    bpy.utils.register_class(RevertWetFX)
+    for cls in classes:
+        bpy.utils.register_class(cls)
     bpy.types.VIEW3D_MT_add.append(draw_menu)
 
 
 def unregister():
     """Unregisters the Apply Wet FX operator."""
-    bpy.utils.unregister_class(ApplyWetFX)
-    bpy.utils.unregister_class(RevertWetFX)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
     bpy.types.VIEW3D_MT_add.remove(draw_menu)
 
 
@@ -0,0 +1,396 @@
+"""
+A Blender addon that bundles the weather add-ons and registers them lazily.
+
+The one exception is loadup, which is loaded at every startup, since its
+workspace setup runs on every file load and its cache trimming once per
+session.
+"""
+
+import importlib
+import importlib.util
+import os
+import sys
+
+import bpy
+from bpy.app.handlers import persistent
+
+from . import assets, cleanup, instrumentation, viewport
+from .profiler import StartupProfiler
+
+bl_info = {
+    "name": "Weather Suite",
+    "blender": (2, 80, 0),  # Minimum Blender version required
+    "category": "Object",
+    "author": "Rhylei Tremlett",
+    "description": "Loads the weather add-ons on first use and profiles their startup cost.",
+    "version": (0, 0, 1),
+    "location": "View3D > Add, File",
+    "doc_url": "https://github.com/KyrVorga/CGI605-Project",
+    "tracker_url": "https://github.com/KyrVorga/CGI605-Project/issues",
+    "support": "COMMUNITY",
+    "wiki_url": "https://github.com/KyrVorga/CGI605-Project/wiki",
+    "warning": "This addon is still under development.",
+}
+
+# Add-on modules in the suite and the repository folder each one lives in.
+ADDONS = {
+    "loadup": "addon-1",
+    "apply_rain": "addon-2",
+    "backup": "addon-3",
+    "apply_waves": "addon-4",
+    "apply_wet_fx": "addon-4",
+    "generate_clouds": "addon-5",
+}
+
+# Menu entries drawn before their add-on is loaded: (menu, add-on, operator, label, icon).
+MENU_ENTRIES = (
+    ("VIEW3D_MT_add", "apply_rain", "object.apply_rain", "Apply Rain", "MOD_FLUIDSIM"),
+    ("VIEW3D_MT_add", "apply_rain", "object.revert_rain", "Revert Rain", "MOD_FLUIDSIM"),
+    ("VIEW3D_MT_add", "apply_waves", "object.apply_waves", "Apply Waves", "MOD_FLUIDSIM"),
+    ("VIEW3D_MT_add", "apply_waves", "object.revert_waves", "Revert Waves", "MOD_FLUIDSIM"),
+    ("VIEW3D_MT_add", "apply_wet_fx", "object.apply_wet_fx", "Apply Wet FX", "MOD_FLUIDSIM"),
+    ("VIEW3D_MT_add", "apply_wet_fx", "object.revert_wet_fx", "Revert Wet FX", "MOD_FLUIDSIM"),
+    ("VIEW3D_MT_add", "generate_clouds", "object.generate_cloud", "Generate Cloud", "MOD_FLUIDSIM"),
+    ("TOPBAR_MT_file", "backup", "object.backup", "Backup", "NONE"),
+    ("VIEW3D_MT_add", "impacts", "weather_suite.bake_rain_impacts", "Bake Rain Impacts", "MOD_FLUIDSIM"),
+    ("VIEW3D_MT_add", "surface_cache", "weather_suite.bake_surface_caches", "Bake Surface Caches", "MOD_FLUIDSIM"),
+    ("VIEW3D_MT_add", "surface_cache", "weather_suite.release_surface_caches", "Release Surface Caches",
+     "MOD_FLUIDSIM"),
+    ("VIEW3D_MT_add", "rain_density", "weather_suite.follow_clouds", "Rain Under Clouds", "MOD_FLUIDSIM"),
+    ("VIEW3D_MT_add", "rain_density", "weather_suite.stop_following_clouds", "Rain Everywhere", "MOD_FLUIDSIM"),
+    ("VIEW3D_MT_view", "freeze", "weather_suite.freeze_static_weather", "Freeze Static Clouds", "NONE"),
+    ("VIEW3D_MT_view", "frame_profiler", "weather_suite.toggle_frame_profiler", "Start Weather Frame Profiler",
+     "NONE"),
+)
+
+# Suite modules registered at startup, light enough to need no deferring.
+EAGER_MODULES = (instrumentation, assets, viewport, cleanup)
+
+# Suite modules registered on first use, with the object property that makes a file need them at load, if any.
+FEATURES = {
+    "impacts": None,
+    "surface_cache": "weather_surface_cache",
+    "freeze": "weather_frozen",
+    "rain_density": "weather_rain_density",
+    "frame_profiler": None,
+}
+
+# Profiler for this Blender session.
+profiler = StartupProfiler()
+
+# Add-on modules that have been imported and registered, by name.
+loaded_addons = {}
+
+# Feature modules that have been imported and registered, by name.
+loaded_features = {}
+
+# Startup add-ons that could not be found, reported once.
+missing_addons = set()
+
+# Operator classes registered by the suite, unregistered again in reverse.
+registered_classes = []
+
+# Stores hotkeys.
+addon_keymaps = []
+
+
+def find_addon_module(name):
+    """Imports an add-on module, either installed on its own or from the repository."""
+    if name in sys.modules:
+        return sys.modules[name]
+
+    # Installed as a standalone add-on.
+    if importlib.util.find_spec(name) is not None:
+        return importlib.import_module(name)
+
+    # Running from a checkout, where the suite sits next to the other add-on folders.
+    repo_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    path = os.path.join(repo_dir, ADDONS[name], name + ".py")
+    if not os.path.isfile(path):
+        raise ImportError("The {0} add-on is not installed. Install {1}/{0}.py, or run the suite "
+                          "from a repository checkout.".format(name, ADDONS[name]))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def is_operator_registered(idname):
+    """Checks if an operator, e.g. "object.apply_rain", is already registered."""
+    category, name = idname.split(".")
+    return hasattr(bpy.types, category.upper() + "_OT_" + name)
+
+
+def load_addon(name):
+    """Imports and registers an add-on's operators the first time it is needed."""
+    if name in loaded_addons:
+        return loaded_addons[name]
+
+    with profiler.measure(name, "import"):
+        module = find_addon_module(name)
+
+    # Only the operators are registered, the suite draws the menus itself.
+    with profiler.measure(name, "register"):
+        for cls in module.classes:
+            # The add-on may also be enabled on its own.
+            if is_operator_registered(cls.bl_idname):
+                continue
+            bpy.utils.register_class(cls)
+            registered_classes.append(cls)
+
+    loaded_addons[name] = module
+    write_report()
+    return module
+
+
+def load_startup_addon(name):
+    """Loads an add-on the suite runs at startup, returning None if it is not installed."""
+    try:
+        return load_addon(name)
+    except ImportError as error:
+        # Handlers cannot report, so tell the console once and carry on without it.
+        if name not in missing_addons:
+            missing_addons.add(name)
+            print(error)
+        return None
+
+
+def load_feature(name):
+    """Imports and registers a feature module of the suite the first time it is needed."""
+    if name in loaded_features:
+        return loaded_features[name]
+
+    with profiler.measure(name, "import"):
+        module = importlib.import_module("." + name, __name__)
+
+    # Features draw their own menus once registered.
+    with profiler.measure(name, "register"):
+        module.register()
+
+    loaded_features[name] = module
+    write_report()
+    return module
+
+
+def load_module(name):
+    """Loads an add-on or a feature module by name."""
+    if name in FEATURES:
+        return load_feature(name)
+    return load_addon(name)
+
+
+def load_file_features():
+    """Loads the features whose data is in the open file, and replays the current frame for them."""
+    for name, data_property in FEATURES.items():
+        if data_property is None or name in loaded_features:
+            continue
+        if not any(data_property in obj.keys() for obj in bpy.data.objects):
+            continue
+
+        module = load_feature(name)
+        # The frame was set before the feature's handlers existed.
+        if hasattr(module, "on_frame_change"):
+            module.on_frame_change(bpy.context.scene)
+
+
+def write_report():
+    """Writes the startup report, never letting a failure break the add-ons."""
+    # Batch workers run side by side and would race on the same report file.
+    if os.environ.get("WEATHER_SUITE_REPORT", "") == "0":
+        return
+
+    try:
+        profiler.write_report()
+    except OSError as error:
+        print("Could not write the weather suite startup report: {0}".format(error))
+
+
+class WeatherSuitePreferences(bpy.types.AddonPreferences):
+    bl_idname = __name__
+
+    use_library: bpy.props.BoolProperty(
+        name="Link Weather Assets",
+        description="Link the raindrop, rain material and cloud texture from the asset library instead of creating them in every file",
+        default=True)
+    library_path: bpy.props.StringProperty(
+        name="Asset Library",
+        description="Weather asset .blend, by default weather_assets.blend in the Blender config directory",
+        subtype="FILE_PATH")
+
+    def draw(self, context):
+        """Draws the preferences."""
+        self.layout.prop(self, "use_library")
+        self.layout.prop(self, "library_path")
+
+
+class LazyCall(bpy.types.Operator):
+    bl_idname = "weather_suite.lazy_call"
+    bl_label = "Weather Suite Operator"
+    bl_description = "Loads the add-on that owns an operator and runs it."
+    bl_options = {'REGISTER'}
+
+    addon: bpy.props.StringProperty()
+    target: bpy.props.StringProperty()
+
+    @classmethod
+    def description(cls, context, properties):
+        """Shows the description of the operator that will be run."""
+        return "Runs {0}, loading its add-on on first use.".format(properties.target)
+
+    def call(self, context, execution_context):
+        """Loads the owning add-on, then runs the target operator."""
+        try:
+            load_module(self.addon)
+        except ImportError as error:
+            self.report({'ERROR'}, str(error))
+            return {'CANCELLED'}
+
+        category, name = self.target.split(".")
+        operator = getattr(getattr(bpy.ops, category), name)
+
+        try:
+            result = operator(execution_context)
+        except RuntimeError as error:
+            # Most likely the target's poll failed.
+            self.report({'WARNING'}, str(error))
+            return {'CANCELLED'}
+
+        # The target owns its own undo step and modal handling.
+        if result & {'FINISHED', 'RUNNING_MODAL'}:
+            return {'FINISHED'}
+        return {'CANCELLED'}
+
+    def execute(self, context):
+        """Runs the target operator without user interaction."""
+        return self.call(context, 'EXEC_DEFAULT')
+
+    def invoke(self, context, event):
+        """Runs the target operator as if it was picked from its own menu."""
+        return self.call(context, 'INVOKE_DEFAULT')
+
+
+def draw_entries(layout, menu):
+    """Draws the lazy menu entries that belong in a menu."""
+    for entry_menu, addon, target, label, icon in MENU_ENTRIES:
+        # A loaded feature draws its own entries.
+        if entry_menu != menu or addon in loaded_features:
+            continue
+        props = layout.operator(LazyCall.bl_idname, text=label, icon=icon)
+        props.addon = addon
+        props.target = target
+
+
+def draw_add_menu(self, context):
+    """Draws the weather operators in the Add menu."""
+    draw_entries(self.layout, "VIEW3D_MT_add")
+
+
+def draw_file_menu(self, context):
+    """Draws the backup operator in the File menu."""
+    draw_entries(self.layout, "TOPBAR_MT_file")
+
+
+def draw_view_menu(self, context):
+    """Draws the freeze and profiler operators in the View menu until their feature is loaded."""
+    draw_entries(self.layout, "VIEW3D_MT_view")
+
+
+@persistent
+def on_load_post(dummy):
+    """Runs the loadup workspace setup, timing it as part of the load, and loads the features the file needs."""
+    loadup = load_startup_addon("loadup")
+    if loadup is not None:
+        with profiler.measure("loadup", "load_post"):
+            loadup.on_start(dummy)
+
+    load_file_features()
+
+    write_report()
+
+
+def trim_cache():
+    """Trims the Blender cache once Blender has finished starting up."""
+    loadup = load_startup_addon("loadup")
+    if loadup is not None:
+        loadup.trim_blender_cache()
+
+    # Run only once.
+    return None
+
+
+def register_center_view_hotkey():
+    """Registers the CenterView hotkey, loading its add-on on first press."""
+    keymap = bpy.context.window_manager.keyconfigs.addon.keymaps.new(
+        name='3D View', space_type='VIEW_3D')
+    item = keymap.keymap_items.new(LazyCall.bl_idname, type='V', value='PRESS')
+    item.properties.addon = "loadup"
+    item.properties.target = "view3d.center_view"
+
+    addon_keymaps.append((keymap, item))
+
+
+def register():
+    """Registers the lazy menu entries, hotkey and handlers."""
+    with profiler.measure("weather_suite", "register"):
+        bpy.utils.register_class(WeatherSuitePreferences)
+        bpy.utils.register_class(LazyCall)
+
+        bpy.types.VIEW3D_MT_add.append(draw_add_menu)
+        bpy.types.TOPBAR_MT_file.append(draw_file_menu)
+        bpy.types.VIEW3D_MT_view.append(draw_view_menu)
+
+        # Keyconfigs are unavailable in background mode.
+        if bpy.context.window_manager.keyconfigs.addon is not None:
+            register_center_view_hotkey()
+
+        bpy.app.handlers.load_post.append(on_load_post)
+
+        # Defer cache trimming and the report until Blender is idle.
+        bpy.app.timers.register(trim_cache, first_interval=1.0)
+        bpy.app.timers.register(write_report, first_interval=1.0)
+
+        # The suite may be enabled in a file that is already open.
+        bpy.app.timers.register(load_file_features, first_interval=1.0)
+
+    # Timed one by one, so the report shows what each costs.
+    for module in EAGER_MODULES:
+        with profiler.measure(module.__name__.rsplit(".", 1)[-1], "register"):
+            module.register()
+
+
+def unregister():
+    """Unregisters everything the suite registered."""
+    for keymap, item in addon_keymaps:
+        keymap.keymap_items.remove(item)
+    addon_keymaps.clear()
+
+    if on_load_post in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(on_load_post)
+
+    for timer in (trim_cache, write_report, load_file_features):
+        if bpy.app.timers.is_registered(timer):
+            bpy.app.timers.unregister(timer)
+
+    bpy.types.VIEW3D_MT_add.remove(draw_add_menu)
+    bpy.types.TOPBAR_MT_file.remove(draw_file_menu)
+    bpy.types.VIEW3D_MT_view.remove(draw_view_menu)
+
+    for cls in reversed(registered_classes):
+        bpy.utils.unregister_class(cls)
+    registered_classes.clear()
+    loaded_addons.clear()
+    missing_addons.clear()
+
+    for module in reversed(list(loaded_features.values())):
+        module.unregister()
+    loaded_features.clear()
+
+    for module in reversed(EAGER_MODULES):
+        module.unregister()
+    bpy.utils.unregister_class(LazyCall)
+    bpy.utils.unregister_class(WeatherSuitePreferences)
+
+
+if __name__ == "__main__":
+    register()
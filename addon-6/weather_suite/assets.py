@@ -0,0 +1,193 @@
+"""
+Shares the weather assets between shot files through a linked .blend library.
+
+Apply Rain and Generate Cloud link "Raindrop" (with its "Rain" material) and
+"Cloud Texture" from the library instead of building their own copies, so a
+sequence of shots carries and compiles them once. Publish writes the local
+assets of the current file into the library, tagged with LIBRARY_VERSION,
+and Relocalize turns linked assets back into local copies.
+
+A particle system instancing the raindrop does not count as a user, so
+linked objects are kept in a hidden "Weather Assets" collection of the
+scene, or they would be dropped when the file is saved.
+"""
+
+import os
+
+import bpy
+
+# Bump when the published assets change in a way older shots should not pick up.
+LIBRARY_VERSION = 1
+
+# Custom property holding the library version on every published asset.
+VERSION_PROPERTY = "weather_asset_version"
+
+# Default library location inside the Blender config directory.
+LIBRARY_FILENAME = "weather_assets.blend"
+
+# Custom property tagging the asset collection, so the weather cleanup can collect it once empty.
+OWNER_PROPERTY = "weather_owner"
+
+# Hidden collection linked objects are kept in, so they have a user.
+ASSET_COLLECTION = "Weather Assets"
+
+# Assets published to the library: (data collection, name).
+ASSETS = (
+    ("objects", "Raindrop"),
+    ("materials", "Rain"),
+    ("textures", "Cloud Texture"),
+)
+
+
+def get_library_path():
+    """Returns the path of the asset library, from the suite preferences, WEATHER_ASSET_LIBRARY or the config directory."""
+    addon = bpy.context.preferences.addons.get(__package__)
+    if addon is not None and addon.preferences.library_path:
+        return bpy.path.abspath(addon.preferences.library_path)
+
+    if os.environ.get("WEATHER_ASSET_LIBRARY"):
+        return os.environ["WEATHER_ASSET_LIBRARY"]
+
+    return os.path.join(bpy.utils.user_resource('CONFIG'), LIBRARY_FILENAME)
+
+
+def is_library_enabled():
+    """Checks if assets should be linked, the suite preferences can turn it off."""
+    addon = bpy.context.preferences.addons.get(__package__)
+    return addon is None or addon.preferences.use_library
+
+
+def get_asset_collection(scene):
+    """Returns the hidden collection holding the linked objects, adding it to the scene the first time."""
+    asset_collection = bpy.data.collections.get(ASSET_COLLECTION)
+    if asset_collection is None:
+        asset_collection = bpy.data.collections.new(ASSET_COLLECTION)
+        asset_collection[OWNER_PROPERTY] = "weather_suite"
+        # Instancing still works from hidden objects.
+        asset_collection.hide_viewport = True
+        asset_collection.hide_render = True
+    if asset_collection.name not in scene.collection.children:
+        scene.collection.children.link(asset_collection)
+    return asset_collection
+
+
+def link_asset(collection, name):
+    """Links an asset from the library, returning None when it is unavailable or out of date."""
+    path = get_library_path()
+    if not is_library_enabled() or not os.path.exists(path):
+        return None
+
+    with bpy.data.libraries.load(path, link=True) as (data_from, data_to):
+        if name not in getattr(data_from, collection):
+            return None
+        setattr(data_to, collection, [name])
+
+    asset = getattr(data_to, collection)[0]
+    if asset is None:
+        return None
+
+    # Only use assets published for this version of the add-ons.
+    if asset.get(VERSION_PROPERTY) != LIBRARY_VERSION:
+        print("Weather asset library {0} has {1} at version {2}, expected {3}, creating it locally.".format(
+            path, name, asset.get(VERSION_PROPERTY), LIBRARY_VERSION))
+        library = asset.library
+        getattr(bpy.data, collection).remove(asset)
+        # Drop the library too, with what the asset brought along, unless something else from it is in use.
+        if all(id_data.users == 0 for id_data in library.users_id):
+            bpy.data.libraries.remove(library)
+        return None
+
+    # Objects used only as particle instances have no user otherwise.
+    if collection == "objects":
+        asset_collection = get_asset_collection(bpy.context.scene)
+        if asset_collection not in asset.users_collection:
+            asset_collection.objects.link(asset)
+
+    return asset
+
+
+def get_library(path):
+    """Returns the library datablock of a loaded .blend, if it is linked into this file."""
+    path = os.path.normpath(path)
+    for library in bpy.data.libraries:
+        if os.path.normpath(bpy.path.abspath(library.filepath)) == path:
+            return library
+    return None
+
+
+class PublishAssets(bpy.types.Operator):
+    bl_idname = "weather_suite.publish_assets"
+    bl_label = "Publish Weather Assets"
+    bl_description = "Writes this file's raindrop, rain material and cloud texture into the weather asset library."
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        """Tags the local assets with the library version and writes them to the library."""
+        assets = set()
+        for collection, name in ASSETS:
+            asset = getattr(bpy.data, collection).get(name)
+            if asset is not None and asset.library is None:
+                asset[VERSION_PROPERTY] = LIBRARY_VERSION
+                assets.add(asset)
+
+        if not assets:
+            self.report({'ERROR'}, "Nothing to publish, run Apply Rain or Generate Cloud first.")
+            return {'CANCELLED'}
+
+        path = get_library_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        bpy.data.libraries.write(path, assets, fake_user=True)
+
+        self.report({'INFO'}, "Published {0} weather assets to {1}".format(len(assets), path))
+        return {'FINISHED'}
+
+
+class RelocalizeAssets(bpy.types.Operator):
+    bl_idname = "weather_suite.relocalize_assets"
+    bl_label = "Relocalize Weather Assets"
+    bl_description = "Turns the linked weather assets into local copies."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        """Checks if the weather library is linked into this file."""
+        return get_library(get_library_path()) is not None
+
+    def execute(self, context):
+        """Makes every datablock from the weather library local, then drops the library."""
+        library = get_library(get_library_path())
+
+        count = 0
+        for id_data in list(library.users_id):
+            id_data.make_local()
+            count += 1
+
+        if not library.users_id:
+            bpy.data.libraries.remove(library)
+
+        self.report({'INFO'}, "Made {0} weather datablocks local.".format(count))
+        return {'FINISHED'}
+
+
+# Operators registered by this module.
+classes = (PublishAssets, RelocalizeAssets)
+
+
+def draw_menu(self, context):
+    """Draws the asset library operators in the File menu."""
+    self.layout.operator(PublishAssets.bl_idname)
+    self.layout.operator(RelocalizeAssets.bl_idname)
+
+
+def register():
+    """Registers the asset library operators."""
+    for cls in classes:
+        bpy.utils.register_class(cls)
+    bpy.types.TOPBAR_MT_file.append(draw_menu)
+
+
+def unregister():
+    """Unregisters the asset library operators."""
+    bpy.types.TOPBAR_MT_file.remove(draw_menu)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
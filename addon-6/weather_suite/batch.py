@@ -0,0 +1,283 @@
+"""
+Applies weather setups to many .blend files from the command line.
+
+    blender --background --python addon-6/weather_suite/batch.py -- shots.json --workers 4
+
+The manifest lists the files and the setups to apply to each of them:
+
+    {
+        "jobs": [
+            {
+                "file": "shots/sh010.blend",
+                "output": "shots/sh010_weather.blend",
+                "steps": [
+                    {"operator": "apply_rain", "select": {"collection": "Sky"}},
+                    {"operator": "apply_wet_fx", "select": {"name": "Street*", "property": "wet"}},
+                    {"operator": "apply_waves", "select": {"property": "surface=water"}},
+                    {"operator": "generate_cloud", "locations": [[0, 0, 20], [15, 4, 22]]}
+                ]
+            }
+        ]
+    }
+
+Paths are relative to the manifest. Without "output" the file is saved in
+place. Selectors combine, an object has to match all of them: "collection"
+includes everything inside the collection, "name" is a glob and "property"
+is a custom property name, optionally with "=value". Every file runs in its
+own Blender process, logs to <manifest>_logs and is recorded in
+<manifest>.state.json, so a rerun skips the files that already succeeded.
+A file that fails, or cannot be started, is recorded as failed and the
+others carry on.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import fnmatch
+import json
+import os
+import subprocess
+import sys
+import threading
+
+# Operators a step can run, and the add-on each one belongs to.
+OPERATORS = {
+    "apply_rain": "apply_rain",
+    "apply_waves": "apply_waves",
+    "apply_wet_fx": "apply_wet_fx",
+    "generate_cloud": "generate_clouds",
+}
+
+
+def load_manifest(path):
+    """Reads the manifest, checking every step names a known operator."""
+    with open(path, "r") as manifest_file:
+        manifest = json.load(manifest_file)
+
+    for job in manifest["jobs"]:
+        for step in job.get("steps", []):
+            if step.get("operator") not in OPERATORS:
+                raise ValueError("{0}: unknown operator {1!r}, expected one of {2}.".format(
+                    job["file"], step.get("operator"), ", ".join(OPERATORS)))
+
+    return manifest
+
+
+def get_state_path(manifest_path):
+    """Returns the path of the job state next to the manifest."""
+    return os.path.splitext(manifest_path)[0] + ".state.json"
+
+
+def load_state(manifest_path):
+    """Returns the recorded state of every file, empty on the first run."""
+    path = get_state_path(manifest_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as state_file:
+        return json.load(state_file)
+
+
+def save_state(manifest_path, state):
+    """Writes the job state, replacing the old file only once the new one is complete."""
+    path = get_state_path(manifest_path)
+    with open(path + ".tmp", "w") as state_file:
+        json.dump(state, state_file, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def matches(obj, selector):
+    """Checks if an object matches every criteria of a selector."""
+    import bpy
+
+    collection = selector.get("collection")
+    if collection is not None:
+        if collection not in bpy.data.collections:
+            return False
+        if obj.name not in bpy.data.collections[collection].all_objects:
+            return False
+
+    name = selector.get("name")
+    if name is not None and not fnmatch.fnmatchcase(obj.name, name):
+        return False
+
+    prop = selector.get("property")
+    if prop is not None:
+        key, _, value = prop.partition("=")
+        if key not in obj.keys():
+            return False
+        if value and str(obj[key]) != value:
+            return False
+        if not value and not obj[key]:
+            return False
+
+    return True
+
+
+def select(selector):
+    """Selects the objects matching a selector and returns them."""
+    import bpy
+
+    view_layer = bpy.context.view_layer
+    selected = []
+    for obj in view_layer.objects:
+        is_match = matches(obj, selector)
+        obj.select_set(is_match)
+        if is_match:
+            selected.append(obj)
+
+    view_layer.objects.active = selected[0] if selected else None
+    return selected
+
+
+def run_step(step):
+    """Runs a single manifest step on the open file."""
+    import bpy
+
+    operator = getattr(bpy.ops.object, step["operator"])
+
+    if step["operator"] == "generate_cloud":
+        # Clouds are placed at the cursor, once per location.
+        for location in step.get("locations", [[0, 0, 0]]):
+            bpy.context.scene.cursor.location = location
+            operator()
+        print("generate_cloud: {0} clouds".format(len(step.get("locations", [[0, 0, 0]]))))
+        return
+
+    selected = select(step.get("select", {}))
+    if not selected:
+        print("{0}: no objects matched {1}, skipped".format(step["operator"], step.get("select")))
+        return
+
+    operator()
+    print("{0}: {1} objects".format(step["operator"], len(selected)))
+
+
+def run_worker(manifest_path, index):
+    """Applies one job's steps to the file Blender opened, then saves it."""
+    import bpy
+
+    from weather_suite import load_addon
+
+    job = load_manifest(manifest_path)["jobs"][index]
+    for step in job.get("steps", []):
+        load_addon(OPERATORS[step["operator"]])
+        run_step(step)
+
+    if job.get("output"):
+        output = os.path.join(os.path.dirname(os.path.abspath(manifest_path)), job["output"])
+        bpy.ops.wm.save_as_mainfile(filepath=output)
+    else:
+        bpy.ops.wm.save_mainfile()
+
+
+def run_job(blender, manifest_path, index, job, log_dir):
+    """Runs one job in its own headless Blender and returns its exit code and log path."""
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    blend_file = os.path.join(manifest_dir, job["file"])
+    log_path = os.path.join(log_dir, os.path.splitext(os.path.basename(job["file"]))[0]
+                            + "_{0}.log".format(index))
+
+    command = [
+        blender, "--background", blend_file,
+        "--python-exit-code", "1",
+        "--python", os.path.abspath(__file__),
+        "--", "--worker", os.path.abspath(manifest_path), str(index),
+    ]
+    # Workers run side by side, keep them from all writing the suite's startup report.
+    env = dict(os.environ, WEATHER_SUITE_REPORT="0")
+    with open(log_path, "w") as log_file:
+        returncode = subprocess.call(command, stdout=log_file, stderr=subprocess.STDOUT, env=env)
+
+    return returncode, log_path
+
+
+def run_batch(manifest_path, blender, workers):
+    """Runs every job that has not succeeded yet over a pool of Blender processes."""
+    manifest = load_manifest(manifest_path)
+    state = load_state(manifest_path)
+    state_lock = threading.Lock()
+
+    log_dir = os.path.splitext(manifest_path)[0] + "_logs"
+    os.makedirs(log_dir, exist_ok=True)
+
+    # Resume by skipping the jobs that already succeeded.
+    pending = [
+        (index, job) for index, job in enumerate(manifest["jobs"])
+        if state.get(str(index), {}).get("status") != "done"
+    ]
+    print("{0} of {1} files to process.".format(len(pending), len(manifest["jobs"])))
+
+    def record(index, job, entry):
+        entry.update(file=job["file"], finished=datetime.datetime.now().isoformat(timespec="seconds"))
+        with state_lock:
+            state[str(index)] = entry
+            save_state(manifest_path, state)
+        print("{0}: {1}".format(job["file"], entry["status"]))
+
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(run_job, blender, manifest_path, index, job, log_dir): (index, job)
+            for index, job in pending
+        }
+        for future in concurrent.futures.as_completed(futures):
+            index, job = futures[future]
+            try:
+                returncode, log_path = future.result()
+            except Exception as error:
+                # The worker could not even start, record why and go on with the other files.
+                record(index, job, {"status": "failed", "error": repr(error)})
+                failed += 1
+                continue
+
+            record(index, job, {
+                "status": "done" if returncode == 0 else "failed",
+                "returncode": returncode,
+                "log": log_path,
+            })
+            failed += returncode != 0
+
+    print("Finished: {0} succeeded, {1} failed.".format(len(pending) - failed, failed))
+    return failed
+
+
+def get_blender_binary():
+    """Returns the running Blender's binary, or None when run from plain Python."""
+    try:
+        import bpy
+    except ImportError:
+        return None
+    return bpy.app.binary_path
+
+
+def parse_args(argv):
+    """Parses the arguments given after "--" on the Blender command line."""
+    parser = argparse.ArgumentParser(description="Applies weather setups to many .blend files.")
+    parser.add_argument("manifest", nargs="?", help="JSON manifest of files and steps.")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="Blender processes to run at once.")
+    parser.add_argument("--blender", default=get_blender_binary(), help="Blender binary for the workers.")
+    parser.add_argument("--worker", nargs=2, metavar=("MANIFEST", "INDEX"), help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    """Runs the batch, or a single job when started as a worker."""
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+
+    if args.worker:
+        run_worker(args.worker[0], int(args.worker[1]))
+        return
+
+    if args.manifest is None or args.blender is None:
+        sys.exit("A manifest and a Blender binary (--blender) are required.")
+
+    if run_batch(args.manifest, args.blender, args.workers):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Run as a script, so make the suite importable.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
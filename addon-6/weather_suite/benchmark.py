@@ -0,0 +1,250 @@
+"""
+Headless benchmarks for the weather operators.
+
+Run a benchmark on a synthetic scene and save the results:
+    blender --background --python addon-6/weather_suite/benchmark.py -- --meshes 200 --output run.json
+
+Compare two runs, flagging cases that got slower than the threshold:
+    python addon-6/weather_suite/benchmark.py --compare base.json run.json --threshold 0.1
+"""
+
+import argparse
+import csv
+import datetime
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+# Bump whenever the layout of the results file changes.
+FORMAT_VERSION = 1
+
+# Every case, in the order it runs on a scene.
+CASES = (
+    "apply_rain", "revert_rain",
+    "apply_waves", "revert_waves",
+    "apply_wet_fx", "revert_wet_fx",
+    "generate_cloud", "playback",
+)
+
+
+def build_scene(args):
+    """Resets Blender to an empty scene with the synthetic receivers and emitters."""
+    import bpy
+
+    # The factory scene keeps the "Collection" that GenerateCloud goes back to.
+    bpy.ops.wm.read_factory_settings(use_empty=False)
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj)
+
+    # Grids with roughly the requested vertex count.
+    subdivisions = max(2, int(math.sqrt(args.verts)))
+    receivers = []
+    for index in range(args.meshes):
+        bpy.ops.mesh.primitive_grid_add(
+            x_subdivisions=subdivisions, y_subdivisions=subdivisions, size=2,
+            location=((index % 32) * 3.0, (index // 32) * 3.0, 0))
+        receivers.append(bpy.context.active_object)
+
+    # Emitters float above the receivers.
+    emitters = []
+    for index in range(args.emitters):
+        bpy.ops.mesh.primitive_cube_add(size=4, location=(index * 5.0, 0, 10))
+        emitters.append(bpy.context.active_object)
+
+    return receivers, emitters
+
+
+def select(objects):
+    """Makes the given objects the only selection."""
+    import bpy
+
+    bpy.ops.object.select_all(action='DESELECT')
+    for obj in objects:
+        obj.select_set(True)
+    if objects:
+        bpy.context.view_layer.objects.active = objects[0]
+
+
+def timed(function):
+    """Runs a function and returns how long it took in seconds."""
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+
+def run_once(args):
+    """Builds a fresh scene and times every case on it once."""
+    import bpy
+
+    receivers, emitters = build_scene(args)
+    timings = {}
+
+    select(emitters)
+    timings["apply_rain"] = timed(bpy.ops.object.apply_rain)
+    select(receivers)
+    timings["apply_waves"] = timed(bpy.ops.object.apply_waves)
+    timings["revert_waves"] = timed(bpy.ops.object.revert_waves)
+    timings["apply_wet_fx"] = timed(bpy.ops.object.apply_wet_fx)
+
+    def generate_clouds():
+        for index in range(args.clouds):
+            bpy.context.scene.cursor.location = (index * 12.0, 0, 20)
+            bpy.ops.object.generate_cloud()
+    timings["generate_cloud"] = timed(generate_clouds)
+
+    # Play the scene with every effect still applied.
+    scene = bpy.context.scene
+
+    def playback():
+        for frame in range(scene.frame_start, scene.frame_start + args.frames):
+            scene.frame_set(frame)
+    timings["playback"] = timed(playback)
+
+    select(receivers)
+    timings["revert_wet_fx"] = timed(bpy.ops.object.revert_wet_fx)
+    select(emitters)
+    timings["revert_rain"] = timed(bpy.ops.object.revert_rain)
+
+    return timings
+
+
+def run(args):
+    """Times every case over several fresh scenes and returns the results."""
+    import bpy
+
+    from weather_suite import instrumentation, load_addon
+
+    for name in ("apply_rain", "apply_waves", "apply_wet_fx", "generate_clouds"):
+        load_addon(name)
+
+    if args.sections:
+        instrumentation.enable()
+
+    runs = {case: [] for case in CASES}
+    for _repeat in range(args.repeat):
+        instrumentation.clear()
+        for case, seconds in run_once(args).items():
+            runs[case].append(seconds)
+
+    return {
+        "format_version": FORMAT_VERSION,
+        "blender": bpy.app.version_string,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "params": {
+            "meshes": args.meshes, "verts": args.verts, "emitters": args.emitters,
+            "clouds": args.clouds, "frames": args.frames, "repeat": args.repeat,
+        },
+        "results": {
+            case: {
+                "mean": statistics.mean(seconds),
+                "min": min(seconds),
+                "max": max(seconds),
+                "runs": seconds,
+            }
+            for case, seconds in runs.items()
+        },
+        # Section breakdown of the last repeat.
+        "sections": instrumentation.summary() if args.sections else {},
+    }
+
+
+def write_results(results, path):
+    """Writes results as JSON, or as CSV when the path ends in .csv."""
+    if not path.endswith(".csv"):
+        with open(path, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+        return
+
+    params = results["params"]
+    with open(path, "w", newline="") as results_file:
+        writer = csv.writer(results_file)
+        writer.writerow(["format_version", "blender", "timestamp"] + list(params)
+                        + ["case", "mean", "min", "max"])
+        for case, result in results["results"].items():
+            writer.writerow([results["format_version"], results["blender"], results["timestamp"]]
+                            + list(params.values())
+                            + [case, result["mean"], result["min"], result["max"]])
+
+
+def read_results(path):
+    """Reads results written by write_results, returning {case: mean seconds}."""
+    if not path.endswith(".csv"):
+        with open(path, "r") as results_file:
+            results = json.load(results_file)
+        if results.get("format_version") != FORMAT_VERSION:
+            raise ValueError("{0} uses results format {1}, expected {2}.".format(
+                path, results.get("format_version"), FORMAT_VERSION))
+        return {case: result["mean"] for case, result in results["results"].items()}
+
+    with open(path, "r", newline="") as results_file:
+        rows = list(csv.DictReader(results_file))
+    for row in rows:
+        if int(row["format_version"]) != FORMAT_VERSION:
+            raise ValueError("{0} uses results format {1}, expected {2}.".format(
+                path, row["format_version"], FORMAT_VERSION))
+    return {row["case"]: float(row["mean"]) for row in rows}
+
+
+def compare(base_path, new_path, threshold):
+    """Prints the change of every case and returns the cases slower than the threshold."""
+    base = read_results(base_path)
+    new = read_results(new_path)
+
+    regressions = []
+    for case in CASES:
+        if case not in base or case not in new:
+            continue
+
+        change = (new[case] - base[case]) / base[case] if base[case] > 0 else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(case)
+            flag = "  REGRESSION"
+        print("{0:<16} {1:>10.4f}s {2:>10.4f}s {3:>+8.1%}{4}".format(
+            case, base[case], new[case], change, flag))
+
+    return regressions
+
+
+def parse_args(argv):
+    """Parses the arguments given after "--" on the Blender command line."""
+    parser = argparse.ArgumentParser(description="Benchmarks the weather operators.")
+    parser.add_argument("--meshes", type=int, default=50, help="Number of receiver meshes.")
+    parser.add_argument("--verts", type=int, default=400, help="Vertices per receiver mesh.")
+    parser.add_argument("--emitters", type=int, default=2, help="Number of rain emitters.")
+    parser.add_argument("--clouds", type=int, default=2, help="Number of clouds to generate.")
+    parser.add_argument("--frames", type=int, default=10, help="Frames of playback to time.")
+    parser.add_argument("--repeat", type=int, default=3, help="Fresh scenes to average over.")
+    parser.add_argument("--sections", action="store_true", help="Also record a section breakdown.")
+    parser.add_argument("--output", default="benchmark.json", help="Results file, .json or .csv.")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"),
+                        help="Compare two results files instead of running.")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Slowdown, as a fraction, that counts as a regression.")
+    return parser.parse_args(argv)
+
+
+def main():
+    """Runs or compares benchmarks depending on the arguments."""
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+
+    if args.compare:
+        regressions = compare(args.compare[0], args.compare[1], args.threshold)
+        if regressions:
+            print("Regressions: " + ", ".join(regressions))
+            sys.exit(1)
+        return
+
+    results = run(args)
+    write_results(results, args.output)
+    print("Benchmark results written to " + os.path.abspath(args.output))
+
+
+if __name__ == "__main__":
+    # Run as a script, so make the suite importable.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
@@ -0,0 +1,252 @@
+"""
+Finds the datablocks left behind by the weather add-ons and purges them in bulk.
+
+The add-ons tag the data they create with OWNER_PROPERTY. Files made before
+the tag are recognised by the names the add-ons use, as are the helper
+objects, the raindrop and the anchors. A weather datablock is
+garbage once nothing but other garbage uses it: linking an object in a
+collection does not count as using it, so a "Raindrop" no particle system
+instances or a "Cloud Anchor" no cloud follows is garbage too. Empty
+"Cloud Collection 0x…" collections and "dp_wetmap" layers on meshes that are
+no longer a Dynamic Paint canvas are also collected.
+
+The footprint report counts the weather data by category with a rough
+estimate of its memory, from element counts and typical sizes rather than
+Blender's actual allocations.
+"""
+
+import fnmatch
+
+import bpy
+
+# Custom property naming the add-on that created a datablock.
+OWNER_PROPERTY = "weather_owner"
+
+# Helper objects the add-ons create. Clouds and emitters are part of the scene and never collected.
+HELPER_OBJECTS = ("Raindrop", "Raindrop.*", "Cloud Anchor", "Cloud Anchor.*", "Movement Anchor*")
+
+# Names used by the weather add-ons before datablocks were tagged, by data collection.
+LEGACY_NAMES = {
+    "materials": ("Rain", "Rain.*", "Wet", "Wet.*"),
+    "textures": ("Cloud Texture", "Cloud Texture.*"),
+    "collections": ("Cloud Collection 0x*",),
+}
+
+# Report category of every data collection searched.
+CATEGORIES = {
+    "particles": "Particle settings",
+    "objects": "Objects",
+    "meshes": "Meshes",
+    "volumes": "Volumes",
+    "materials": "Materials",
+    "node_groups": "Node groups",
+    "textures": "Textures",
+    "images": "Images",
+    "collections": "Collections",
+}
+
+# Name of the wetmap layer Apply Wet FX outputs.
+WETMAP_LAYER = "dp_wetmap"
+
+
+def is_weather_data(collection, id_data):
+    """Checks if a datablock was created by a weather add-on."""
+    if id_data.library is not None:
+        # Linked assets belong to the library.
+        return False
+    if collection == "objects":
+        return any(fnmatch.fnmatchcase(id_data.name, pattern) for pattern in HELPER_OBJECTS)
+    if id_data.get(OWNER_PROPERTY):
+        return True
+    if collection == "particles":
+        # Untagged rain particle settings instance the raindrop.
+        return id_data.instance_object is not None and fnmatch.fnmatchcase(id_data.instance_object.name, "Raindrop*")
+    return any(fnmatch.fnmatchcase(id_data.name, pattern) for pattern in LEGACY_NAMES.get(collection, ()))
+
+
+def find_weather_data():
+    """Returns every weather datablock with its data collection."""
+    weather_data = {
+        id_data: collection
+        for collection in CATEGORIES
+        for id_data in getattr(bpy.data, collection, [])
+        if is_weather_data(collection, id_data)
+    }
+
+    # The meshes of helper objects are weather data too, even untagged.
+    for id_data, collection in list(weather_data.items()):
+        if (collection == "objects" and isinstance(id_data.data, bpy.types.Mesh)
+                and id_data.data.library is None):
+            weather_data.setdefault(id_data.data, "meshes")
+
+    return weather_data
+
+
+def find_garbage(weather_data):
+    """Returns the weather datablocks that nothing outside the garbage uses."""
+    user_map = bpy.data.user_map(subset=list(weather_data))
+    garbage = set()
+
+    # Garbage frees what only it used, so repeat until nothing changes.
+    changed = True
+    while changed:
+        changed = False
+        for id_data, collection in weather_data.items():
+            # Data kept with a fake user is meant to stay.
+            if id_data in garbage or id_data.use_fake_user:
+                continue
+
+            if collection == "collections":
+                # A cloud collection is garbage once everything in it is, whatever links it.
+                if not id_data.children and all(obj in garbage for obj in id_data.all_objects):
+                    garbage.add(id_data)
+                    changed = True
+                continue
+
+            users = {
+                user for user in user_map[id_data]
+                if user not in garbage and user is not id_data
+                # An object is not used by the collections and scenes it is linked in.
+                and not (collection == "objects" and isinstance(user, (bpy.types.Collection, bpy.types.Scene)))
+            }
+            if not users:
+                garbage.add(id_data)
+                changed = True
+
+    return garbage
+
+
+def find_stale_wetmaps():
+    """Returns the meshes with a wetmap layer but no Dynamic Paint canvas to fill it."""
+    canvases = {
+        obj.data for obj in bpy.data.objects
+        if obj.type == 'MESH' and any(
+            modifier.type == 'DYNAMIC_PAINT' and modifier.canvas_settings is not None
+            for modifier in obj.modifiers)
+    }
+    return [mesh for mesh in bpy.data.meshes
+            if mesh.library is None and mesh not in canvases and WETMAP_LAYER in mesh.vertex_colors]
+
+
+def estimate_size(id_data):
+    """Returns a rough estimate of a datablock's memory in bytes."""
+    if isinstance(id_data, bpy.types.Mesh):
+        return (len(id_data.vertices) * 32 + len(id_data.edges) * 8 + len(id_data.loops) * 8
+                + len(id_data.polygons) * 12 + len(id_data.loops) * 4 * len(id_data.vertex_colors))
+    if isinstance(id_data, bpy.types.Material) and id_data.node_tree is not None:
+        return 1024 + len(id_data.node_tree.nodes) * 512
+    if isinstance(id_data, bpy.types.NodeTree):
+        return 1024 + len(id_data.nodes) * 512
+    if isinstance(id_data, bpy.types.Image):
+        return id_data.size[0] * id_data.size[1] * id_data.channels * 4
+    if isinstance(id_data, bpy.types.ParticleSettings):
+        return 2048
+    if isinstance(id_data, bpy.types.Object):
+        return 1024 + len(id_data.modifiers) * 256 + len(id_data.constraints) * 256
+    return 512
+
+
+def get_footprint():
+    """Returns the count and estimated bytes of the weather data, by category."""
+    footprint = {category: {"count": 0, "bytes": 0} for category in CATEGORIES.values()}
+    footprint["Wetmap layers"] = {"count": 0, "bytes": 0}
+
+    for id_data, collection in find_weather_data().items():
+        entry = footprint[CATEGORIES[collection]]
+        entry["count"] += 1
+        entry["bytes"] += estimate_size(id_data)
+
+    for mesh in find_stale_wetmaps():
+        footprint["Wetmap layers"]["count"] += 1
+        footprint["Wetmap layers"]["bytes"] += len(mesh.loops) * 4
+
+    return footprint
+
+
+def purge():
+    """Removes the weather garbage in one batch, returning the footprint before and after."""
+    before = get_footprint()
+
+    for mesh in find_stale_wetmaps():
+        mesh.vertex_colors.remove(mesh.vertex_colors[WETMAP_LAYER])
+
+    garbage = find_garbage(find_weather_data())
+    if garbage:
+        bpy.data.batch_remove(list(garbage))
+
+    return before, get_footprint()
+
+
+def format_footprint(before, after=None):
+    """Formats a footprint report as a table, with the change when an after footprint is given."""
+    lines = []
+    for category, entry in before.items():
+        line = "{0:<18} {1:>6} {2:>10.1f} KB".format(category, entry["count"], entry["bytes"] / 1024)
+        if after is not None:
+            line += "  ->  {0:>6} {1:>10.1f} KB".format(after[category]["count"], after[category]["bytes"] / 1024)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def get_total(footprint):
+    """Returns the total count and estimated bytes of a footprint."""
+    return (sum(entry["count"] for entry in footprint.values()),
+            sum(entry["bytes"] for entry in footprint.values()))
+
+
+class ReportWeatherFootprint(bpy.types.Operator):
+    bl_idname = "weather_suite.report_weather_footprint"
+    bl_label = "Weather Data Footprint"
+    bl_description = "Prints the count and estimated memory of the weather data in this file."
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        """Prints the footprint table to the console."""
+        footprint = get_footprint()
+        print(format_footprint(footprint))
+
+        count, size = get_total(footprint)
+        self.report({'INFO'}, "{0} weather datablocks, about {1:.1f} KB, see the console.".format(count, size / 1024))
+        return {'FINISHED'}
+
+
+class PurgeWeatherData(bpy.types.Operator):
+    bl_idname = "weather_suite.purge_weather_data"
+    bl_label = "Purge Weather Data"
+    bl_description = "Removes the weather datablocks and wetmap layers nothing uses anymore."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        """Purges the garbage and prints the footprint before and after."""
+        before, after = purge()
+        print(format_footprint(before, after))
+
+        count_before, size_before = get_total(before)
+        count_after, size_after = get_total(after)
+        self.report({'INFO'}, "Purged {0} weather datablocks and layers, about {1:.1f} KB.".format(
+            count_before - count_after, (size_before - size_after) / 1024))
+        return {'FINISHED'}
+
+
+# Operators registered by this module.
+classes = (ReportWeatherFootprint, PurgeWeatherData)
+
+
+def draw_menu(self, context):
+    """Draws the footprint and purge operators in the File menu."""
+    self.layout.operator(ReportWeatherFootprint.bl_idname)
+    self.layout.operator(PurgeWeatherData.bl_idname)
+
+
+def register():
+    """Registers the cleanup operators."""
+    for cls in classes:
+        bpy.utils.register_class(cls)
+    bpy.types.TOPBAR_MT_file.append(draw_menu)
+
+
+def unregister():
+    """Unregisters the cleanup operators."""
+    bpy.types.TOPBAR_MT_file.remove(draw_menu)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
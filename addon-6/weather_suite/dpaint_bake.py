@@ -0,0 +1,338 @@
+"""
+Bakes the Dynamic Paint canvases of a shot over several headless Blender processes.
+
+    blender --background --python addon-6/weather_suite/dpaint_bake.py -- shot.blend --workers 8
+
+Blender's baker goes through the canvases one after another. Here the
+brushes are frozen first: their particle caches are baked into a copy of the
+shot saved as <shot>_dpaint.blend. Canvases are then grouped by dependency,
+a canvas that is itself a brush of another canvas is baked together with
+it, and every group is baked by its own process against the frozen copy.
+Canvases that only share brushes are independent, as the frozen brushes
+give every process the same input.
+
+Vertex surfaces bake into point caches, which are copied with the frozen
+particles into the shot's own blendcache folder, with the shot switched to
+disk caches and every copied cache marked as baked, so Blender keeps it.
+Image sequence surfaces write straight to their output folder. Logs go to
+<shot>_dpaint_logs. With --scaling, the whole bake runs again for every
+worker count from 1 to --workers, and the time, speedup and efficiency of
+each are reported.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+
+def get_canvas_surfaces(obj):
+    """Returns the Dynamic Paint canvas surfaces of an object."""
+    for modifier in obj.modifiers:
+        if modifier.type == 'DYNAMIC_PAINT' and modifier.canvas_settings is not None:
+            return list(modifier.canvas_settings.canvas_surfaces)
+    return []
+
+
+def is_brush(obj):
+    """Checks if an object is a Dynamic Paint brush."""
+    return any(modifier.type == 'DYNAMIC_PAINT' and modifier.brush_settings is not None
+               for modifier in obj.modifiers)
+
+
+def get_brushes(scene, surface):
+    """Returns the names of the brushes that paint on a surface."""
+    objects = surface.brush_collection.all_objects if surface.brush_collection is not None else scene.objects
+    return {obj.name for obj in objects if is_brush(obj)}
+
+
+def group_canvases(scene):
+    """Groups the canvases that have to bake together, returning lists of object names."""
+    canvases = {obj.name: obj for obj in scene.objects if get_canvas_surfaces(obj)}
+
+    # Union-find over the canvases, joined when one is a brush of the other.
+    parents = {name: name for name in canvases}
+
+    def find(name):
+        while parents[name] != name:
+            parents[name] = parents[parents[name]]
+            name = parents[name]
+        return name
+
+    for name, obj in canvases.items():
+        for surface in get_canvas_surfaces(obj):
+            for brush in get_brushes(scene, surface):
+                if brush in canvases and brush != name:
+                    parents[find(brush)] = find(name)
+
+    groups = {}
+    for name in canvases:
+        groups.setdefault(find(name), []).append(name)
+    return sorted(groups.values(), key=len, reverse=True)
+
+
+def set_disk_cache(point_cache, scene):
+    """Makes a point cache bake to disk over the scene frame range."""
+    point_cache.use_disk_cache = True
+    point_cache.frame_start = scene.frame_start
+    point_cache.frame_end = scene.frame_end
+
+
+def run_cache_operator(operator, point_cache):
+    """Runs a point cache operator, such as bake_from_cache or free_bake, on one cache."""
+    import bpy
+
+    if hasattr(bpy.context, "temp_override"):
+        with bpy.context.temp_override(point_cache=point_cache):
+            return operator()
+    return operator({"point_cache": point_cache})
+
+
+def get_cache_dir(blend_file):
+    """Returns the folder Blender writes a file's disk point caches to."""
+    directory, filename = os.path.split(blend_file)
+    return os.path.join(directory, "blendcache_" + os.path.splitext(filename)[0])
+
+
+def prepare(frozen_path):
+    """Freezes the brushes into a copy of the open shot and prints the canvas groups."""
+    import bpy
+
+    scene = bpy.context.scene
+
+    # Disk caches live next to the file they belong to, so save the copy first.
+    bpy.ops.wm.save_as_mainfile(filepath=frozen_path)
+
+    # Bake every particle system, so each process reads the same brush particles.
+    for obj in scene.objects:
+        for particle_system in getattr(obj, "particle_systems", []):
+            set_disk_cache(particle_system.point_cache, scene)
+
+    # Canvases are baked by the workers, keep them out of this bake.
+    canvases = [obj for obj in scene.objects if get_canvas_surfaces(obj)]
+    for obj in canvases:
+        for modifier in obj.modifiers:
+            if modifier.type == 'DYNAMIC_PAINT':
+                modifier.show_viewport = False
+    bpy.ops.ptcache.bake_all(bake=True)
+    for obj in canvases:
+        for modifier in obj.modifiers:
+            if modifier.type == 'DYNAMIC_PAINT':
+                modifier.show_viewport = True
+
+        # bake_all may still flag the switched off canvases as baked with no frames,
+        # which would make the workers skip them.
+        for surface in get_canvas_surfaces(obj):
+            run_cache_operator(bpy.ops.ptcache.free_bake, surface.point_cache)
+
+    bpy.ops.wm.save_mainfile()
+    print("DPAINT_GROUPS", json.dumps(group_canvases(scene)))
+
+
+def bake_group(names):
+    """Bakes the canvases of one group in the frozen copy Blender opened, leaving the others off."""
+    import bpy
+
+    scene = bpy.context.scene
+    image_surfaces = []
+    for obj in scene.objects:
+        surfaces = get_canvas_surfaces(obj)
+        if not surfaces:
+            continue
+
+        if obj.name not in names:
+            # Another process bakes this canvas.
+            for modifier in obj.modifiers:
+                if modifier.type == 'DYNAMIC_PAINT':
+                    modifier.show_viewport = False
+                    modifier.show_render = False
+            continue
+
+        for index, surface in enumerate(surfaces):
+            if surface.surface_format == 'VERTEX':
+                set_disk_cache(surface.point_cache, scene)
+            else:
+                image_surfaces.append((obj, index))
+
+    # The brush particles are baked already, so only this group's canvases bake.
+    bpy.ops.ptcache.bake_all(bake=True)
+
+    # The image sequence baker works on the active surface of the active object.
+    for obj, index in image_surfaces:
+        bpy.context.view_layer.objects.active = obj
+        for modifier in obj.modifiers:
+            if modifier.type == 'DYNAMIC_PAINT' and modifier.canvas_settings is not None:
+                modifier.canvas_settings.canvas_surfaces.active_index = index
+        bpy.ops.dpaint.bake()
+
+    # Nothing is saved, the caches are on disk and other processes share this file.
+    print("Baked {0}".format(", ".join(names)))
+
+
+def write_back(frozen_path):
+    """Points the open shot's canvases and particles at disk caches and copies the baked frames in."""
+    import bpy
+
+    scene = bpy.context.scene
+    point_caches = []
+    for obj in scene.objects:
+        # The canvases were baked against the frozen particles, so use those too.
+        for particle_system in getattr(obj, "particle_systems", []):
+            point_caches.append(particle_system.point_cache)
+        for surface in get_canvas_surfaces(obj):
+            if surface.surface_format == 'VERTEX':
+                point_caches.append(surface.point_cache)
+    for point_cache in point_caches:
+        set_disk_cache(point_cache, scene)
+
+    # Turning on disk caches clears the cache folder, so copy the frames afterwards.
+    bpy.ops.wm.save_mainfile()
+
+    source = get_cache_dir(frozen_path)
+    target = get_cache_dir(bpy.data.filepath)
+    os.makedirs(target, exist_ok=True)
+    count = 0
+    for filename in os.listdir(source):
+        shutil.copy2(os.path.join(source, filename), os.path.join(target, filename))
+        count += 1
+    print("Copied {0} cache files into {1}".format(count, target))
+
+    # Unbaked disk caches are thrown away on the next reset, so mark the copied frames as baked.
+    for point_cache in point_caches:
+        run_cache_operator(bpy.ops.ptcache.bake_from_cache, point_cache)
+    bpy.ops.wm.save_mainfile()
+
+
+def run_blender(blender, blend_file, arguments, log_path):
+    """Runs this script in a headless Blender on a file and returns its exit code."""
+    command = [
+        blender, "--background", blend_file,
+        "--python-exit-code", "1",
+        "--python", os.path.abspath(__file__), "--",
+    ] + arguments
+    with open(log_path, "w") as log_file:
+        return subprocess.call(command, stdout=log_file, stderr=subprocess.STDOUT)
+
+
+def read_groups(log_path):
+    """Reads the canvas groups printed by the prepare step."""
+    with open(log_path, "r") as log_file:
+        for line in log_file:
+            if line.startswith("DPAINT_GROUPS"):
+                return json.loads(line.split(" ", 1)[1])
+    raise RuntimeError("No canvas groups found in " + log_path)
+
+
+def bake_groups(blender, frozen_path, groups, workers, log_dir):
+    """Bakes every group over a pool of processes, returning the time and failures."""
+    def run(item):
+        index, names = item
+        began = time.perf_counter()
+        returncode = run_blender(
+            blender, frozen_path, ["--bake-worker"] + names,
+            os.path.join(log_dir, "group_{0}.log".format(index)))
+        return {"canvases": names, "returncode": returncode, "seconds": time.perf_counter() - began}
+
+    began = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(run, enumerate(groups)))
+    return time.perf_counter() - began, results
+
+
+def bake(args):
+    """Freezes the brushes, bakes the canvas groups in parallel and writes the caches back."""
+    blend_file = os.path.abspath(args.blend_file)
+    frozen_path = os.path.splitext(blend_file)[0] + "_dpaint.blend"
+    log_dir = os.path.splitext(blend_file)[0] + "_dpaint_logs"
+    os.makedirs(log_dir, exist_ok=True)
+
+    print("Freezing brushes...")
+    prepare_log = os.path.join(log_dir, "prepare.log")
+    if run_blender(args.blender, blend_file, ["--prepare-worker", frozen_path], prepare_log):
+        print("Preparing failed, see " + prepare_log)
+        return 1
+    groups = read_groups(prepare_log)
+    print("{0} canvases in {1} independent groups.".format(sum(len(group) for group in groups), len(groups)))
+
+    worker_counts = range(1, args.workers + 1) if args.scaling else [args.workers]
+    runs = []
+    for workers in worker_counts:
+        # Workers never save the frozen copy, so every run bakes the canvases from scratch.
+        elapsed, results = bake_groups(args.blender, frozen_path, groups, workers, log_dir)
+        runs.append({"workers": workers, "seconds": elapsed, "groups": results})
+        print("{0} workers: {1:.1f}s".format(workers, elapsed))
+
+    failed = sum(1 for result in runs[-1]["groups"] if result["returncode"] != 0)
+    if not failed:
+        write_log = os.path.join(log_dir, "write_back.log")
+        failed = run_blender(args.blender, blend_file, ["--write-back", frozen_path], write_log)
+
+    # Speedup and efficiency against the single worker run, or the groups' summed time without one.
+    baseline = runs[0]["seconds"] if runs[0]["workers"] == 1 else sum(
+        result["seconds"] for result in runs[0]["groups"])
+    for run in runs:
+        run["speedup"] = baseline / run["seconds"] if run["seconds"] > 0 else 0.0
+        run["efficiency"] = run["speedup"] / run["workers"]
+        print("workers {0}: {1:.1f}s, speedup {2:.2f}, efficiency {3:.0%}".format(
+            run["workers"], run["seconds"], run["speedup"], run["efficiency"]))
+
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump({"groups": groups, "runs": runs}, report_file, indent=2)
+
+    return failed
+
+
+def get_blender_binary():
+    """Returns the running Blender's binary, or None when run from plain Python."""
+    try:
+        import bpy
+    except ImportError:
+        return None
+    return bpy.app.binary_path
+
+
+def parse_args(argv):
+    """Parses the arguments given after "--" on the Blender command line."""
+    parser = argparse.ArgumentParser(description="Bakes a shot's Dynamic Paint canvases over several Blender processes.")
+    parser.add_argument("blend_file", nargs="?", help="Shot to bake.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Most Blender processes baking at once.")
+    parser.add_argument("--scaling", action="store_true",
+                        help="Bake with every worker count from 1 to --workers and report the speedup.")
+    parser.add_argument("--report", help="Write the timings to this JSON file.")
+    parser.add_argument("--blender", default=get_blender_binary(), help="Blender binary for the workers.")
+    parser.add_argument("--prepare-worker", metavar="FROZEN_PATH", help=argparse.SUPPRESS)
+    parser.add_argument("--bake-worker", nargs="+", metavar="CANVAS", help=argparse.SUPPRESS)
+    parser.add_argument("--write-back", metavar="FROZEN_PATH", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    """Bakes the shot, or runs one step when started as a worker."""
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+
+    if args.prepare_worker:
+        prepare(args.prepare_worker)
+        return
+    if args.bake_worker:
+        bake_group(args.bake_worker)
+        return
+    if args.write_back:
+        write_back(args.write_back)
+        return
+
+    if args.blend_file is None or args.blender is None:
+        sys.exit("A .blend file and a Blender binary (--blender) are required.")
+
+    if bake(args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Dynamic Paint helpers shared by Apply Rain, Apply Waves and Apply Wet FX.
+
+An object has a single Dynamic Paint modifier, so the effects share it:
+waves and wet FX each add a surface to its canvas and rain adds a brush.
+Every effect removes only its own surface or brush. Whichever removes the
+last one also removes the emptied canvas and modifier, whichever effect
+added them, since they do nothing left empty.
+"""
+
+import bpy
+
+
+def get_dynamic_paint(obj):
+    """Returns the object's dynamic paint modifier, or None."""
+    for modifier in obj.modifiers:
+        if modifier.type == 'DYNAMIC_PAINT':
+            return modifier
+    return None
+
+
+def remove_if_empty(obj, dynamic_paint_modifier):
+    """Removes a dynamic paint modifier that has neither a canvas nor a brush left."""
+    if dynamic_paint_modifier.canvas_settings is None and dynamic_paint_modifier.brush_settings is None:
+        obj.modifiers.remove(dynamic_paint_modifier)
+
+
+def remove_surface(obj, modifier_name, surface_name):
+    """Removes a canvas surface of the active object, then the canvas and modifier if nothing is left on them."""
+    dynamic_paint_modifier = obj.modifiers.get(modifier_name)
+    if dynamic_paint_modifier is None:
+        return
+
+    if dynamic_paint_modifier.canvas_settings is not None:
+        surfaces = dynamic_paint_modifier.canvas_settings.canvas_surfaces
+        index = surfaces.find(surface_name)
+        if index >= 0 and len(surfaces) == 1:
+            # The last surface, drop the canvas with it.
+            bpy.ops.dpaint.type_toggle(type='CANVAS')
+        elif index >= 0:
+            # Other surfaces share the canvas, only remove this one.
+            surfaces.active_index = index
+            bpy.ops.dpaint.surface_slot_remove()
+
+    remove_if_empty(obj, dynamic_paint_modifier)
@@ -0,0 +1,282 @@
+"""
+Profiles the per-frame evaluation cost of every weather object.
+
+While profiling, the time from frame_change_pre to frame_change_post, and
+from depsgraph_update_pre to depsgraph_update_post for edits, is measured
+and split over the objects the depsgraph re-evaluated. Python has no timing
+per object, so each object gets a share in proportion to what it evaluated:
+vertices, voxels and particles. Voxels are estimated from the Mesh to Volume
+resolution. Whatever falls on objects the weather add-ons did not create is
+kept as "Other".
+
+Samples go into a ring buffer of the last RING_SIZE updates, shown sorted
+by cost in the Weather tab of the 3D View sidebar and exported as CSV.
+Profiling is active during playback and rendering alike.
+"""
+
+import collections
+import csv
+import time
+
+import bpy
+from bpy.app.handlers import persistent
+
+from .impacts import is_rain_emitter
+from .viewport import is_cloud
+
+# Updates kept in the ring buffer.
+RING_SIZE = 1000
+
+# Rows shown in the sidebar panel.
+PANEL_ROWS = 12
+
+# Whether updates are being profiled.
+enabled = False
+
+# Recent samples: (frame, source, update ms, {object: (kind, ms, vertices, voxels, particles)}).
+samples = collections.deque(maxlen=RING_SIZE)
+
+# Start of the update being measured.
+_started = None
+
+
+def get_kind(obj):
+    """Returns what a weather add-on made an object into, or None for other objects."""
+    if is_rain_emitter(obj):
+        return "Rain"
+    if obj.type == 'MESH' and is_cloud(obj):
+        return "Cloud"
+    if any(modifier.type == 'MESH_TO_VOLUME' and modifier.object is not None and is_cloud(modifier.object)
+           for modifier in obj.modifiers):
+        return "Cloud Volume"
+    if "weather_waves" in obj.keys():
+        return "Waves"
+    if "weather_wet_fx" in obj.keys():
+        return "Wet FX"
+    return None
+
+
+def count_elements(obj, depsgraph):
+    """Returns the evaluated vertices, estimated voxels and live particles of an object."""
+    evaluated = obj.evaluated_get(depsgraph)
+
+    vertices = len(evaluated.data.vertices) if obj.type == 'MESH' else 0
+
+    voxels = 0
+    for modifier in obj.modifiers:
+        if modifier.type == 'MESH_TO_VOLUME' and modifier.show_viewport:
+            if modifier.resolution_mode == 'VOXEL_AMOUNT':
+                voxels += modifier.voxel_amount ** 3
+            elif modifier.object is not None and modifier.voxel_size > 0:
+                dimensions = modifier.object.dimensions
+                voxels += int(dimensions.x * dimensions.y * dimensions.z / modifier.voxel_size ** 3)
+
+    particles = sum(len(particle_system.particles) for particle_system in evaluated.particle_systems) \
+        if obj.type == 'MESH' else 0
+
+    return vertices, voxels, particles
+
+
+def get_updated_objects(scene, depsgraph):
+    """Returns the objects the depsgraph re-evaluated, or every object when it does not say."""
+    updated = {
+        update.id.original for update in depsgraph.updates
+        if isinstance(update.id, bpy.types.Object) and (update.is_updated_geometry or update.is_updated_transform)
+    }
+    return updated or set(scene.objects)
+
+
+def record(scene, depsgraph, source):
+    """Splits the time of the finished update over the re-evaluated objects."""
+    global _started
+    if _started is None:
+        return
+    elapsed = (time.perf_counter() - _started) * 1000
+    _started = None
+
+    counts = {}
+    for obj in get_updated_objects(scene, depsgraph):
+        if obj.type not in {'MESH', 'VOLUME'}:
+            continue
+        counts[obj] = count_elements(obj, depsgraph)
+
+    total = sum(sum(count) for count in counts.values()) or 1
+    objects = {}
+    other_ms = elapsed
+    for obj, count in counts.items():
+        kind = get_kind(obj)
+        if kind is None:
+            continue
+        share = elapsed * sum(count) / total
+        objects[obj.name] = (kind, share) + count
+        other_ms -= share
+    objects["Other"] = ("Other", other_ms, 0, 0, 0)
+
+    samples.append((scene.frame_current, source, elapsed, objects))
+
+
+@persistent
+def on_update_pre(scene, *args):
+    """Starts timing a frame change or edit."""
+    global _started
+    if enabled:
+        _started = time.perf_counter()
+
+
+@persistent
+def on_frame_change_post(scene, depsgraph=None):
+    """Records the cost of a frame change."""
+    if enabled:
+        record(scene, depsgraph or bpy.context.evaluated_depsgraph_get(), "frame")
+
+
+@persistent
+def on_depsgraph_update_post(scene, depsgraph=None):
+    """Records the cost of an edit."""
+    if enabled:
+        record(scene, depsgraph or bpy.context.evaluated_depsgraph_get(), "update")
+
+
+def get_costs():
+    """Returns (object, kind, mean ms, share of total, vertices, voxels, particles) over the buffer, costliest first."""
+    totals = {}
+    for frame, source, elapsed, objects in samples:
+        for name, (kind, ms, vertices, voxels, particles) in objects.items():
+            total = totals.setdefault(name, [kind, 0.0, 0, 0, 0, 0])
+            total[1] += ms
+            total[2] += 1
+            total[3:] = vertices, voxels, particles
+
+    grand_total = sum(total[1] for total in totals.values()) or 1
+    costs = [
+        (name, kind, ms / count, ms / grand_total, vertices, voxels, particles)
+        for name, (kind, ms, count, vertices, voxels, particles) in totals.items()
+    ]
+    return sorted(costs, key=lambda cost: cost[2], reverse=True)
+
+
+def export_csv(filepath):
+    """Writes every sample in the buffer as one row per object."""
+    with open(filepath, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["frame", "source", "update_ms", "object", "kind", "ms", "vertices", "voxels", "particles"])
+        for frame, source, elapsed, objects in samples:
+            for name, (kind, ms, vertices, voxels, particles) in objects.items():
+                writer.writerow([frame, source, "{0:.3f}".format(elapsed), name, kind,
+                                 "{0:.3f}".format(ms), vertices, voxels, particles])
+    return filepath
+
+
+class ToggleFrameProfiler(bpy.types.Operator):
+    bl_idname = "weather_suite.toggle_frame_profiler"
+    bl_label = "Toggle Weather Frame Profiler"
+    bl_description = "Starts or stops measuring the per-frame cost of the weather objects."
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        """Flips profiling on or off, starting from an empty buffer."""
+        global enabled
+        enabled = not enabled
+        if enabled:
+            samples.clear()
+            add_handlers()
+        else:
+            remove_handlers()
+        return {'FINISHED'}
+
+
+class ExportFrameProfile(bpy.types.Operator):
+    bl_idname = "weather_suite.export_frame_profile"
+    bl_label = "Export Weather Frame Profile"
+    bl_description = "Saves the profiled frames as CSV, one row per object and update."
+    bl_options = {'REGISTER'}
+
+    filepath: bpy.props.StringProperty(subtype="FILE_PATH")
+
+    @classmethod
+    def poll(cls, context):
+        """Needs something profiled."""
+        return bool(samples)
+
+    def execute(self, context):
+        """Writes the CSV to the chosen file."""
+        export_csv(bpy.path.ensure_ext(self.filepath, ".csv"))
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        """Opens the file browser."""
+        self.filepath = "weather_frame_profile.csv"
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+
+class VIEW3D_PT_weather_frame_profile(bpy.types.Panel):
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = "Weather"
+    bl_label = "Frame Profile"
+
+    def draw(self, context):
+        """Draws the costliest objects over the buffered updates."""
+        layout = self.layout
+        layout.operator(ToggleFrameProfiler.bl_idname,
+                        text="Stop Profiling" if enabled else "Start Profiling",
+                        icon='PAUSE' if enabled else 'PLAY')
+
+        if not samples:
+            layout.label(text="Play the animation while profiling.")
+            return
+
+        frame_ms = [elapsed for frame, source, elapsed, objects in samples if source == "frame"]
+        if frame_ms:
+            layout.label(text="{0} frames, {1:.1f} ms per frame".format(len(frame_ms), sum(frame_ms) / len(frame_ms)))
+
+        column = layout.column(align=True)
+        for name, kind, ms, share, vertices, voxels, particles in get_costs()[:PANEL_ROWS]:
+            row = column.row()
+            row.label(text=name)
+            row.label(text=kind)
+            row.label(text="{0:.2f} ms".format(ms))
+            row.label(text="{0:.0%}".format(share))
+
+        layout.operator(ExportFrameProfile.bl_idname, icon='EXPORT')
+
+
+# Classes registered by this module.
+classes = (ToggleFrameProfiler, ExportFrameProfile, VIEW3D_PT_weather_frame_profile)
+
+
+def add_handlers():
+    """Installs the timing handlers, which only run while profiling."""
+    # Start timing before the other handlers, so their work is part of the frame.
+    bpy.app.handlers.frame_change_pre.insert(0, on_update_pre)
+    bpy.app.handlers.frame_change_post.append(on_frame_change_post)
+    bpy.app.handlers.depsgraph_update_pre.insert(0, on_update_pre)
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update_post)
+
+
+def remove_handlers():
+    """Removes the timing handlers."""
+    for handlers, handler in (
+            (bpy.app.handlers.depsgraph_update_post, on_depsgraph_update_post),
+            (bpy.app.handlers.depsgraph_update_pre, on_update_pre),
+            (bpy.app.handlers.frame_change_post, on_frame_change_post),
+            (bpy.app.handlers.frame_change_pre, on_update_pre)):
+        if handler in handlers:
+            handlers.remove(handler)
+
+
+def register():
+    """Registers the profiler operators and panel."""
+    for cls in classes:
+        bpy.utils.register_class(cls)
+
+
+def unregister():
+    """Unregisters the profiler operators, panel and handlers."""
+    global enabled
+    enabled = False
+    remove_handlers()
+
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
@@ -0,0 +1,424 @@
+"""
+Freezes clouds over the frames where nothing about them changes.
+
+Freeze steps through the scene frame range and records, for every cloud, a
+signature of what its shape depends on: its own and its anchors'
+transforms, the cloud texture settings and every modifier and constraint
+parameter. Runs of at least min_frames frames with the same signature are
+frozen: the evaluated mesh of the run is stored as a plain mesh, and on
+frames inside the run a frame change handler swaps it in and switches the
+cloud's modifiers off, so Displace, Subdivision and Simple Deform are not
+evaluated. Outside the runs the live modifier stack is used. When the
+cloud, one of its anchors or its texture is edited, its signature is
+checked again, and if it no longer matches the cloud thaws back to its live
+stack for good. A cloud whose live or frozen mesh is changed, or that enters
+Edit Mode or a paint or sculpt mode, thaws as well, so the edits land on its
+live mesh.
+
+Cloud volumes follow their frozen cloud: Mesh to Volume only runs again
+when the mesh it reads is swapped. The time saved is measured when
+freezing, as the difference between re-evaluating the live and the frozen
+cloud.
+
+Files are saved with the live stack in place, so they open correctly
+without the suite.
+"""
+
+import hashlib
+import time
+
+import bpy
+from bpy.app.handlers import persistent
+
+from .viewport import is_cloud
+
+# Custom property holding a cloud's frozen runs and its live settings.
+FROZEN_PROPERTY = "weather_frozen"
+
+# Custom property tagging the frozen meshes, so the weather cleanup can collect them.
+OWNER_PROPERTY = "weather_owner"
+
+# Properties that never change what a cloud looks like, or that freezing changes itself.
+IGNORED_PROPERTIES = {"rna_type", "name", "show_viewport", "show_render", "show_expanded", "is_active"}
+
+# Names of the clouds the frame change handler swapped since the last update,
+# so their own swap does not count as an edit.
+swapped = set()
+
+# Names of the frozen clouds entered in an editing mode, thawed from a timer.
+editing = set()
+
+
+def get_rna_values(struct):
+    """Returns the values of every plain property of a struct, with pointers to IDs by name."""
+    values = []
+    for prop in struct.bl_rna.properties:
+        if prop.identifier in IGNORED_PROPERTIES or prop.type == 'COLLECTION':
+            continue
+        value = getattr(struct, prop.identifier)
+        if prop.type == 'POINTER':
+            value = value.name if isinstance(value, bpy.types.ID) else None
+        elif getattr(prop, "is_array", False):
+            value = tuple(value)
+        values.append((prop.identifier, value))
+    return values
+
+
+def get_matrix(obj):
+    """Returns an object's world matrix as nested tuples, or None without an object."""
+    return tuple(tuple(row) for row in obj.matrix_world) if obj is not None else None
+
+
+def get_signature(obj):
+    """Returns a digest of everything a cloud's evaluated shape depends on."""
+    values = [get_matrix(obj)]
+
+    for modifier in obj.modifiers:
+        values.append(get_rna_values(modifier))
+        if modifier.type == 'DISPLACE':
+            values.append(get_matrix(modifier.texture_coords_object))
+            if modifier.texture is not None:
+                values.append(get_rna_values(modifier.texture))
+
+    for constraint in obj.constraints:
+        values.append(get_rna_values(constraint))
+        values.append(get_matrix(getattr(constraint, "target", None)))
+
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
+def get_inputs(obj):
+    """Returns the IDs other than the cloud itself that its shape depends on: its anchors and texture."""
+    inputs = []
+    for modifier in obj.modifiers:
+        if modifier.type == 'DISPLACE':
+            inputs += [modifier.texture_coords_object, modifier.texture]
+    for constraint in obj.constraints:
+        inputs.append(getattr(constraint, "target", None))
+    return [id_data for id_data in inputs if id_data is not None]
+
+
+def find_static_runs(signatures, frame_start, min_frames):
+    """Returns the (first, last, signature) of every run of equal signatures at least min_frames long."""
+    runs = []
+    run_start = 0
+    for index in range(1, len(signatures) + 1):
+        if index < len(signatures) and signatures[index] == signatures[run_start]:
+            continue
+        if index - run_start >= min_frames:
+            runs.append((frame_start + run_start, frame_start + index - 1, signatures[run_start]))
+        run_start = index
+    return runs
+
+
+def measure_evaluation(obj):
+    """Returns the milliseconds it takes to evaluate an object's data again."""
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    obj.update_tag(refresh={'DATA'})
+    start = time.perf_counter()
+    depsgraph.update()
+    return (time.perf_counter() - start) * 1000
+
+
+def set_live(obj, record):
+    """Puts a frozen cloud's own mesh and modifiers back."""
+    if obj.data.name != record["mesh"]:
+        obj.data = bpy.data.meshes[record["mesh"]]
+    for modifier in obj.modifiers:
+        show_viewport, show_render = record["modifiers"].get(modifier.name, (True, True))
+        if modifier.show_viewport != show_viewport or modifier.show_render != show_render:
+            modifier.show_viewport = show_viewport
+            modifier.show_render = show_render
+
+
+def set_frozen(obj, mesh_name):
+    """Swaps a frozen mesh into a cloud and switches its modifiers off."""
+    if obj.data.name != mesh_name:
+        obj.data = bpy.data.meshes[mesh_name]
+    for modifier in obj.modifiers:
+        if modifier.show_viewport or modifier.show_render:
+            modifier.show_viewport = False
+            modifier.show_render = False
+
+
+def get_run(record, frame):
+    """Returns the frozen run a frame falls in, or None."""
+    for run in record["runs"]:
+        if run["start"] <= frame <= run["end"]:
+            return run
+    return None
+
+
+def freeze(context, min_frames):
+    """Finds the static runs of every cloud over the scene frame range and freezes them."""
+    scene = context.scene
+    frame = scene.frame_current
+    clouds = [obj for obj in scene.objects if obj.type == 'MESH' and is_cloud(obj)]
+
+    # Start from the live clouds, so the signatures describe them.
+    for obj in clouds:
+        thaw(obj)
+
+    signatures = {obj.name: [] for obj in clouds}
+    for current in range(scene.frame_start, scene.frame_end + 1):
+        scene.frame_set(current)
+        for obj in clouds:
+            signatures[obj.name].append(get_signature(obj))
+
+    frozen = []
+    for obj in clouds:
+        runs = find_static_runs(signatures[obj.name], scene.frame_start, min_frames)
+        if not runs:
+            continue
+
+        record = {
+            "mesh": obj.data.name,
+            "modifiers": {modifier.name: [modifier.show_viewport, modifier.show_render]
+                          for modifier in obj.modifiers},
+            "runs": [],
+        }
+
+        for start, end, signature in runs:
+            scene.frame_set(start)
+            mesh = bpy.data.meshes.new_from_object(obj.evaluated_get(context.evaluated_depsgraph_get()))
+            mesh.name = "{0} Frozen {1}-{2}".format(obj.name, start, end)
+            mesh[OWNER_PROPERTY] = "weather_suite"
+            # Only the current run's mesh is in use, keep the others in the file.
+            mesh.use_fake_user = True
+            record["runs"].append({"start": start, "end": end, "mesh": mesh.name, "signature": signature})
+
+        # The live mesh has no user while a frozen one is swapped in.
+        bpy.data.meshes[record["mesh"]].use_fake_user = True
+
+        # Measure both stacks on the first run.
+        live_ms = measure_evaluation(obj)
+        set_frozen(obj, record["runs"][0]["mesh"])
+        frozen_ms = measure_evaluation(obj)
+        set_live(obj, record)
+        record["saved_ms"] = max(0.0, live_ms - frozen_ms)
+
+        obj[FROZEN_PROPERTY] = record
+        frozen.append(obj)
+
+    scene.frame_set(frame)
+    return frozen
+
+
+def thaw(obj):
+    """Puts a cloud back on its live stack for every frame and deletes its frozen meshes."""
+    if FROZEN_PROPERTY not in obj.keys():
+        return
+
+    record = obj[FROZEN_PROPERTY]
+    set_live(obj, record)
+    bpy.data.meshes[record["mesh"]].use_fake_user = False
+
+    for run in record["runs"]:
+        mesh = bpy.data.meshes.get(run["mesh"])
+        if mesh is None:
+            continue
+        mesh.use_fake_user = False
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+
+    del obj[FROZEN_PROPERTY]
+
+
+def get_frozen(scene):
+    """Returns the frozen clouds of a scene."""
+    return [obj for obj in scene.objects if FROZEN_PROPERTY in obj.keys()]
+
+
+def get_saved_ms(scene):
+    """Returns the evaluation time saved on the current frame, in milliseconds."""
+    return sum(obj[FROZEN_PROPERTY]["saved_ms"] for obj in get_frozen(scene)
+               if get_run(obj[FROZEN_PROPERTY], scene.frame_current) is not None)
+
+
+@persistent
+def on_frame_change(scene, *args):
+    """Swaps each frozen cloud to the frozen mesh of the current frame, or its live stack."""
+    for obj in get_frozen(scene):
+        # A mesh being edited cannot be swapped, the cloud is about to thaw anyway.
+        if obj.mode != 'OBJECT':
+            continue
+        record = obj[FROZEN_PROPERTY]
+        run = get_run(record, scene.frame_current)
+        if run is None:
+            set_live(obj, record)
+        else:
+            set_frozen(obj, run["mesh"])
+        swapped.add(obj.name)
+
+
+@persistent
+def on_frame_change_post(scene, *args):
+    """Forgets the swaps of this frame once it has been evaluated."""
+    swapped.clear()
+
+
+def thaw_editing():
+    """Thaws the frozen clouds entered in an editing mode, entering the mode again on their live mesh."""
+    clouds = [bpy.data.objects.get(name) for name in sorted(editing)]
+    editing.clear()
+    clouds = [obj for obj in clouds if obj is not None and FROZEN_PROPERTY in obj.keys() and obj.mode != 'OBJECT']
+    if not clouds:
+        return None
+
+    # The mesh of an object in an editing mode cannot be swapped.
+    mode = clouds[0].mode
+    try:
+        bpy.ops.object.mode_set(mode='OBJECT')
+        for obj in clouds:
+            thaw(obj)
+        bpy.ops.object.mode_set(mode=mode)
+    except RuntimeError:
+        # No window to switch modes in, try again once there is.
+        editing.update(obj.name for obj in clouds)
+        return 0.5
+    return None
+
+
+@persistent
+def on_depsgraph_update(scene, depsgraph=None):
+    """Thaws frozen clouds whose inputs or meshes were edited."""
+    frozen = get_frozen(scene)
+    if not frozen or depsgraph is None:
+        swapped.clear()
+        return
+
+    # Only clouds whose own data, anchors or texture were updated can have a new signature.
+    updated = {update.id.original for update in depsgraph.updates}
+    reshaped = {update.id.original for update in depsgraph.updates if update.is_updated_geometry}
+    for obj in frozen:
+        record = obj[FROZEN_PROPERTY]
+        # Edits would land on the frozen snapshot and vanish on the next swap.
+        if obj.mode != 'OBJECT':
+            editing.add(obj.name)
+            continue
+        if obj.name not in swapped and (obj.data in reshaped or bpy.data.meshes.get(record["mesh"]) in reshaped):
+            thaw(obj)
+            continue
+
+        edited = obj in updated and obj.name not in swapped
+        if not edited and not any(id_data in updated for id_data in get_inputs(obj)):
+            continue
+        run = get_run(record, scene.frame_current)
+        if run is not None and get_signature(obj) != run["signature"]:
+            thaw(obj)
+    swapped.clear()
+
+    if editing and not bpy.app.timers.is_registered(thaw_editing):
+        bpy.app.timers.register(thaw_editing)
+
+
+@persistent
+def on_save_pre(*args):
+    """Saves the clouds with their live stack."""
+    for scene in bpy.data.scenes:
+        for obj in get_frozen(scene):
+            set_live(obj, obj[FROZEN_PROPERTY])
+
+
+@persistent
+def on_save_post(*args):
+    """Swaps the frozen meshes back in after saving."""
+    for scene in bpy.data.scenes:
+        on_frame_change(scene)
+
+
+class FreezeStaticWeather(bpy.types.Operator):
+    bl_idname = "weather_suite.freeze_static_weather"
+    bl_label = "Freeze Static Clouds"
+    bl_description = "Caches the clouds over the frames where nothing about them changes."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    min_frames: bpy.props.IntProperty(
+        name="Minimum Frames",
+        description="Shortest run of unchanged frames worth freezing",
+        default=24,
+        min=2)
+
+    def execute(self, context):
+        """Freezes the static runs and reports the time saved."""
+        frozen = freeze(context, self.min_frames)
+
+        runs = 0
+        frames = 0
+        saved = 0.0
+        for obj in frozen:
+            record = obj[FROZEN_PROPERTY]
+            run_frames = sum(run["end"] - run["start"] + 1 for run in record["runs"])
+            runs += len(record["runs"])
+            frames += run_frames
+            saved += record["saved_ms"] * run_frames
+
+        self.report({'INFO'}, "Froze {0} clouds in {1} runs over {2} frames, saving about {3:.2f} s "
+                              "of evaluation.".format(len(frozen), runs, frames, saved / 1000))
+        return {'FINISHED'}
+
+
+class ThawWeather(bpy.types.Operator):
+    bl_idname = "weather_suite.thaw_weather"
+    bl_label = "Thaw Clouds"
+    bl_description = "Puts every frozen cloud back on its live modifier stack."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        """Needs a frozen cloud."""
+        return bool(get_frozen(context.scene))
+
+    def execute(self, context):
+        """Thaws every frozen cloud of the scene."""
+        frozen = get_frozen(context.scene)
+        for obj in frozen:
+            thaw(obj)
+        self.report({'INFO'}, "Thawed {0} clouds.".format(len(frozen)))
+        return {'FINISHED'}
+
+
+# Operators registered by this module.
+classes = (FreezeStaticWeather, ThawWeather)
+
+
+def draw_menu(self, context):
+    """Draws the freeze operators in the View menu, with the time saved on this frame."""
+    self.layout.operator(FreezeStaticWeather.bl_idname)
+    if get_frozen(context.scene):
+        self.layout.operator(
+            ThawWeather.bl_idname,
+            text="Thaw Clouds ({0:.1f} ms saved on this frame)".format(get_saved_ms(context.scene)))
+
+
+def register():
+    """Registers the freeze operators and handlers."""
+    for cls in classes:
+        bpy.utils.register_class(cls)
+    bpy.types.VIEW3D_MT_view.append(draw_menu)
+
+    bpy.app.handlers.frame_change_pre.append(on_frame_change)
+    bpy.app.handlers.frame_change_post.append(on_frame_change_post)
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+    bpy.app.handlers.save_pre.append(on_save_pre)
+    bpy.app.handlers.save_post.append(on_save_post)
+
+
+def unregister():
+    """Unregisters the freeze operators and handlers."""
+    if bpy.app.timers.is_registered(thaw_editing):
+        bpy.app.timers.unregister(thaw_editing)
+    editing.clear()
+
+    for handlers, handler in (
+            (bpy.app.handlers.save_post, on_save_post),
+            (bpy.app.handlers.save_pre, on_save_pre),
+            (bpy.app.handlers.depsgraph_update_post, on_depsgraph_update),
+            (bpy.app.handlers.frame_change_post, on_frame_change_post),
+            (bpy.app.handlers.frame_change_pre, on_frame_change)):
+        if handler in handlers:
+            handlers.remove(handler)
+
+    bpy.types.VIEW3D_MT_view.remove(draw_menu)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
@@ -0,0 +1,367 @@
+"""
+Precomputes where and when the rain hits the scene, without particle collisions.
+
+Every rain emitter seeds its drops the way its particle settings describe:
+spread through the volume, over the faces or on the vertices of its
+evaluated mesh, born between the start and end frames, launched with the
+normal, object aligned and random velocity of the settings and falling
+under the scene gravity. Each drop's path over its lifetime is split into
+FALL_SEGMENTS straight pieces that are ray cast in turn against a BVH tree
+of the evaluated receiver meshes, and the hits are stored as a table sorted
+by frame, one row per impact:
+
+    frame        float32   frame the drop lands on
+    object       uint16    index into the receiver names saved with the table
+    face         uint32    polygon of the receiver's evaluated mesh
+    triangle     uint32    loop triangle of the evaluated mesh the hit is in
+    barycentric  float32x3 position of the hit inside that triangle
+
+The table is saved as an .npz file. Wet and wave consumers load it and replay
+the rows of the current frame, instead of running particle collisions. Drops
+are seeded from the particle system seed, so a bake is repeatable, but they
+are not the same drops Blender's particle system emits.
+"""
+
+import os
+
+import bpy
+import numpy as np
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+
+from .instrumentation import timed_section
+
+# Bump when the layout of the saved table changes.
+FORMAT_VERSION = 1
+
+# One row of the impact table.
+IMPACT_DTYPE = np.dtype([
+    ("frame", np.float32),
+    ("object", np.uint16),
+    ("face", np.uint32),
+    ("triangle", np.uint32),
+    ("barycentric", np.float32, 3),
+])
+
+# Name given to the particle system of every rain emitter by Apply Rain.
+RAIN_SYSTEM_NAME = "Rain Particle System"
+
+# Straight pieces a drop's path over its lifetime is split into for ray casting.
+FALL_SEGMENTS = 16
+
+# Candidate points tried per drop when spreading drops through an emitter's volume.
+VOLUME_ATTEMPTS = 8
+
+
+def is_rain_emitter(obj):
+    """Checks if an object emits rain made by Apply Rain."""
+    return RAIN_SYSTEM_NAME in getattr(obj, "particle_systems", {})
+
+
+def read_world_mesh(obj, depsgraph):
+    """Returns the world space vertices and vertex normals, loop triangles and their polygons of an evaluated object."""
+    evaluated = obj.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+    mesh.calc_loop_triangles()
+
+    co = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", co)
+    normals = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("normal", normals)
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int64)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
+    polygons = np.empty(len(mesh.loop_triangles), dtype=np.int64)
+    mesh.loop_triangles.foreach_get("polygon_index", polygons)
+
+    evaluated.to_mesh_clear()
+
+    # The evaluated matrix includes animation, parents and constraints.
+    matrix = np.array(evaluated.matrix_world, dtype=np.float64)
+    co = co.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+    # Normals transform by the inverse transpose, which is the inverse for row vectors.
+    normals = normals.reshape(-1, 3) @ np.linalg.pinv(matrix[:3, :3])
+    normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, np.newaxis]
+
+    return co, normals, triangles.reshape(-1, 3), polygons
+
+
+def build_receivers(objects, depsgraph):
+    """Builds a world space BVH tree of the evaluated receiver meshes.
+
+    Returns the tree, the vertex and triangle arrays it was built from, and the
+    receiver object index and polygon index of every triangle.
+    """
+    vertices, triangles, object_ids, face_ids = [], [], [], []
+    offset = 0
+
+    for index, obj in enumerate(objects):
+        co, _normals, mesh_triangles, polygons = read_world_mesh(obj, depsgraph)
+
+        vertices.append(co.astype(np.float32))
+        triangles.append(mesh_triangles + offset)
+        object_ids.append(np.full(len(polygons), index, dtype=np.uint16))
+        face_ids.append(polygons)
+        offset += len(co)
+
+    vertices = np.concatenate(vertices) if vertices else np.empty((0, 3), dtype=np.float32)
+    triangles = np.concatenate(triangles) if triangles else np.empty((0, 3), dtype=np.int64)
+    tree = BVHTree.FromPolygons(vertices.tolist(), triangles.tolist(), all_triangles=True)
+
+    return tree, vertices, triangles, np.concatenate(object_ids), np.concatenate(face_ids)
+
+
+def sample_faces(vertices, triangles, count, rng):
+    """Returns points spread evenly over the triangles of a mesh, with the normal of the triangle each is on."""
+    a, b, c = (vertices[triangles[:, corner]] for corner in range(3))
+    cross = np.cross(b - a, c - a)
+    areas = np.linalg.norm(cross, axis=1)
+    weights = areas / areas.sum() if areas.sum() > 0 else None
+    chosen = rng.choice(len(triangles), size=count, p=weights)
+
+    # Folding the unit square onto the triangle keeps the points even.
+    u, v = rng.random((2, count))
+    folded = u + v > 1
+    u[folded], v[folded] = 1 - u[folded], 1 - v[folded]
+    points = a[chosen] + u[:, np.newaxis] * (b - a)[chosen] + v[:, np.newaxis] * (c - a)[chosen]
+    normals = cross[chosen] / np.maximum(areas[chosen], 1e-12)[:, np.newaxis]
+    return points, normals
+
+
+def sample_volume(vertices, triangles, count, rng):
+    """Returns points spread evenly through the inside of a closed mesh, with the normal of the nearest face."""
+    tree = BVHTree.FromPolygons(vertices.tolist(), triangles.tolist(), all_triangles=True)
+    low, high = vertices.min(axis=0), vertices.max(axis=0)
+
+    points, normals = [], []
+    for candidate in low + rng.random((count * VOLUME_ATTEMPTS, 3)) * (high - low):
+        location, normal, _index, _distance = tree.find_nearest(candidate)
+        # Inside a closed mesh, the nearest face points away from the point.
+        if location is not None and (location - Vector(candidate)).dot(normal) > 0:
+            points.append(candidate)
+            normals.append(tuple(normal))
+            if len(points) == count:
+                break
+
+    if not points:
+        # A flat or open mesh has no inside, emit from its faces instead.
+        return sample_faces(vertices, triangles, count, rng)
+
+    points, normals = np.array(points), np.array(normals)
+    if len(points) < count:
+        # A thin volume rejected most candidates, reuse the points found.
+        chosen = np.concatenate((np.arange(len(points)), rng.integers(len(points), size=count - len(points))))
+        points, normals = points[chosen], normals[chosen]
+    return points, normals
+
+
+def seed_drops(emitter, depsgraph):
+    """Returns the start positions, start velocities in units per second and birth frames of an emitter's drops."""
+    rain_system = emitter.particle_systems[RAIN_SYSTEM_NAME]
+    settings = rain_system.settings
+    rng = np.random.default_rng(rain_system.seed)
+    count = settings.count
+
+    vertices, vertex_normals, triangles, _polygons = read_world_mesh(emitter, depsgraph)
+    if count == 0 or len(vertices) == 0 or (settings.emit_from != 'VERT' and len(triangles) == 0):
+        return np.empty((0, 3)), np.empty((0, 3)), np.empty(0)
+
+    if settings.emit_from == 'VERT':
+        chosen = rng.integers(len(vertices), size=count)
+        origins, normals = vertices[chosen], vertex_normals[chosen]
+    elif settings.emit_from == 'VOLUME':
+        origins, normals = sample_volume(vertices, triangles, count, rng)
+    else:
+        origins, normals = sample_faces(vertices, triangles, count, rng)
+
+    # Object aligned velocity follows the emitter's axes, scale included, as Blender does.
+    matrix = np.array(emitter.evaluated_get(depsgraph).matrix_world, dtype=np.float64)
+    velocities = (normals * settings.normal_factor
+                  + matrix[:3, :3] @ np.array(settings.object_align_factor, dtype=np.float64)
+                  + rng.uniform(-1, 1, (count, 3)) * settings.factor_random)
+
+    births = settings.frame_start + rng.random(count) * (settings.frame_end - settings.frame_start)
+    return origins, velocities, births
+
+
+def cast_paths(tree, origins, velocities, gravity, seconds):
+    """Casts every drop's path piece by piece, returning (drop, triangle, seconds, location) of each first hit."""
+    times = np.linspace(0, seconds, FALL_SEGMENTS + 1)
+    # Position of every drop at the end of every piece, as (drops, pieces + 1, 3).
+    paths = (origins[:, np.newaxis] + velocities[:, np.newaxis] * times[:, np.newaxis]
+             + 0.5 * gravity * times[:, np.newaxis] ** 2)
+
+    hits = []
+    for drop, points in enumerate(paths):
+        for segment in range(FALL_SEGMENTS):
+            step = points[segment + 1] - points[segment]
+            length = float(np.linalg.norm(step))
+            if length == 0:
+                continue
+            location, _normal, index, distance = tree.ray_cast(points[segment], step, length)
+            if index is not None:
+                # Drops move at a steady speed along a piece, near enough.
+                hits.append((drop, index, times[segment] + distance / length * (times[1] - times[0]), location))
+                break
+    return hits
+
+
+def get_gravity(scene, settings):
+    """Returns the gravity acting on a particle system, in world units per second squared."""
+    if not scene.use_gravity:
+        return np.zeros(3)
+    weights = settings.effector_weights
+    return np.array(scene.gravity, dtype=np.float64) * weights.gravity * weights.all
+
+
+def get_barycentric(points, vertices, triangles):
+    """Returns the barycentric coordinates of points inside their triangles."""
+    a, b, c = (vertices[triangles[:, corner]] for corner in range(3))
+    v0, v1, v2 = b - a, c - a, points - a
+
+    d00 = np.einsum("ij,ij->i", v0, v0)
+    d01 = np.einsum("ij,ij->i", v0, v1)
+    d11 = np.einsum("ij,ij->i", v1, v1)
+    d20 = np.einsum("ij,ij->i", v2, v0)
+    d21 = np.einsum("ij,ij->i", v2, v1)
+
+    # Degenerate triangles have no area, put their hits on the first corner.
+    denominator = d00 * d11 - d01 * d01
+    denominator[denominator == 0] = np.inf
+
+    v = (d11 * d20 - d01 * d21) / denominator
+    w = (d00 * d21 - d01 * d20) / denominator
+    return np.stack((1 - v - w, v, w), axis=1)
+
+
+def cast_rain(emitters, receivers, scene, depsgraph):
+    """Casts the fall path of every drop against the receivers and returns the impact table."""
+    with timed_section("Receiver BVH"):
+        tree, vertices, triangles, object_ids, face_ids = build_receivers(receivers, depsgraph)
+
+    frames_per_second = scene.render.fps / scene.render.fps_base
+    tables = []
+
+    for emitter in emitters:
+        settings = emitter.particle_systems[RAIN_SYSTEM_NAME].settings
+        gravity = get_gravity(scene, settings)
+
+        with timed_section("Ray Cast"):
+            origins, velocities, births = seed_drops(emitter, depsgraph)
+            # Paths end when the drops die, so drops that die before they land never hit anything.
+            hits = cast_paths(tree, origins, velocities, gravity, settings.lifetime / frames_per_second)
+
+        if not hits:
+            continue
+
+        drops = np.array([hit[0] for hit in hits], dtype=np.int64)
+        hit_triangles = np.array([hit[1] for hit in hits], dtype=np.int64)
+        fall_frames = np.array([hit[2] for hit in hits], dtype=np.float64) * frames_per_second
+        locations = np.array([hit[3] for hit in hits], dtype=np.float32)
+
+        table = np.empty(len(hits), dtype=IMPACT_DTYPE)
+        table["frame"] = births[drops] + fall_frames
+        table["object"] = object_ids[hit_triangles]
+        table["face"] = face_ids[hit_triangles]
+        # Triangles are stored per receiver, one after the other, so count from the receiver's first.
+        table["triangle"] = hit_triangles - np.searchsorted(object_ids, object_ids[hit_triangles])
+        table["barycentric"] = get_barycentric(locations, vertices, triangles[hit_triangles])
+        tables.append(table)
+
+    table = np.concatenate(tables) if tables else np.empty(0, dtype=IMPACT_DTYPE)
+    return np.sort(table, order="frame", kind="stable")
+
+
+def save_impacts(path, table, receivers):
+    """Writes an impact table and its receiver names to an .npz file."""
+    np.savez_compressed(
+        path,
+        version=np.array(FORMAT_VERSION),
+        impacts=table,
+        objects=np.array([obj.name for obj in receivers]))
+
+
+def load_impacts(path):
+    """Reads an impact table, returning it with its receiver names."""
+    with np.load(path, allow_pickle=False) as data:
+        if int(data["version"]) != FORMAT_VERSION:
+            raise ValueError("{0} is an impact table version {1}, expected {2}.".format(
+                path, int(data["version"]), FORMAT_VERSION))
+        return data["impacts"], [str(name) for name in data["objects"]]
+
+
+def get_frame_impacts(table, frame_start, frame_end):
+    """Returns the impacts landing from frame_start up to, but not including, frame_end."""
+    start, end = np.searchsorted(table["frame"], (frame_start, frame_end))
+    return table[start:end]
+
+
+def get_vertex_weights(impacts, mesh):
+    """Spreads the impacts on one receiver over its vertices, by barycentric weight.
+
+    The mesh has to be the receiver's evaluated mesh the table was cast against.
+    """
+    mesh.calc_loop_triangles()
+    triangles = np.empty(len(mesh.loop_triangles) * 3, dtype=np.int64)
+    mesh.loop_triangles.foreach_get("vertices", triangles)
+    triangles = triangles.reshape(-1, 3)
+
+    weights = np.zeros(len(mesh.vertices), dtype=np.float32)
+    np.add.at(weights, triangles[impacts["triangle"]].ravel(), impacts["barycentric"].ravel())
+    return weights
+
+
+class BakeRainImpacts(bpy.types.Operator):
+    bl_idname = "weather_suite.bake_rain_impacts"
+    bl_label = "Bake Rain Impacts"
+    bl_description = "Ray casts the rain of every emitter onto the selected meshes and saves the hits."
+    bl_options = {'REGISTER'}
+
+    filepath: bpy.props.StringProperty(
+        name="File Path",
+        description="Impact table to write",
+        default="//rain_impacts.npz",
+        subtype="FILE_PATH")
+
+    @classmethod
+    def poll(cls, context):
+        """Needs rain and something for it to land on."""
+        return (any(is_rain_emitter(obj) for obj in context.scene.objects)
+                and any(obj.type == 'MESH' and not is_rain_emitter(obj) for obj in context.selected_objects))
+
+    def execute(self, context):
+        """Casts the rain and writes the table."""
+        scene = context.scene
+        emitters = [obj for obj in scene.objects if is_rain_emitter(obj)]
+        receivers = [obj for obj in context.selected_objects if obj.type == 'MESH' and not is_rain_emitter(obj)]
+
+        table = cast_rain(emitters, receivers, scene, context.evaluated_depsgraph_get())
+
+        path = bpy.path.abspath(self.filepath)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        save_impacts(path, table, receivers)
+
+        self.report({'INFO'}, "Saved {0} impacts on {1} objects to {2}".format(len(table), len(receivers), path))
+        return {'FINISHED'}
+
+
+# Operators registered by this module.
+classes = (BakeRainImpacts,)
+
+
+def draw_menu(self, context):
+    """Draws the impact bake in the Add menu, next to the weather operators."""
+    self.layout.operator(BakeRainImpacts.bl_idname, icon="MOD_FLUIDSIM")
+
+
+def register():
+    """Registers the impact bake operator."""
+    for cls in classes:
+        bpy.utils.register_class(cls)
+    bpy.types.VIEW3D_MT_add.append(draw_menu)
+
+
+def unregister():
+    """Unregisters the impact bake operator."""
+    bpy.types.VIEW3D_MT_add.remove(draw_menu)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
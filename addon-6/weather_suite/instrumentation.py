@@ -0,0 +1,216 @@
+"""
+Times the weather operators and their sections, and exports them as a Chrome trace.
+
+Operators wrap their execute with timed_operator and each #SECTION block with
+timed_section. Nothing is measured until instrumentation is enabled, so the
+wrappers cost a single flag check when it is off.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+import bpy
+
+# Data collections counted when checking how many datablocks a section created.
+DATA_COLLECTIONS = (
+    "objects", "meshes", "materials", "textures", "particles",
+    "collections", "node_groups", "volumes", "images",
+)
+
+# Set WEATHER_SUITE_TRACE=1 to start measuring as soon as Blender starts.
+enabled = os.environ.get("WEATHER_SUITE_TRACE", "") not in ("", "0")
+
+# Finished trace events, in Chrome trace-event format.
+events = []
+
+# Number of bpy.ops calls made while enabled.
+ops_calls = 0
+
+# Shared no-op context handed out while disabled.
+_null_section = nullcontext()
+
+# The bpy.ops call function before it was wrapped for counting.
+_original_op_call = None
+
+
+def count_datablocks():
+    """Returns the total number of datablocks in the counted collections."""
+    return sum(len(getattr(bpy.data, name)) for name in DATA_COLLECTIONS if hasattr(bpy.data, name))
+
+
+def _counting_op_call(*args, **kwargs):
+    """Counts a bpy.ops call, then runs it."""
+    global ops_calls
+    ops_calls += 1
+    return _original_op_call(*args, **kwargs)
+
+
+def _patch_ops():
+    """Wraps the function every bpy.ops call goes through so calls can be counted."""
+    global _original_op_call
+    ops_module = sys.modules.get("bpy.ops")
+    if _original_op_call is None and hasattr(ops_module, "_op_call"):
+        _original_op_call = ops_module._op_call
+        ops_module._op_call = _counting_op_call
+
+
+def _unpatch_ops():
+    """Restores the original bpy.ops call function."""
+    global _original_op_call
+    if _original_op_call is not None:
+        sys.modules["bpy.ops"]._op_call = _original_op_call
+        _original_op_call = None
+
+
+def enable():
+    """Starts measuring operators and sections."""
+    global enabled
+    enabled = True
+    _patch_ops()
+
+
+def disable():
+    """Stops measuring, keeping the events recorded so far."""
+    global enabled
+    enabled = False
+    _unpatch_ops()
+
+
+def clear():
+    """Discards every recorded event."""
+    events.clear()
+
+
+@contextmanager
+def _measure(name, category):
+    """Records a complete trace event for the wrapped block."""
+    start_ops = ops_calls
+    start_blocks = count_datablocks()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": start * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {
+                "ops_calls": ops_calls - start_ops,
+                "new_datablocks": count_datablocks() - start_blocks,
+            },
+        })
+
+
+def timed_section(name):
+    """Returns a context manager that times a named section of an operator."""
+    if not enabled:
+        return _null_section
+    return _measure(name, "section")
+
+
+def timed_operator(execute):
+    """Decorates an operator's execute so every run is timed."""
+    @wraps(execute)
+    def wrapper(self, context):
+        if not enabled:
+            return execute(self, context)
+        with _measure(self.bl_idname, "operator"):
+            return execute(self, context)
+    return wrapper
+
+
+def summary():
+    """Returns the total time, bpy.ops calls and new datablocks for every event name."""
+    totals = {}
+    for event in events:
+        total = totals.setdefault(
+            event["name"], {"calls": 0, "ms": 0.0, "ops_calls": 0, "new_datablocks": 0})
+        total["calls"] += 1
+        total["ms"] += event["dur"] / 1000.0
+        total["ops_calls"] += event["args"]["ops_calls"]
+        total["new_datablocks"] += event["args"]["new_datablocks"]
+    return totals
+
+
+def export_chrome_trace(filepath):
+    """Writes the recorded events as Chrome trace-event JSON, viewable in chrome://tracing or Perfetto."""
+    with open(filepath, "w") as trace_file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, trace_file)
+    return filepath
+
+
+class ToggleInstrumentation(bpy.types.Operator):
+    bl_idname = "weather_suite.toggle_instrumentation"
+    bl_label = "Toggle Weather Instrumentation"
+    bl_description = "Starts or stops timing the weather operators."
+    bl_options = {'REGISTER'}
+
+    def execute(self, context):
+        """Flips instrumentation on or off."""
+        if enabled:
+            disable()
+            self.report({'INFO'}, "Weather instrumentation stopped, {0} events recorded.".format(len(events)))
+        else:
+            enable()
+            self.report({'INFO'}, "Weather instrumentation started.")
+        return {'FINISHED'}
+
+
+class ExportTrace(bpy.types.Operator):
+    bl_idname = "weather_suite.export_trace"
+    bl_label = "Export Weather Trace"
+    bl_description = "Saves the recorded operator timings as a Chrome trace."
+    bl_options = {'REGISTER'}
+
+    filepath: bpy.props.StringProperty(subtype="FILE_PATH")
+
+    def execute(self, context):
+        """Writes the trace to the chosen file."""
+        export_chrome_trace(bpy.path.ensure_ext(self.filepath, ".json"))
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        """Opens the file browser."""
+        self.filepath = "weather_trace.json"
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+
+
+# Operators registered by this module.
+classes = (ToggleInstrumentation, ExportTrace)
+
+
+def draw_menu(self, context):
+    """Draws the instrumentation operators in the File menu."""
+    self.layout.operator(
+        ToggleInstrumentation.bl_idname,
+        text="Stop Weather Instrumentation" if enabled else "Start Weather Instrumentation")
+    self.layout.operator(ExportTrace.bl_idname)
+
+
+def register():
+    """Registers the instrumentation operators."""
+    for cls in classes:
+        bpy.utils.register_class(cls)
+    bpy.types.TOPBAR_MT_file.append(draw_menu)
+
+    if enabled:
+        _patch_ops()
+
+
+def unregister():
+    """Unregisters the instrumentation operators."""
+    _unpatch_ops()
+    bpy.types.TOPBAR_MT_file.remove(draw_menu)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
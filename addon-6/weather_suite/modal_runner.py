@@ -0,0 +1,146 @@
+"""
+Runs an FX operator over a large selection a few objects at a time.
+
+Operators mix in TimeSlicedOperator and implement targets, apply and,
+if the work can be undone, revert and restore. apply returns what a
+cancelled run has to undo on the object:
+
+    True    a new setup was created, revert takes it off again
+    dict    an existing setup was updated, restore puts this previous config back
+    None    the object was left as it was
+
+Invoked from the UI, the selection is processed in slices that fit in a
+per-tick time budget, showing progress and cancelling with ESC. An error
+in apply rolls back the same way as ESC before it is reported. Executed
+from scripts, everything runs at once.
+"""
+
+import time
+
+from .instrumentation import timed_operator, timed_section
+
+
+class TimeSlicedOperator:
+    """Mixin for operators that apply an effect to every selected object."""
+
+    # Seconds of work done per timer tick, small enough to keep the UI responsive.
+    time_budget = 0.05
+
+    # Selections up to this size run at once, without the modal overhead.
+    modal_threshold = 64
+
+    def targets(self, context):
+        """Returns the objects to process, by default the selected meshes."""
+        return [obj for obj in context.selected_objects if obj.type == 'MESH']
+
+    def setup(self, context):
+        """Prepares data shared by every object, runs once before the first apply."""
+
+    def apply(self, context, obj):
+        """Applies the effect to one object, returning True, the previous config or None. Operators override it."""
+
+    # Takes a setup apply created off an object, or None if a cancelled run is kept as is.
+    revert = None
+
+    # Puts the config an updated setup had before back, as restore(context, obj, config), or None.
+    restore = None
+
+    @timed_operator
+    def execute(self, context):
+        """Applies the effect to every target in one go."""
+        # Setup may change the selection, so collect the targets first.
+        targets = self.targets(context)
+        self.setup(context)
+        for obj in targets:
+            self.apply(context, obj)
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        """Starts processing the targets over several timer ticks."""
+        self._pending = self.targets(context)
+        if len(self._pending) <= self.modal_threshold:
+            return self.execute(context)
+
+        self.setup(context)
+        self._pending.reverse()
+        self._processed = 0
+        # (object, what apply returned) for the objects a cancel has to undo.
+        self._done = []
+        self._total = len(self._pending)
+
+        window_manager = context.window_manager
+        self._timer = window_manager.event_timer_add(0.01, window=context.window)
+        window_manager.modal_handler_add(self)
+        window_manager.progress_begin(0, self._total)
+
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        """Processes a slice of the targets on every timer tick."""
+        if event.type == 'ESC':
+            return self.cancel_run(context)
+
+        if event.type != 'TIMER':
+            # Keep the user from editing the scene mid run.
+            return {'RUNNING_MODAL'}
+
+        obj = None
+        try:
+            with timed_section(self.bl_idname + " slice"):
+                deadline = time.perf_counter() + self.time_budget
+                while self._pending and time.perf_counter() < deadline:
+                    obj = self._pending.pop()
+                    undo = self.apply(context, obj)
+                    self._processed += 1
+                    if undo:
+                        self._done.append((obj, undo))
+        except Exception as error:
+            # Blender would drop the modal and leave the timer, progress and status text behind.
+            self.roll_back(context)
+            self.finish(context)
+            self.report({'ERROR'}, "{0} failed on {1}: {2}".format(self.bl_label, obj.name, error))
+            return {'CANCELLED'}
+
+        context.window_manager.progress_update(self._processed)
+        context.workspace.status_text_set("{0}: {1}/{2} objects, ESC to cancel".format(
+            self.bl_label, self._processed, self._total))
+
+        if self._pending:
+            return {'RUNNING_MODAL'}
+
+        self.finish(context)
+        return {'FINISHED'}
+
+    def cancel_run(self, context):
+        """Stops on ESC, rolling back the objects done so far when possible."""
+        if self.revert is None:
+            # Keep what was done as a single undo step.
+            self.finish(context)
+            self.report({'WARNING'}, "{0} stopped after {1}/{2} objects.".format(
+                self.bl_label, self._processed, self._total))
+            return {'FINISHED'}
+
+        self.roll_back(context)
+        self.finish(context)
+        self.report({'WARNING'}, "{0} cancelled.".format(self.bl_label))
+        return {'CANCELLED'}
+
+    def roll_back(self, context):
+        """Undoes the objects done so far, if the operator can revert them."""
+        if self.revert is None:
+            return
+
+        # Objects that were set up already only get their previous config back.
+        for obj, undo in reversed(self._done):
+            if undo is True:
+                self.revert(context, obj)
+            elif self.restore is not None:
+                self.restore(context, obj, undo)
+        self._done = []
+
+    def finish(self, context):
+        """Removes the timer and progress display."""
+        window_manager = context.window_manager
+        window_manager.event_timer_remove(self._timer)
+        window_manager.progress_end()
+        context.workspace.status_text_set(None)
@@ -0,0 +1,86 @@
+"""
+Records how long each add-on in the suite costs Blender at startup.
+"""
+
+import datetime
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import bpy
+
+# Number of startup runs kept in the report file.
+REPORT_HISTORY = 100
+
+# Name of the report file inside the Blender config directory.
+REPORT_FILENAME = "weather_suite_startup.json"
+
+
+class StartupProfiler:
+    """Collects import, register() and load_post handler times for every add-on."""
+
+    def __init__(self):
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self.timings = {}
+
+    def record(self, addon, phase, seconds):
+        """Adds a measured time to an add-on's phase."""
+        entry = self.timings.setdefault(
+            addon, {"import": 0.0, "register": 0.0, "load_post": []})
+
+        # Handlers run on every file load, so keep each call.
+        if phase == "load_post":
+            entry["load_post"].append(seconds)
+        else:
+            entry[phase] += seconds
+
+    @contextmanager
+    def measure(self, addon, phase):
+        """Times the wrapped block and records it against the add-on."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(addon, phase, time.perf_counter() - start)
+
+    def as_dict(self):
+        """Returns this run's timings as a JSON compatible dict."""
+        return {
+            "started": self.started,
+            "blender": bpy.app.version_string,
+            "addons": self.timings,
+            "total": sum(
+                entry["import"] + entry["register"] + sum(entry["load_post"])
+                for entry in self.timings.values()),
+        }
+
+    def write_report(self, path=None):
+        """Writes this run into the report file, replacing any earlier copy of the same run."""
+        if path is None:
+            path = get_report_path()
+
+        # Load the history of earlier runs.
+        runs = []
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as report_file:
+                    runs = json.load(report_file).get("runs", [])
+            except (OSError, ValueError):
+                runs = []
+
+        # Lazily loaded add-ons update the report, so replace this run if it is already there.
+        runs = [run for run in runs if run.get("started") != self.started]
+        runs.append(self.as_dict())
+
+        with open(path, "w") as report_file:
+            json.dump({"runs": runs[-REPORT_HISTORY:]}, report_file, indent=2)
+
+        return path
+
+
+def get_report_path():
+    """Returns the path of the startup report in the Blender config directory."""
+    config_dir = bpy.utils.user_resource('CONFIG')
+    os.makedirs(config_dir, exist_ok=True)
+    return os.path.join(config_dir, REPORT_FILENAME)
@@ -0,0 +1,434 @@
+"""
+Quantized, compressed cache of the rain particles.
+
+Bake the visible rain of every emitter in a shot, one .wrc file per emitter:
+    blender --background shot.blend --python addon-6/weather_suite/rain_cache.py -- --output //rain_cache/
+
+Check the error bounds and size on synthetic rain, without Blender:
+    python addon-6/weather_suite/rain_cache.py --verify --particles 10000 --frames 96
+
+Every frame stores the drops alive on it:
+
+    ids         sorted particle indices, the first in full and the rest as
+                deltas in the smallest unsigned type that fits them
+    bounds      float32 minimum and maximum corner of the frame's drops
+    positions   uint16 offsets within the bounds, per axis
+    velocities  float16
+
+Frames are grouped into chunks of CHUNK_FRAMES, each compressed with zlib,
+and an offset table gives the start of every chunk. The file is memory
+mapped, so only the chunks played back are read from disk. Decoding a frame
+decompresses its chunk once and turns it back into arrays with NumPy, so
+the frames after it in playback cost a slice.
+
+Error bounds, from the encoding:
+
+    ids         exact
+    positions   at most (max - min) / 65535 / 2 per axis, half a step of the
+                frame's bounds, plus one float32 step at the largest
+                coordinate for the decoded float32; 0.15 mm per axis for rain
+                spread over 20 m
+    velocities  at most 2 ** -11 of the component (float16) for components
+                of 2 ** -14 (6.1e-5) units per second and up, and 2 ** -25
+                below, where float16 has evenly spaced subnormals; components
+                must stay under 65504 units per second
+
+Positions are quantized and decoded in float64, so nothing but the final
+float32 rounding adds to half a step. --verify measures both against
+synthetic rain, along with the size against float32 positions and
+velocities with uint32 ids, and the decode time.
+
+Nothing in the add-on reads the cache back during playback yet. RainCache
+is for scripts and tools that replay the baked drops themselves.
+"""
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+import numpy as np
+
+# First bytes of every rain cache file.
+MAGIC = b"WRC1"
+
+# Bump when the layout of the file changes.
+FORMAT_VERSION = 1
+
+# Magic, version, first frame, frame count, frames per chunk.
+HEADER = struct.Struct("<4sHiII")
+
+# Drops, first id and id delta type code of a frame.
+FRAME_HEADER = struct.Struct("<IIB")
+
+# Id delta types by the code stored in the frame header.
+DELTA_TYPES = {0: np.dtype(np.uint8), 1: np.dtype(np.uint16), 2: np.dtype(np.uint32)}
+
+# Frames compressed together.
+CHUNK_FRAMES = 16
+
+# zlib level, fast enough to bake while playing back.
+COMPRESSION_LEVEL = 6
+
+# Largest quantized position.
+QUANTIZE_STEPS = 65535
+
+# Relative float16 rounding error, and the absolute one of its subnormals under 2 ** -14.
+VELOCITY_RELATIVE_ERROR = 2 ** -11
+VELOCITY_ABSOLUTE_ERROR = 2 ** -25
+
+# Bytes per drop of the uncompressed reference: uint32 id, float32 position and velocity.
+RAW_DROP_SIZE = 4 + 12 + 12
+
+
+def encode_frame(ids, positions, velocities):
+    """Encodes the drops of one frame."""
+    order = np.argsort(ids, kind="stable")
+    ids = np.asarray(ids, dtype=np.int64)[order]
+    positions = np.asarray(positions, dtype=np.float32).reshape(-1, 3)[order]
+    velocities = np.asarray(velocities, dtype=np.float32).reshape(-1, 3)[order]
+
+    if len(ids) == 0:
+        return FRAME_HEADER.pack(0, 0, 0)
+
+    deltas = np.diff(ids)
+    code = 0 if deltas.size == 0 or deltas.max() <= 0xFF else 1 if deltas.max() <= 0xFFFF else 2
+
+    # The bounds are stored as float32, the offsets within them are worked out in float64.
+    low = positions.min(axis=0).astype(np.float64)
+    high = positions.max(axis=0).astype(np.float64)
+    extent = np.where(high > low, high - low, 1)
+    quantized = np.round((positions - low) / extent * QUANTIZE_STEPS).astype(np.uint16)
+
+    return b"".join((
+        FRAME_HEADER.pack(len(ids), int(ids[0]), code),
+        deltas.astype(DELTA_TYPES[code]).tobytes(),
+        np.concatenate((low, high)).astype(np.float32).tobytes(),
+        quantized.tobytes(),
+        velocities.astype(np.float16).tobytes(),
+    ))
+
+
+def get_position_bound(positions):
+    """Returns the largest position error per axis of a frame's drops after a round trip."""
+    low = positions.min(axis=0)
+    high = positions.max(axis=0)
+    half_step = (high.astype(np.float64) - low) / QUANTIZE_STEPS / 2
+    # The float32 step above the largest coordinate also covers rounding across a power of two.
+    largest = np.maximum(np.abs(low), np.abs(high)).astype(np.float32)
+    return half_step + np.spacing(largest).astype(np.float64)
+
+
+def get_velocity_bound(velocities):
+    """Returns the largest error of every velocity component after a round trip."""
+    return np.maximum(np.abs(velocities.astype(np.float64)) * VELOCITY_RELATIVE_ERROR, VELOCITY_ABSOLUTE_ERROR)
+
+
+def decode_frame(buffer, offset):
+    """Decodes one frame from a chunk, returning (ids, positions, velocities) and the next offset."""
+    count, first_id, code = FRAME_HEADER.unpack_from(buffer, offset)
+    offset += FRAME_HEADER.size
+    if count == 0:
+        return (np.empty(0, dtype=np.int64), np.empty((0, 3), dtype=np.float32),
+                np.empty((0, 3), dtype=np.float32)), offset
+
+    delta_type = DELTA_TYPES[code]
+    deltas = np.frombuffer(buffer, dtype=delta_type, count=count - 1, offset=offset)
+    offset += deltas.nbytes
+    ids = np.empty(count, dtype=np.int64)
+    ids[0] = first_id
+    np.cumsum(deltas, out=ids[1:])
+    ids[1:] += first_id
+
+    bounds = np.frombuffer(buffer, dtype=np.float32, count=6, offset=offset)
+    offset += bounds.nbytes
+    low, high = bounds[:3].astype(np.float64), bounds[3:].astype(np.float64)
+    extent = np.where(high > low, high - low, 1)
+
+    quantized = np.frombuffer(buffer, dtype=np.uint16, count=count * 3, offset=offset).reshape(-1, 3)
+    offset += quantized.nbytes
+    positions = quantized * (extent / QUANTIZE_STEPS) + low
+
+    velocities = np.frombuffer(buffer, dtype=np.float16, count=count * 3, offset=offset).reshape(-1, 3)
+    offset += velocities.nbytes
+
+    return (ids, positions.astype(np.float32), velocities.astype(np.float32)), offset
+
+
+class RainCacheWriter:
+    """Writes a rain cache frame by frame, compressing every full chunk."""
+
+    def __init__(self, path, frame_start, frame_count):
+        self.path = path
+        self.frame_start = frame_start
+        self.frame_count = frame_count
+        self.chunk_count = (frame_count + CHUNK_FRAMES - 1) // CHUNK_FRAMES
+        self.chunk_offsets = []
+        self.pending = []
+        self.next_frame = frame_start
+        self.raw_size = 0
+
+        # Write to a temporary file, so a failed bake never replaces a good cache.
+        self.file = open(path + ".tmp", "wb")
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION, frame_start, frame_count, CHUNK_FRAMES))
+        self.file.write(bytes(8 * (self.chunk_count + 1)))
+
+    def write(self, frame, ids, positions, velocities):
+        """Adds the drops of the next frame."""
+        if frame != self.next_frame:
+            raise ValueError("{0}: frame {1} written, expected {2}.".format(self.path, frame, self.next_frame))
+        self.next_frame += 1
+
+        self.raw_size += len(ids) * RAW_DROP_SIZE
+        self.pending.append(encode_frame(ids, positions, velocities))
+        if len(self.pending) == CHUNK_FRAMES:
+            self.flush()
+
+    def flush(self):
+        """Compresses and writes the pending frames as one chunk."""
+        if not self.pending:
+            return
+        self.chunk_offsets.append(self.file.tell())
+        self.file.write(zlib.compress(b"".join(self.pending), COMPRESSION_LEVEL))
+        self.pending = []
+
+    def close(self):
+        """Writes the last chunk and the chunk offsets, then puts the file in place."""
+        self.flush()
+        if self.next_frame != self.frame_start + self.frame_count:
+            raise ValueError("{0}: {1} of {2} frames written.".format(
+                self.path, self.next_frame - self.frame_start, self.frame_count))
+
+        # The extra offset marks the end of the last chunk.
+        offsets = np.array(self.chunk_offsets + [self.file.tell()], dtype=np.uint64)
+        self.file.seek(HEADER.size)
+        self.file.write(offsets.tobytes())
+        self.file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+
+class RainCache:
+    """Reads frames of a memory-mapped rain cache, keeping the last decoded chunk for playback."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.frame_start, self.frame_count, self.chunk_frames = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.chunk_offsets = None
+            self.close()
+            raise ValueError("{0} is not a version {1} rain cache.".format(path, FORMAT_VERSION))
+
+        chunk_count = (self.frame_count + self.chunk_frames - 1) // self.chunk_frames
+        self.chunk_offsets = np.frombuffer(self.map, dtype=np.uint64, count=chunk_count + 1, offset=HEADER.size)
+
+        # Index of the decoded chunk and the start of each of its frames.
+        self.chunk_index = None
+        self.chunk = None
+        self.frame_offsets = None
+
+    def load_chunk(self, index):
+        """Decompresses a chunk and finds where each of its frames starts."""
+        start, end = int(self.chunk_offsets[index]), int(self.chunk_offsets[index + 1])
+        # Slicing the map reads just this chunk from disk.
+        self.chunk = zlib.decompress(self.map[start:end])
+        self.chunk_index = index
+
+        self.frame_offsets = []
+        offset = 0
+        while offset < len(self.chunk):
+            self.frame_offsets.append(offset)
+            _, offset = decode_frame(self.chunk, offset)
+
+    def frame(self, frame):
+        """Returns (ids, positions, velocities) of the drops alive on a frame."""
+        index = frame - self.frame_start
+        if not 0 <= index < self.frame_count:
+            raise IndexError("{0}: frame {1} is not cached.".format(self.path, frame))
+
+        if index // self.chunk_frames != self.chunk_index:
+            self.load_chunk(index // self.chunk_frames)
+        drops, _ = decode_frame(self.chunk, self.frame_offsets[index % self.chunk_frames])
+        return drops
+
+    def close(self):
+        """Unmaps and closes the file."""
+        # The offset table is a view into the map, which cannot close while it is alive.
+        self.chunk_offsets = None
+        self.map.close()
+        self.file.close()
+
+
+def read_particles(particle_system):
+    """Returns the ids, positions and velocities of the alive particles of an evaluated particle system."""
+    particles = particle_system.particles
+    count = len(particles)
+
+    positions = np.empty(count * 3, dtype=np.float32)
+    particles.foreach_get("location", positions)
+    velocities = np.empty(count * 3, dtype=np.float32)
+    particles.foreach_get("velocity", velocities)
+    alive = np.fromiter((particle.alive_state == 'ALIVE' for particle in particles), dtype=bool, count=count)
+
+    return np.flatnonzero(alive), positions.reshape(-1, 3)[alive], velocities.reshape(-1, 3)[alive]
+
+
+def bake(output):
+    """Bakes the visible rain of every emitter in the open file over the scene frame range."""
+    import bpy
+
+    from weather_suite.impacts import RAIN_SYSTEM_NAME, is_rain_emitter
+
+    scene = bpy.context.scene
+    directory = bpy.path.abspath(output)
+    os.makedirs(directory, exist_ok=True)
+
+    emitters = [obj for obj in scene.objects if is_rain_emitter(obj)]
+    frame_count = scene.frame_end - scene.frame_start + 1
+    writers = {
+        obj.name: RainCacheWriter(
+            os.path.join(directory, bpy.path.clean_name(obj.name) + ".wrc"), scene.frame_start, frame_count)
+        for obj in emitters
+    }
+
+    for frame in range(scene.frame_start, scene.frame_end + 1):
+        scene.frame_set(frame)
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        for obj in emitters:
+            particle_system = obj.evaluated_get(depsgraph).particle_systems[RAIN_SYSTEM_NAME]
+            writers[obj.name].write(frame, *read_particles(particle_system))
+
+    for name, writer in writers.items():
+        writer.close()
+        size = os.path.getsize(writer.path)
+        print("{0}: {1:.1f} MB, {2:.1f}x smaller than float32".format(
+            name, size / 1024 ** 2, writer.raw_size / size if size else 0))
+
+
+def make_synthetic_rain(particles, frames, seed=0):
+    """Yields (ids, positions, velocities) of rain falling through a 20 m box, with drops dying and respawning."""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform((-10, -10, 0), (10, 10, 20), (particles, 3)).astype(np.float32)
+    velocities = np.zeros((particles, 3), dtype=np.float32)
+    # A faint steady wind, small enough to fall in the float16 subnormals.
+    velocities[:, :2] = (3e-5, -2e-6)
+    velocities[:, 2] = rng.uniform(-9, -6, particles)
+    step = 1 / 24
+
+    for _ in range(frames):
+        alive = positions[:, 2] > 0
+        yield np.flatnonzero(alive), positions[alive], velocities[alive]
+
+        positions += velocities * step
+        velocities[:, 2] -= 9.81 * step
+        # Drops that landed come back at the top.
+        landed = positions[:, 2] <= 0
+        positions[landed, 2] = 20
+        velocities[landed, 2] = rng.uniform(-9, -6, np.count_nonzero(landed))
+
+
+def measure(particles, frames):
+    """Round-trips synthetic rain through the format, returning its errors, bounds, size and decode speed."""
+    frames_data = list(make_synthetic_rain(particles, frames))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "verify.wrc")
+        writer = RainCacheWriter(path, 1, frames)
+        for frame, drops in enumerate(frames_data, 1):
+            writer.write(frame, *drops)
+        writer.close()
+        size = os.path.getsize(path)
+
+        cache = RainCache(path)
+        began = time.perf_counter()
+        decoded = [cache.frame(frame) for frame in range(1, frames + 1)]
+        decode_ms = (time.perf_counter() - began) * 1000 / frames
+        cache.close()
+
+    result = {
+        "ids_exact": True,
+        "position_error": 0.0,
+        "position_bound": 0.0,
+        "positions_within_bound": True,
+        "velocity_error": 0.0,
+        "velocity_bound": 0.0,
+        "velocities_within_bound": True,
+        "size": size,
+        "raw_size": sum(len(ids) for ids, _, _ in frames_data) * RAW_DROP_SIZE,
+        "decode_ms": decode_ms,
+    }
+    for (ids, positions, velocities), (cached_ids, cached_positions, cached_velocities) in zip(frames_data, decoded):
+        if not np.array_equal(ids, cached_ids):
+            result["ids_exact"] = False
+            continue
+        if len(ids) == 0:
+            continue
+
+        # Every frame has its own bounds, so check each against its own.
+        error = np.abs(cached_positions.astype(np.float64) - positions).max(axis=0)
+        bound = get_position_bound(positions)
+        result["positions_within_bound"] &= bool((error <= bound).all())
+        result["position_error"] = max(result["position_error"], float(error.max()))
+        result["position_bound"] = max(result["position_bound"], float(bound.max()))
+
+        # Small components have an absolute floor, so check every component against its own bound.
+        error = np.abs(cached_velocities.astype(np.float64) - velocities)
+        bound = get_velocity_bound(velocities)
+        result["velocities_within_bound"] &= bool((error <= bound).all())
+        result["velocity_error"] = max(result["velocity_error"], float(error.max()))
+        result["velocity_bound"] = max(result["velocity_bound"], float(bound.max()))
+    return result
+
+
+def verify(particles, frames):
+    """Reports the errors, size and decode speed of synthetic rain, failing when an error is above its bound."""
+    result = measure(particles, frames)
+    if not result["ids_exact"]:
+        print("FAILED: ids differ")
+        return 1
+
+    print("ids exact")
+    print("position error {0:.3g} (bound {1:.3g})".format(result["position_error"], result["position_bound"]))
+    print("velocity error {0:.3g} (bound {1:.3g})".format(
+        result["velocity_error"], result["velocity_bound"]))
+    print("size {0:.2f} MB against {1:.2f} MB float32, {2:.1f}x smaller".format(
+        result["size"] / 1024 ** 2, result["raw_size"] / 1024 ** 2, result["raw_size"] / result["size"]))
+    print("decode {0:.2f} ms per frame".format(result["decode_ms"]))
+
+    if not result["positions_within_bound"] or not result["velocities_within_bound"]:
+        print("FAILED: error above the bound")
+        return 1
+    return 0
+
+
+def parse_args(argv):
+    """Parses the arguments given after "--" on the Blender command line."""
+    parser = argparse.ArgumentParser(description="Bakes or checks the quantized rain particle cache.")
+    parser.add_argument("--output", default="//rain_cache/", help="Folder the rain caches are written to.")
+    parser.add_argument("--verify", action="store_true", help="Round-trip synthetic rain and report the errors.")
+    parser.add_argument("--particles", type=int, default=10000, help="Drops of the synthetic rain.")
+    parser.add_argument("--frames", type=int, default=96, help="Frames of the synthetic rain.")
+    return parser.parse_args(argv)
+
+
+def main():
+    """Verifies the format, or bakes the open file when run in Blender."""
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+
+    if args.verify:
+        sys.exit(verify(args.particles, args.frames))
+
+    bake(args.output)
+
+
+if __name__ == "__main__":
+    # Run as a script, so make the suite importable.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
@@ -0,0 +1,364 @@
+"""
+Emits rain only under the clouds, weighted by how dense the cloud overhead is.
+
+Rain Under Clouds samples the displaced cloud meshes over the footprint of
+each selected rain emitter. In the emitter's local space, a grid of rays is
+cast down and up through every cloud, and the thickness of cloud above each
+cell becomes a density, full at FULL_THICKNESS. Cells thinner than
+MIN_DENSITY are cleared, so only dense cloud rains. The map is written to an
+image texture that masks the density of the rain and impact particle
+systems, mapped over the emitter's bounds, so the drops actually emitted
+follow the sky coverage rather than the emitter's size.
+
+Mesh to Volume fills the cloud mesh, so the mesh thickness stands in for the
+volume density, which Python cannot read. Rebuilding the map restarts the
+rain simulation, so it is never rebuilt on frame changes. Editing a cloud,
+its anchors or texture, or the emitter only marks the map stale; once the
+edits stop for REBUILD_DELAY seconds, a timer rebuilds it if the clouds'
+signature, the same signature freezing uses, or the emitter's transform
+changed. Nothing is rebuilt during playback or rendering, and clouds that
+move over the shot keep the map of the frame it was last built on.
+"""
+
+import hashlib
+import time
+
+import bpy
+import numpy as np
+from bpy.app.handlers import persistent
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+
+from .freeze import get_inputs, get_matrix, get_signature
+from .impacts import RAIN_SYSTEM_NAME, is_rain_emitter
+from .viewport import is_cloud
+
+# Custom property holding an emitter's density map settings and what was added for it.
+DENSITY_PROPERTY = "weather_rain_density"
+
+# Custom property Apply Rain records the emitter's particle systems in.
+RAIN_PROPERTY = "weather_rain"
+
+# Custom property tagging the density images and textures, so the weather cleanup can collect them.
+OWNER_PROPERTY = "weather_owner"
+
+# Cloud thickness, in emitter units, that rains at full density.
+FULL_THICKNESS = 5.0
+
+# Densities below this are thin cloud that does not rain.
+MIN_DENSITY = 0.1
+
+# Seconds without edits before stale density maps are rebuilt.
+REBUILD_DELAY = 0.5
+
+# (scene, emitter) names of the density maps whose clouds or emitter were edited.
+stale = set()
+
+# Time of the last edit that made a map stale.
+_last_edit = 0.0
+
+# Whether a render is running, so stale maps wait for it.
+_rendering = False
+
+
+def get_clouds(scene):
+    """Returns the cloud meshes of a scene, sorted by name so their signature is stable."""
+    return sorted((obj for obj in scene.objects if obj.type == 'MESH' and is_cloud(obj)),
+                  key=lambda obj: obj.name)
+
+
+def get_map_signature(emitter, clouds, resolution):
+    """Returns a digest of everything an emitter's density map depends on."""
+    values = [get_matrix(emitter), tuple(emitter.dimensions), resolution]
+    values += [(cloud.name, get_signature(cloud)) for cloud in clouds]
+    return hashlib.sha1(repr(values).encode()).hexdigest()
+
+
+def build_cloud_tree(cloud, emitter, depsgraph):
+    """Builds a BVH tree of an evaluated cloud in the emitter's local space, returning it with its z range."""
+    evaluated = cloud.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+
+    vertices = np.empty(len(mesh.vertices) * 3, dtype=np.float64)
+    mesh.vertices.foreach_get("co", vertices)
+    matrix = np.array(emitter.matrix_world.inverted() @ cloud.matrix_world, dtype=np.float64)
+    vertices = vertices.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3]
+
+    polygons = [tuple(polygon.vertices) for polygon in mesh.polygons]
+    tree = BVHTree.FromPolygons(vertices.tolist(), polygons)
+    evaluated.to_mesh_clear()
+    return tree, vertices[:, 2].min(), vertices[:, 2].max()
+
+
+def sample_density(emitter, clouds, depsgraph, resolution):
+    """Returns the cloud density over the emitter's local XY bounds, as rows from -Y to +Y."""
+    corners = np.array(emitter.bound_box, dtype=np.float64)
+    low, high = corners.min(axis=0), corners.max(axis=0)
+    # Cell centres, matching how an image spans the bounds.
+    xs = low[0] + (np.arange(resolution) + 0.5) / resolution * (high[0] - low[0])
+    ys = low[1] + (np.arange(resolution) + 0.5) / resolution * (high[1] - low[1])
+
+    thickness = np.zeros((resolution, resolution), dtype=np.float64)
+    for cloud in clouds:
+        tree, bottom, top = build_cloud_tree(cloud, emitter, depsgraph)
+        for row, y in enumerate(ys):
+            for column, x in enumerate(xs):
+                # The top from above and the bottom from below, both along the fall direction.
+                upper, *_ = tree.ray_cast(Vector((x, y, top + 1)), Vector((0, 0, -1)))
+                if upper is None:
+                    continue
+                lower, *_ = tree.ray_cast(Vector((x, y, bottom - 1)), Vector((0, 0, 1)))
+                if lower is not None:
+                    thickness[row, column] += max(0.0, upper.z - lower.z)
+
+    density = np.clip(thickness / FULL_THICKNESS, 0, 1)
+    density[density < MIN_DENSITY] = 0
+    return density
+
+
+def get_rain_settings(emitter):
+    """Returns the particle settings of an emitter's rain and impact systems."""
+    state = emitter.get(RAIN_PROPERTY)
+    names = (state["particle_system"], state.get("impact_system", "")) if state is not None \
+        else (RAIN_SYSTEM_NAME,)
+    return [emitter.particle_systems[name].settings for name in names if name in emitter.particle_systems]
+
+
+def write_density_image(image, density):
+    """Copies a density map into a greyscale image and packs it into the file."""
+    pixels = np.ones((density.shape[0], density.shape[1], 4), dtype=np.float32)
+    pixels[..., :3] = density[..., np.newaxis]
+    image.pixels.foreach_set(pixels.ravel())
+    image.update()
+    # Generated pixels are lost on reload unless packed.
+    image.pack()
+
+
+def follow_clouds(emitter, clouds, depsgraph, resolution):
+    """Builds an emitter's density map and masks its rain with it, returning the sky coverage."""
+    density = sample_density(emitter, clouds, depsgraph, resolution)
+
+    record = emitter.get(DENSITY_PROPERTY)
+    if record is None:
+        name = "{0} Rain Density".format(emitter.name)
+        image = bpy.data.images.new(name, resolution, resolution, float_buffer=True)
+        image[OWNER_PROPERTY] = "weather_suite"
+        texture = bpy.data.textures.new(name, type='IMAGE')
+        texture[OWNER_PROPERTY] = "weather_suite"
+        texture.image = image
+        texture.extension = 'CLIP'
+
+        # Original coordinates span the emitter's bounds, like the map.
+        for settings in get_rain_settings(emitter):
+            slot = settings.texture_slots.add()
+            slot.texture = texture
+            slot.texture_coords = 'ORCO'
+            slot.use_map_time = False
+            slot.use_map_density = True
+            slot.density_factor = 1.0
+
+        record = {"image": image.name, "texture": texture.name}
+    else:
+        record = record.to_dict()
+        image = bpy.data.images[record["image"]]
+        if tuple(image.size) != (resolution, resolution):
+            image.scale(resolution, resolution)
+
+    write_density_image(image, density)
+    # The density is only read at birth, so the rain has to be simulated again.
+    for settings in get_rain_settings(emitter):
+        settings.update_tag()
+
+    record["resolution"] = resolution
+    record["signature"] = get_map_signature(emitter, clouds, resolution)
+    record["coverage"] = float(density.mean())
+    emitter[DENSITY_PROPERTY] = record
+    return record["coverage"]
+
+
+def stop_following(emitter):
+    """Removes an emitter's density map, so it rains from its whole volume again."""
+    record = emitter.get(DENSITY_PROPERTY)
+    if record is None:
+        return
+
+    texture = bpy.data.textures.get(record["texture"])
+    for settings in get_rain_settings(emitter):
+        for index, slot in enumerate(settings.texture_slots):
+            if slot is not None and slot.texture == texture:
+                settings.texture_slots.clear(index)
+
+    if texture is not None:
+        bpy.data.textures.remove(texture)
+    image = bpy.data.images.get(record["image"])
+    if image is not None:
+        bpy.data.images.remove(image)
+
+    del emitter[DENSITY_PROPERTY]
+
+
+def get_followers(scene):
+    """Returns the rain emitters of a scene that follow the clouds."""
+    return [obj for obj in scene.objects if DENSITY_PROPERTY in obj.keys()]
+
+
+def is_playing():
+    """Returns whether any window is playing the animation back."""
+    return any(window.screen is not None and window.screen.is_animation_playing
+               for window in bpy.context.window_manager.windows)
+
+
+def rebuild_stale():
+    """Rebuilds the stale density maps whose signature changed, once editing and playback stopped."""
+    waited = time.monotonic() - _last_edit
+    if waited < REBUILD_DELAY:
+        return REBUILD_DELAY - waited
+    if _rendering or is_playing():
+        return REBUILD_DELAY
+
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    for scene_name, emitter_name in sorted(stale):
+        scene = bpy.data.scenes.get(scene_name)
+        emitter = bpy.data.objects.get(emitter_name)
+        if scene is None or emitter is None or DENSITY_PROPERTY not in emitter.keys():
+            continue
+        clouds = get_clouds(scene)
+        record = emitter[DENSITY_PROPERTY]
+        if clouds and get_map_signature(emitter, clouds, record["resolution"]) != record["signature"]:
+            follow_clouds(emitter, clouds, depsgraph, record["resolution"])
+    stale.clear()
+
+    # Stop until the next edit registers the timer again.
+    return None
+
+
+@persistent
+def on_depsgraph_update(scene, depsgraph=None):
+    """Marks the density maps stale whose clouds or emitter were edited, without touching any data."""
+    global _last_edit
+    followers = get_followers(scene)
+    if not followers or depsgraph is None:
+        return
+
+    updated = {update.id.original for update in depsgraph.updates}
+    clouds = get_clouds(scene)
+    clouds_edited = any(cloud in updated or any(id_data in updated for id_data in get_inputs(cloud))
+                        for cloud in clouds)
+    for emitter in followers:
+        if clouds_edited or emitter in updated:
+            stale.add((scene.name, emitter.name))
+            _last_edit = time.monotonic()
+
+    if stale and not bpy.app.timers.is_registered(rebuild_stale):
+        bpy.app.timers.register(rebuild_stale, first_interval=REBUILD_DELAY)
+
+
+@persistent
+def on_render_pre(*args):
+    """Holds the stale maps back while rendering."""
+    global _rendering
+    _rendering = True
+
+
+@persistent
+def on_render_post(*args):
+    """Lets the stale maps rebuild once the render finished or was cancelled."""
+    global _rendering
+    _rendering = False
+
+
+class FollowClouds(bpy.types.Operator):
+    bl_idname = "weather_suite.follow_clouds"
+    bl_label = "Rain Under Clouds"
+    bl_description = "Emits the selected rain only under dense cloud, weighted by the cloud density."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    resolution: bpy.props.IntProperty(
+        name="Resolution",
+        description="Cells of the density map along each side of the emitter",
+        default=64,
+        min=4,
+        max=1024)
+
+    @classmethod
+    def poll(cls, context):
+        """Needs a selected rain emitter."""
+        return any(is_rain_emitter(obj) for obj in context.selected_objects)
+
+    def execute(self, context):
+        """Builds the density map of every selected emitter and reports the rain left."""
+        clouds = get_clouds(context.scene)
+        if not clouds:
+            self.report({'WARNING'}, "There are no clouds to rain from.")
+            return {'CANCELLED'}
+
+        depsgraph = context.evaluated_depsgraph_get()
+        for obj in context.selected_objects:
+            if not is_rain_emitter(obj):
+                continue
+            coverage = follow_clouds(obj, clouds, depsgraph, self.resolution)
+            count = obj.particle_systems[RAIN_SYSTEM_NAME].settings.count
+            print("{0}: {1:.0%} under cloud, about {2} of {3} drops emitted".format(
+                obj.name, coverage, int(count * coverage), count))
+
+        self.report({'INFO'}, "Rain follows {0} clouds, see the console for the coverage.".format(len(clouds)))
+        return {'FINISHED'}
+
+
+class StopFollowingClouds(bpy.types.Operator):
+    bl_idname = "weather_suite.stop_following_clouds"
+    bl_label = "Rain Everywhere"
+    bl_description = "Lets the selected rain emit from the whole emitter again."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        """Needs a selected emitter that follows the clouds."""
+        return any(DENSITY_PROPERTY in obj.keys() for obj in context.selected_objects)
+
+    def execute(self, context):
+        """Removes the density map of every selected emitter."""
+        for obj in context.selected_objects:
+            stop_following(obj)
+        return {'FINISHED'}
+
+
+# Operators registered by this module.
+classes = (FollowClouds, StopFollowingClouds)
+
+
+def draw_menu(self, context):
+    """Draws the density operators in the Add menu, next to the weather operators."""
+    self.layout.operator(FollowClouds.bl_idname, icon="MOD_FLUIDSIM")
+    self.layout.operator(StopFollowingClouds.bl_idname, icon="MOD_FLUIDSIM")
+
+
+def register():
+    """Registers the density operators and handlers."""
+    for cls in classes:
+        bpy.utils.register_class(cls)
+    bpy.types.VIEW3D_MT_add.append(draw_menu)
+
+    bpy.app.handlers.depsgraph_update_post.append(on_depsgraph_update)
+    bpy.app.handlers.render_pre.append(on_render_pre)
+    bpy.app.handlers.render_complete.append(on_render_post)
+    bpy.app.handlers.render_cancel.append(on_render_post)
+
+
+def unregister():
+    """Unregisters the density operators and handlers."""
+    if bpy.app.timers.is_registered(rebuild_stale):
+        bpy.app.timers.unregister(rebuild_stale)
+    stale.clear()
+
+    for handlers, handler in (
+            (bpy.app.handlers.render_cancel, on_render_post),
+            (bpy.app.handlers.render_complete, on_render_post),
+            (bpy.app.handlers.render_pre, on_render_pre),
+            (bpy.app.handlers.depsgraph_update_post, on_depsgraph_update)):
+        if handler in handlers:
+            handlers.remove(handler)
+
+    bpy.types.VIEW3D_MT_add.remove(draw_menu)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
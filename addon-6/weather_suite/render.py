@@ -0,0 +1,270 @@
+"""
+Renders a weather shot over several headless Blender processes.
+
+    blender --background --python addon-6/weather_suite/render.py -- shot.blend --workers 4 --output //render/
+
+The simulation caches are baked once, into a copy of the shot saved next to
+it as <shot>_baked.blend, so every worker reads the same rain particles and
+Dynamic Paint surfaces instead of simulating them again. The frame range is
+then split into chunks rendered by at most --workers processes at a time,
+logging to <shot>_render_logs. With --memory-budget, a single worker runs
+until one has finished and its peak memory is known, then fewer workers run
+at once when that peak would not fit in the budget.
+Frames per minute and peak RSS are reported for every chunk.
+
+Cloud volumes come from Mesh to Volume modifiers, which have no cache and
+are evaluated by each worker.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+
+
+def bake_caches(baked_path):
+    """Bakes every particle and Dynamic Paint cache of the open file to disk, saved as a copy."""
+    import bpy
+
+    from weather_suite import viewport
+
+    # Disk caches live next to the file they belong to, so save the copy first.
+    bpy.ops.wm.save_as_mainfile(filepath=baked_path)
+
+    # Workers render without the suite's handlers, so undo any viewport preview in the copy.
+    viewport.apply_stored(bpy.context.scene, use_originals=True)
+
+    point_caches = []
+    image_canvases = []
+    for obj in bpy.data.objects:
+        for particle_system in getattr(obj, "particle_systems", []):
+            point_caches.append(particle_system.point_cache)
+        for modifier in obj.modifiers:
+            if modifier.type == 'DYNAMIC_PAINT' and modifier.canvas_settings is not None:
+                for index, surface in enumerate(modifier.canvas_settings.canvas_surfaces):
+                    # Vertex surfaces use a point cache, image sequences have their own baker.
+                    if surface.surface_format == 'VERTEX':
+                        point_caches.append(surface.point_cache)
+                    else:
+                        image_canvases.append((obj, modifier, index))
+
+    scene = bpy.context.scene
+    for point_cache in point_caches:
+        point_cache.use_disk_cache = True
+        point_cache.frame_start = scene.frame_start
+        point_cache.frame_end = scene.frame_end
+
+    bpy.ops.ptcache.bake_all(bake=True)
+
+    # The image sequence baker works on the active surface of the active object.
+    for obj, modifier, index in image_canvases:
+        bpy.context.view_layer.objects.active = obj
+        modifier.canvas_settings.canvas_surfaces.active_index = index
+        bpy.ops.dpaint.bake()
+
+    bpy.ops.wm.save_mainfile()
+    print("Baked {0} caches into {1}".format(len(point_caches) + len(image_canvases), baked_path))
+
+
+def read_frame_range(blender, blend_file):
+    """Asks a headless Blender for the scene frame range."""
+    output = subprocess.check_output([
+        blender, "--background", blend_file, "--python-expr",
+        "import bpy; s = bpy.context.scene; print('FRAME_RANGE', s.frame_start, s.frame_end)",
+    ], universal_newlines=True)
+    for line in output.splitlines():
+        if line.startswith("FRAME_RANGE"):
+            _, start, end = line.split()
+            return int(start), int(end)
+    raise RuntimeError("Could not read the frame range of " + blend_file)
+
+
+def split_frames(start, end, chunk_size):
+    """Splits an inclusive frame range into (start, end) chunks."""
+    return [(frame, min(frame + chunk_size - 1, end)) for frame in range(start, end + 1, chunk_size)]
+
+
+def run_measured(command, log_file):
+    """Runs a process, returning its exit code and peak RSS in bytes, or None where unsupported."""
+    process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+
+    if not hasattr(os, "wait4"):
+        return process.wait(), None
+
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") \
+        else status >> 8
+
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return process.returncode, peak_rss
+
+
+class MemoryGate:
+    """Holds back new workers while the running ones could exhaust the memory budget."""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.running = 0
+        self.peak = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        """Waits until another worker fits in the budget, using the highest peak seen so far."""
+        with self.condition:
+            # Nothing is known about a worker's memory until one finishes, so run them one at a time until then.
+            while (self.budget and self.running
+                   and (not self.peak or (self.running + 1) * self.peak > self.budget)):
+                self.condition.wait()
+            self.running += 1
+
+    def release(self, peak_rss):
+        """Records a finished worker's peak and lets the next one start."""
+        with self.condition:
+            self.running -= 1
+            self.peak = max(self.peak, peak_rss or 0)
+            self.condition.notify_all()
+
+
+def render_chunk(blender, blend_file, output, frames, threads, log_dir, gate):
+    """Renders one chunk of frames and returns its statistics."""
+    start, end = frames
+    command = [
+        blender, "--background", blend_file,
+        "--render-output", output,
+        "--threads", str(threads),
+        "--frame-start", str(start), "--frame-end", str(end),
+        "--render-anim",
+    ]
+
+    gate.acquire()
+    peak_rss = None
+    began = time.perf_counter()
+    try:
+        with open(os.path.join(log_dir, "frames_{0}-{1}.log".format(start, end)), "w") as log_file:
+            returncode, peak_rss = run_measured(command, log_file)
+    finally:
+        gate.release(peak_rss)
+    elapsed = time.perf_counter() - began
+
+    frame_count = end - start + 1
+    return {
+        "frames": [start, end],
+        "returncode": returncode,
+        "seconds": elapsed,
+        "frames_per_minute": frame_count / elapsed * 60 if elapsed > 0 else 0.0,
+        "peak_rss_mb": peak_rss / 1024 ** 2 if peak_rss is not None else None,
+    }
+
+
+def render(args):
+    """Bakes the caches, then renders the frame range over the worker pool."""
+    blend_file = os.path.abspath(args.blend_file)
+    baked_path = os.path.splitext(blend_file)[0] + "_baked.blend"
+    log_dir = os.path.splitext(blend_file)[0] + "_render_logs"
+    os.makedirs(log_dir, exist_ok=True)
+
+    if not args.skip_bake:
+        print("Baking simulation caches...")
+        subprocess.check_call([
+            args.blender, "--background", blend_file,
+            "--python-exit-code", "1",
+            "--python", os.path.abspath(__file__), "--", "--bake-worker", baked_path,
+        ])
+
+    start, end = read_frame_range(args.blender, baked_path)
+    if args.frame_start is not None:
+        start = args.frame_start
+    if args.frame_end is not None:
+        end = args.frame_end
+
+    chunk_size = args.chunk or max(1, math.ceil((end - start + 1) / (args.workers * 4)))
+    chunks = split_frames(start, end, chunk_size)
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    gate = MemoryGate(args.memory_budget * 1024 ** 3 if args.memory_budget else 0)
+
+    print("Rendering frames {0}-{1} in {2} chunks on {3} workers with {4} threads each.".format(
+        start, end, len(chunks), args.workers, threads))
+
+    began = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.workers) as pool:
+        results = list(pool.map(
+            lambda frames: render_chunk(
+                args.blender, baked_path, args.output, frames, threads, log_dir, gate),
+            chunks))
+    elapsed = time.perf_counter() - began
+
+    for result in results:
+        peak = "{0:.0f} MB".format(result["peak_rss_mb"]) if result["peak_rss_mb"] is not None else "n/a"
+        print("frames {0[0]}-{0[1]}: {1:.1f} fpm, peak RSS {2}{3}".format(
+            result["frames"], result["frames_per_minute"], peak,
+            "" if result["returncode"] == 0 else ", FAILED"))
+
+    report = {
+        "frames": [start, end],
+        "workers": args.workers,
+        "seconds": elapsed,
+        "frames_per_minute": (end - start + 1) / elapsed * 60 if elapsed > 0 else 0.0,
+        "chunks": results,
+    }
+    print("Total: {0:.1f} frames per minute".format(report["frames_per_minute"]))
+
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+    return sum(1 for result in results if result["returncode"] != 0)
+
+
+def get_blender_binary():
+    """Returns the running Blender's binary, or None when run from plain Python."""
+    try:
+        import bpy
+    except ImportError:
+        return None
+    return bpy.app.binary_path
+
+
+def parse_args(argv):
+    """Parses the arguments given after "--" on the Blender command line."""
+    parser = argparse.ArgumentParser(description="Renders a weather shot over several Blender processes.")
+    parser.add_argument("blend_file", nargs="?", help="Shot to render.")
+    parser.add_argument("--workers", type=int, default=2, help="Most Blender processes rendering at once.")
+    parser.add_argument("--chunk", type=int, default=0, help="Frames per chunk, by default a quarter per worker.")
+    parser.add_argument("--output", default="//render/", help="Render output path, as Blender's -o.")
+    parser.add_argument("--frame-start", type=int, help="Override the scene's first frame.")
+    parser.add_argument("--frame-end", type=int, help="Override the scene's last frame.")
+    parser.add_argument("--memory-budget", type=float, default=0,
+                        help="Gigabytes all workers may use together, 0 for no limit.")
+    parser.add_argument("--skip-bake", action="store_true", help="Reuse an existing _baked.blend.")
+    parser.add_argument("--report", help="Write the statistics to this JSON file.")
+    parser.add_argument("--blender", default=get_blender_binary(), help="Blender binary for the workers.")
+    parser.add_argument("--bake-worker", metavar="BAKED_PATH", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    """Renders the shot, or bakes it when started as the bake worker."""
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else sys.argv[1:]
+    args = parse_args(argv)
+
+    if args.bake_worker:
+        bake_caches(args.bake_worker)
+        return
+
+    if args.blend_file is None or args.blender is None:
+        sys.exit("A .blend file and a Blender binary (--blender) are required.")
+
+    if render(args):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    # Run as a script, so make the suite importable.
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    main()
@@ -0,0 +1,412 @@
+"""
+Streams baked Dynamic Paint surfaces from memory-mapped, frame-indexed files.
+
+Every wet layer and wave surface is baked into one file per surface:
+
+    header   magic b"WSC1", version, record type, components per element,
+             elements per frame, first frame, frame count (HEADER)
+    offsets  one uint64 per frame, the byte offset of its record or 0 if missing
+    records  one fixed-stride record per frame
+
+Wet layers store their wetmap as RGBA bytes per face corner, wave surfaces
+the deformed vertex positions as float32. Once baked, the surface's Dynamic
+Paint modifier is turned off and a frame change handler copies only the
+current frame out of the mapped file, into the wetmap color layer or a
+"Waves" shape key, with foreach_set. During playback the following frames
+are requested from the OS ahead of time, so nothing is read from disk in the
+handler and the shot never has to fit in memory.
+
+Waves are baked from the whole modifier stack, so they replay correctly when
+Dynamic Paint is the only modifier that moves vertices.
+"""
+
+import mmap
+import os
+import struct
+
+import bpy
+import numpy as np
+from bpy.app.handlers import persistent
+
+from .instrumentation import timed_section
+
+# First bytes of every surface cache file.
+MAGIC = b"WSC1"
+
+# Bump when the layout of the file changes.
+FORMAT_VERSION = 1
+
+# Magic, version, record type, components, elements per frame, first frame, frame count.
+HEADER = struct.Struct("<4sHBBIiI")
+
+# Record types by the code stored in the header.
+RECORD_TYPES = {0: np.dtype(np.float32), 1: np.dtype(np.uint8)}
+
+# What each kind of surface stores: (record type code, components per element).
+CHANNELS = {
+    "wetmap": (1, 4),
+    "waves": (0, 3),
+}
+
+# Custom property listing the cached surfaces of an object.
+CACHE_PROPERTY = "weather_surface_cache"
+
+# Name of the shape key wave surfaces replay into.
+WAVES_SHAPE_KEY = "Waves"
+
+# Frames requested ahead of the current one during playback.
+READ_AHEAD = 8
+
+# Open caches, by absolute path.
+_open_caches = {}
+
+
+class SurfaceCacheWriter:
+    """Writes a surface cache one frame at a time, finishing the file on close."""
+
+    def __init__(self, path, channel, element_count, frame_start, frame_count):
+        self.path = path
+        self.type_code, self.components = CHANNELS[channel]
+        self.element_count = element_count
+        self.frame_start = frame_start
+        self.frame_count = frame_count
+        self.offsets = np.zeros(frame_count, dtype=np.uint64)
+
+        # Write to a temporary file, so a failed bake never replaces a good cache.
+        self.file = open(path + ".tmp", "wb")
+        self.file.write(HEADER.pack(
+            MAGIC, FORMAT_VERSION, self.type_code, self.components,
+            element_count, frame_start, frame_count))
+        self.file.write(self.offsets.tobytes())
+
+    def write(self, frame, values):
+        """Appends the record of a frame."""
+        values = np.ascontiguousarray(values, dtype=RECORD_TYPES[self.type_code])
+        if values.size != self.element_count * self.components:
+            raise ValueError("{0}: frame {1} has {2} values, expected {3}.".format(
+                self.path, frame, values.size, self.element_count * self.components))
+
+        self.offsets[frame - self.frame_start] = self.file.tell()
+        self.file.write(values.tobytes())
+
+    def close(self):
+        """Writes the offset table and puts the finished file in place."""
+        self.file.seek(HEADER.size)
+        self.file.write(self.offsets.tobytes())
+        self.file.close()
+        os.replace(self.path + ".tmp", self.path)
+
+
+class SurfaceCache:
+    """Gives zero-copy access to the frames of a memory-mapped surface cache."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, type_code, self.components,
+         self.element_count, self.frame_start, self.frame_count) = HEADER.unpack_from(self.map)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError("{0} is not a version {1} surface cache.".format(path, FORMAT_VERSION))
+
+        self.dtype = RECORD_TYPES[type_code]
+        self.stride = self.element_count * self.components * self.dtype.itemsize
+        self.offsets = np.frombuffer(self.map, dtype=np.uint64, count=self.frame_count, offset=HEADER.size)
+
+    def get_offset(self, frame):
+        """Returns the byte offset of a frame's record, or None if it was not baked."""
+        index = frame - self.frame_start
+        if not 0 <= index < self.frame_count or not self.offsets[index]:
+            return None
+        return int(self.offsets[index])
+
+    def frame(self, frame):
+        """Returns a frame's record as a read-only view into the file, or None."""
+        offset = self.get_offset(frame)
+        if offset is None:
+            return None
+        return np.frombuffer(self.map, dtype=self.dtype, count=self.stride // self.dtype.itemsize, offset=offset)
+
+    def read_ahead(self, frame, count=READ_AHEAD):
+        """Asks the OS to start loading the records of the frames after this one."""
+        if not hasattr(self.map, "madvise"):
+            return
+        offsets = [self.get_offset(ahead) for ahead in range(frame + 1, frame + 1 + count)]
+        offsets = [offset for offset in offsets if offset is not None]
+        if not offsets:
+            return
+
+        # madvise needs a page aligned start.
+        start = min(offsets) // mmap.PAGESIZE * mmap.PAGESIZE
+        self.map.madvise(mmap.MADV_WILLNEED, start, max(offsets) + self.stride - start)
+
+    def close(self):
+        """Unmaps and closes the file."""
+        self.offsets = None
+        self.map.close()
+        self.file.close()
+
+
+def get_cache(path):
+    """Returns the open cache for a path, opening it on first use."""
+    cache = _open_caches.get(path)
+    if cache is None:
+        cache = _open_caches[path] = SurfaceCache(path)
+    return cache
+
+
+def close_caches():
+    """Closes every open cache."""
+    for cache in _open_caches.values():
+        cache.close()
+    _open_caches.clear()
+
+
+def get_cacheable_surfaces(obj):
+    """Yields (modifier, surface, channel) for every surface of an object that can be cached."""
+    for modifier in obj.modifiers:
+        if modifier.type != 'DYNAMIC_PAINT' or modifier.canvas_settings is None:
+            continue
+        for surface in modifier.canvas_settings.canvas_surfaces:
+            if surface.surface_format != 'VERTEX':
+                continue
+            if surface.surface_type == 'PAINT' and surface.output_exists(object=obj, index=1):
+                yield modifier, surface, "wetmap"
+            elif surface.surface_type == 'WAVE':
+                yield modifier, surface, "waves"
+
+
+def read_surface(mesh, surface, channel):
+    """Reads the values a surface produced from an evaluated mesh."""
+    if channel == "waves":
+        values = np.empty(len(mesh.vertices) * 3, dtype=np.float32)
+        mesh.vertices.foreach_get("co", values)
+        return values
+
+    values = np.zeros(len(mesh.loops) * 4, dtype=np.float32)
+    layer = mesh.vertex_colors.get(surface.output_name_b)
+    if layer is not None:
+        layer.data.foreach_get("color", values)
+    return np.round(np.clip(values, 0, 1) * 255).astype(np.uint8)
+
+
+def get_element_count(mesh, channel):
+    """Returns the number of elements a channel stores per frame."""
+    return len(mesh.vertices) if channel == "waves" else len(mesh.loops)
+
+
+def get_target(obj, entry):
+    """Returns the collection the cached values of a surface are written into, creating it if needed."""
+    mesh = obj.data
+    if entry["channel"] == "wetmap":
+        layer = mesh.vertex_colors.get(entry["layer"]) or mesh.vertex_colors.new(name=entry["layer"])
+        return layer.data
+
+    if mesh.shape_keys is None:
+        obj.shape_key_add(name="Basis")
+    key_block = mesh.shape_keys.key_blocks.get(WAVES_SHAPE_KEY)
+    if key_block is None:
+        key_block = obj.shape_key_add(name=WAVES_SHAPE_KEY, from_mix=False)
+        key_block.value = 1.0
+    return key_block.data
+
+
+def apply_frame(obj, entry, frame, read_ahead):
+    """Copies a cached frame of one surface into the object's mesh."""
+    cache = get_cache(bpy.path.abspath(entry["path"]))
+    values = cache.frame(frame)
+    if values is None:
+        return
+
+    if entry["channel"] == "wetmap":
+        # Colors are stored as bytes, foreach_set wants floats.
+        get_target(obj, entry).foreach_set("color", values.astype(np.float32) / 255)
+    else:
+        get_target(obj, entry).foreach_set("co", values)
+    obj.data.update()
+
+    if read_ahead:
+        cache.read_ahead(frame)
+
+
+@persistent
+def on_frame_change(scene, *args):
+    """Copies the current frame of every cached surface into its mesh."""
+    if not any(CACHE_PROPERTY in obj.keys() for obj in scene.objects):
+        return
+
+    screen = bpy.context.screen
+    playing = screen is not None and screen.is_animation_playing
+
+    with timed_section("Surface cache frame"):
+        for obj in scene.objects:
+            if CACHE_PROPERTY not in obj.keys():
+                continue
+            for entry in obj[CACHE_PROPERTY].values():
+                apply_frame(obj, entry, scene.frame_current, playing)
+
+
+@persistent
+def on_load_pre(*args):
+    """Closes the caches of the file being left."""
+    close_caches()
+
+
+def bake_surfaces(context, objects, directory):
+    """Bakes every cacheable surface of the objects over the scene frame range."""
+    scene = context.scene
+    frame_start, frame_end = scene.frame_start, scene.frame_end
+    frame_count = frame_end - frame_start + 1
+    os.makedirs(directory, exist_ok=True)
+
+    # Read the element counts from the first frame, which also resets the simulations.
+    scene.frame_set(frame_start)
+    depsgraph = context.evaluated_depsgraph_get()
+
+    jobs = []
+    for obj in objects:
+        evaluated = obj.evaluated_get(depsgraph)
+        mesh = evaluated.to_mesh()
+        for modifier, surface, channel in get_cacheable_surfaces(obj):
+            count = get_element_count(mesh, channel)
+            # Replaying writes into the original mesh, so the topology has to match it.
+            if count != get_element_count(obj.data, channel):
+                print("{0}: {1} changes the mesh topology, not cached.".format(obj.name, surface.name))
+                continue
+            path = os.path.join(directory, bpy.path.clean_name(obj.name + "_" + surface.name) + ".wsc")
+            jobs.append((obj, modifier, surface, channel, path,
+                         SurfaceCacheWriter(path, channel, count, frame_start, frame_count)))
+        evaluated.to_mesh_clear()
+
+    for frame in range(frame_start, frame_end + 1):
+        if frame != frame_start:
+            scene.frame_set(frame)
+            depsgraph = context.evaluated_depsgraph_get()
+
+        for obj, modifier, surface, channel, path, writer in jobs:
+            evaluated = obj.evaluated_get(depsgraph)
+            writer.write(frame, read_surface(evaluated.to_mesh(), surface, channel))
+            evaluated.to_mesh_clear()
+
+    for obj, modifier, surface, channel, path, writer in jobs:
+        writer.close()
+
+        # Turn the simulation off, the cache replaces it.
+        entries = obj[CACHE_PROPERTY].to_dict() if CACHE_PROPERTY in obj.keys() else {}
+        entries[surface.name] = {
+            "path": bpy.path.relpath(path),
+            "channel": channel,
+            "layer": surface.output_name_b,
+            "modifier": modifier.name,
+            "show_viewport": modifier.show_viewport,
+            "show_render": modifier.show_render,
+        }
+        obj[CACHE_PROPERTY] = entries
+        modifier.show_viewport = False
+        modifier.show_render = False
+
+    return [path for obj, modifier, surface, channel, path, writer in jobs]
+
+
+def release_surfaces(obj):
+    """Stops replaying an object's cached surfaces and turns their simulation back on."""
+    for entry in obj[CACHE_PROPERTY].values():
+        cache = _open_caches.pop(bpy.path.abspath(entry["path"]), None)
+        if cache is not None:
+            cache.close()
+
+        modifier = obj.modifiers.get(entry["modifier"])
+        if modifier is not None:
+            modifier.show_viewport = entry["show_viewport"]
+            modifier.show_render = entry["show_render"]
+
+        if entry["channel"] == "waves" and obj.data.shape_keys is not None:
+            key_block = obj.data.shape_keys.key_blocks.get(WAVES_SHAPE_KEY)
+            if key_block is not None:
+                obj.shape_key_remove(key_block)
+
+    del obj[CACHE_PROPERTY]
+
+
+class BakeSurfaceCaches(bpy.types.Operator):
+    bl_idname = "weather_suite.bake_surface_caches"
+    bl_label = "Bake Surface Caches"
+    bl_description = "Bakes the wet and wave surfaces of the selected objects into streamed frame caches."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    directory: bpy.props.StringProperty(
+        name="Directory",
+        description="Folder the surface caches are written to",
+        default="//surface_cache/",
+        subtype="DIR_PATH")
+
+    @classmethod
+    def poll(cls, context):
+        """Needs a selected Dynamic Paint canvas."""
+        return any(next(get_cacheable_surfaces(obj), None) for obj in context.selected_objects)
+
+    def execute(self, context):
+        """Bakes the surfaces over the scene frame range, then goes back to the current frame."""
+        frame = context.scene.frame_current
+        objects = [obj for obj in context.selected_objects
+                   if obj.type == 'MESH' and CACHE_PROPERTY not in obj.keys()]
+
+        paths = bake_surfaces(context, objects, bpy.path.abspath(self.directory))
+        context.scene.frame_set(frame)
+
+        self.report({'INFO'}, "Baked {0} surface caches.".format(len(paths)))
+        return {'FINISHED'}
+
+
+class ReleaseSurfaceCaches(bpy.types.Operator):
+    bl_idname = "weather_suite.release_surface_caches"
+    bl_label = "Release Surface Caches"
+    bl_description = "Stops streaming the selected objects' surface caches and turns their simulation back on."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    @classmethod
+    def poll(cls, context):
+        """Needs a selected object with cached surfaces."""
+        return any(CACHE_PROPERTY in obj.keys() for obj in context.selected_objects)
+
+    def execute(self, context):
+        """Releases every cached surface of the selection."""
+        for obj in context.selected_objects:
+            if CACHE_PROPERTY in obj.keys():
+                release_surfaces(obj)
+        return {'FINISHED'}
+
+
+# Operators registered by this module.
+classes = (BakeSurfaceCaches, ReleaseSurfaceCaches)
+
+
+def draw_menu(self, context):
+    """Draws the surface cache operators in the Add menu, next to the weather operators."""
+    self.layout.operator(BakeSurfaceCaches.bl_idname, icon="MOD_FLUIDSIM")
+    self.layout.operator(ReleaseSurfaceCaches.bl_idname, icon="MOD_FLUIDSIM")
+
+
+def register():
+    """Registers the surface cache operators and frame change handler."""
+    for cls in classes:
+        bpy.utils.register_class(cls)
+    bpy.types.VIEW3D_MT_add.append(draw_menu)
+
+    bpy.app.handlers.frame_change_pre.append(on_frame_change)
+    bpy.app.handlers.load_pre.append(on_load_pre)
+
+
+def unregister():
+    """Unregisters the surface cache operators and handlers, closing the open caches."""
+    if on_load_pre in bpy.app.handlers.load_pre:
+        bpy.app.handlers.load_pre.remove(on_load_pre)
+    if on_frame_change in bpy.app.handlers.frame_change_pre:
+        bpy.app.handlers.frame_change_pre.remove(on_frame_change)
+    close_caches()
+
+    bpy.types.VIEW3D_MT_add.remove(draw_menu)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
@@ -0,0 +1,246 @@
+"""
+Swaps every weather object into a lightweight viewport preview and back.
+
+The preview shows a fraction of the rain as dots, drops cloud subdivision in
+the viewport, builds cloud volumes from fewer voxels and pauses Dynamic Paint
+canvases in the viewport. The original values are stored on each object, so
+they survive saving, and are put back exactly while rendering.
+"""
+
+import time
+
+import bpy
+from bpy.app.handlers import persistent
+
+# Custom property holding the original values of an object's previewed settings.
+ORIGINAL_PROPERTY = "weather_preview_original"
+
+# Preview value of every setting the preview changes, by attribute name.
+PREVIEW_VALUES = {
+    "display_percentage": 10,
+    "display_method": 'DOT',
+    "levels": 0,
+    "voxel_amount": 32,
+    "show_viewport": False,
+}
+
+# Frames stepped when measuring the viewport frame rate.
+FPS_FRAMES = 24
+
+# Whether the originals are in place for a render that is running.
+_rendering = False
+
+
+def is_cloud(obj):
+    """Checks if an object is a cloud mesh made by Generate Cloud."""
+    displace = obj.modifiers.get("Displace")
+    return (displace is not None and displace.texture is not None
+            and displace.texture.name == "Cloud Texture")
+
+
+def find_settings(obj):
+    """Yields (key, owner, attribute) for every setting of an object the preview changes."""
+    for particle_system in getattr(obj, "particle_systems", []):
+        if particle_system.name == "Rain Particle System":
+            for attribute in ("display_percentage", "display_method"):
+                yield "particles|{0}|{1}".format(particle_system.name, attribute), \
+                    particle_system.settings, attribute
+
+    for modifier in obj.modifiers:
+        if modifier.type == 'SUBSURF' and is_cloud(obj):
+            attribute = "levels"
+        elif modifier.type == 'MESH_TO_VOLUME' and modifier.resolution_mode == 'VOXEL_AMOUNT':
+            attribute = "voxel_amount"
+        elif modifier.type == 'DYNAMIC_PAINT' and modifier.canvas_settings is not None:
+            attribute = "show_viewport"
+        else:
+            continue
+        yield "modifier|{0}|{1}".format(modifier.name, attribute), modifier, attribute
+
+
+def resolve(obj, key):
+    """Returns the (owner, attribute) a stored key refers to, or None if it is gone."""
+    kind, name, attribute = key.split("|")
+    if kind == "particles":
+        particle_system = obj.particle_systems.get(name)
+        return (particle_system.settings, attribute) if particle_system is not None else None
+    modifier = obj.modifiers.get(name)
+    return (modifier, attribute) if modifier is not None else None
+
+
+def set_value(owner, attribute, value):
+    """Sets a setting, converting stored ID property values back to the setting's type."""
+    current = getattr(owner, attribute)
+    setattr(owner, attribute, type(current)(value))
+
+
+def enable_preview(scene):
+    """Stores the original settings of every weather object and applies the preview."""
+    # Particle settings can be shared, only store their originals once.
+    seen_settings = set()
+
+    for obj in scene.objects:
+        if ORIGINAL_PROPERTY in obj.keys():
+            continue
+
+        originals = {}
+        for key, owner, attribute in find_settings(obj):
+            if isinstance(owner, bpy.types.ParticleSettings):
+                if (owner.name, attribute) in seen_settings:
+                    continue
+                seen_settings.add((owner.name, attribute))
+
+            originals[key] = getattr(owner, attribute)
+            set_value(owner, attribute, PREVIEW_VALUES[attribute])
+
+        if originals:
+            obj[ORIGINAL_PROPERTY] = originals
+
+    scene.weather_viewport_preview = True
+
+
+def apply_stored(scene, use_originals):
+    """Puts either the stored originals or the preview values on every previewed object."""
+    for obj in scene.objects:
+        if ORIGINAL_PROPERTY not in obj.keys():
+            continue
+        for key, original in obj[ORIGINAL_PROPERTY].items():
+            target = resolve(obj, key)
+            if target is None:
+                continue
+            owner, attribute = target
+            set_value(owner, attribute, original if use_originals else PREVIEW_VALUES[attribute])
+
+
+def disable_preview(scene):
+    """Restores the original settings and forgets them."""
+    apply_stored(scene, use_originals=True)
+    for obj in scene.objects:
+        if ORIGINAL_PROPERTY in obj.keys():
+            del obj[ORIGINAL_PROPERTY]
+    scene.weather_viewport_preview = False
+
+
+def set_preview(scene, preview):
+    """Turns the preview on or off, if it is not already."""
+    if scene.weather_viewport_preview == preview:
+        return
+    if preview:
+        enable_preview(scene)
+    else:
+        disable_preview(scene)
+
+
+@persistent
+def on_render_pre(scene, *args):
+    """Puts the render settings back before the first frame renders."""
+    global _rendering
+    if scene.weather_viewport_preview and not _rendering:
+        apply_stored(scene, use_originals=True)
+        _rendering = True
+
+
+@persistent
+def on_render_post(scene, *args):
+    """Goes back to the preview once the render finished or was cancelled."""
+    global _rendering
+    if _rendering:
+        apply_stored(scene, use_originals=False)
+        _rendering = False
+
+
+def measure_fps(frames=FPS_FRAMES):
+    """Steps the animation in the viewport and returns the frames per second."""
+    start = time.perf_counter()
+    bpy.ops.wm.redraw_timer(type='ANIM_STEP', iterations=frames)
+    return frames / (time.perf_counter() - start)
+
+
+class ToggleViewportPreview(bpy.types.Operator):
+    bl_idname = "weather_suite.toggle_viewport_preview"
+    bl_label = "Weather Viewport Preview"
+    bl_description = "Switches every weather object between a lightweight viewport preview and its render settings."
+    bl_options = {'REGISTER', 'UNDO'}
+
+    def execute(self, context):
+        """Turns the preview on or off for the scene."""
+        if context.scene.weather_viewport_preview:
+            disable_preview(context.scene)
+        else:
+            enable_preview(context.scene)
+        return {'FINISHED'}
+
+
+class MeasureViewportFPS(bpy.types.Operator):
+    bl_idname = "weather_suite.measure_viewport_fps"
+    bl_label = "Measure Weather Viewport FPS"
+    bl_description = "Measures the viewport frame rate with and without the weather preview."
+    bl_options = {'REGISTER'}
+
+    @classmethod
+    def poll(cls, context):
+        """Needs a viewport to redraw."""
+        return context.area is not None and context.area.type == 'VIEW_3D'
+
+    def execute(self, context):
+        """Measures the frame rate in both modes, leaving the scene as it was."""
+        scene = context.scene
+        frame = scene.frame_current
+        was_preview = scene.weather_viewport_preview
+
+        # Switched directly, the toggle operator would push an undo step every time.
+        fps = {}
+        for preview in (False, True):
+            set_preview(scene, preview)
+            scene.frame_set(frame)
+            fps[preview] = measure_fps()
+
+        set_preview(scene, was_preview)
+        scene.frame_set(frame)
+
+        self.report({'INFO'}, "Viewport: {0:.1f} fps with render settings, {1:.1f} fps in preview.".format(
+            fps[False], fps[True]))
+        return {'FINISHED'}
+
+
+# Operators registered by this module.
+classes = (ToggleViewportPreview, MeasureViewportFPS)
+
+
+def draw_menu(self, context):
+    """Draws the preview toggle in the View menu."""
+    self.layout.separator()
+    self.layout.operator(
+        ToggleViewportPreview.bl_idname,
+        icon='CHECKBOX_HLT' if context.scene.weather_viewport_preview else 'CHECKBOX_DEHLT')
+    self.layout.operator(MeasureViewportFPS.bl_idname)
+
+
+def register():
+    """Registers the preview operators, scene property and render handlers."""
+    bpy.types.Scene.weather_viewport_preview = bpy.props.BoolProperty(
+        name="Weather Viewport Preview",
+        description="Weather objects use their lightweight viewport preview")
+
+    for cls in classes:
+        bpy.utils.register_class(cls)
+    bpy.types.VIEW3D_MT_view.append(draw_menu)
+
+    bpy.app.handlers.render_pre.append(on_render_pre)
+    bpy.app.handlers.render_complete.append(on_render_post)
+    bpy.app.handlers.render_cancel.append(on_render_post)
+
+
+def unregister():
+    """Unregisters the preview operators, scene property and render handlers."""
+    for handlers in (bpy.app.handlers.render_complete, bpy.app.handlers.render_cancel):
+        if on_render_post in handlers:
+            handlers.remove(on_render_post)
+    if on_render_pre in bpy.app.handlers.render_pre:
+        bpy.app.handlers.render_pre.remove(on_render_pre)
+
+    bpy.types.VIEW3D_MT_view.remove(draw_menu)
+    for cls in reversed(classes):
+        bpy.utils.unregister_class(cls)
+
+    del bpy.types.Scene.weather_viewport_preview
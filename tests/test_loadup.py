@@ -0,0 +1,121 @@
+"""
+Checks the Blender cache eviction of loadup.py on a temporary folder, without Blender.
+
+Run with either:
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+import types
+import unittest
+
+MODULE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "addon-1", "loadup.py")
+
+
+def load_loadup():
+    """Imports loadup.py from its path, with just enough of bpy for its module level code."""
+    bpy = types.ModuleType("bpy")
+    app = types.ModuleType("bpy.app")
+    handlers = types.ModuleType("bpy.app.handlers")
+    handlers.persistent = lambda function: function
+    app.handlers = handlers
+    bpy.app = app
+    bpy.types = types.SimpleNamespace(Operator=object)
+
+    # Only the stand-ins are taken out again, modules loadup imported for real stay loaded.
+    stand_ins = {"bpy": bpy, "bpy.app": app, "bpy.app.handlers": handlers}
+    sys.modules.update(stand_ins)
+    try:
+        spec = importlib.util.spec_from_file_location("loadup", MODULE_PATH)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        for name in stand_ins:
+            sys.modules.pop(name, None)
+    return module
+
+
+loadup = load_loadup()
+
+
+class CacheManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache_dir = self.directory.name
+        self.now = time.time()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_file(self, name, size, age):
+        """Writes a cache file of a size, last used age seconds ago."""
+        path = os.path.join(self.cache_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as cache_file:
+            cache_file.write(bytes(size))
+        used = self.now - age
+        os.utime(path, (used, used))
+        return path
+
+    def remaining(self):
+        """Returns the names of the top level entries left in the cache."""
+        return sorted(os.listdir(self.cache_dir))
+
+    def test_evicts_least_recently_used_until_under_budget(self):
+        self.make_file("newest", 100, 100)
+        self.make_file("oldest", 100, 300)
+        self.make_file("older", 100, 200)
+
+        manager = loadup.CacheManager(self.cache_dir, budget=150)
+        manager.evict()
+
+        self.assertEqual(self.remaining(), ["newest"])
+        self.assertEqual(manager.bytes_freed, 200)
+        self.assertEqual(manager.entries_evicted, 2)
+        self.assertEqual(manager.entries_kept, 1)
+
+    def test_keeps_everything_within_budget(self):
+        self.make_file("a", 100, 300)
+        self.make_file("b", 100, 200)
+
+        manager = loadup.CacheManager(self.cache_dir, budget=200)
+        manager.evict()
+
+        self.assertEqual(self.remaining(), ["a", "b"])
+        self.assertEqual(manager.entries_evicted, 0)
+
+    def test_never_evicts_entries_used_this_session(self):
+        self.make_file("old", 100, 300)
+        self.make_file("current", 100, -10)
+
+        manager = loadup.CacheManager(self.cache_dir, budget=0)
+        manager.session_start = self.now
+        manager.evict()
+
+        self.assertEqual(self.remaining(), ["current"])
+
+    def test_directory_is_as_recent_as_its_newest_file(self):
+        self.make_file(os.path.join("folder", "old"), 100, 400)
+        self.make_file(os.path.join("folder", "nested", "newer"), 100, 100)
+        self.make_file("file", 100, 200)
+        # Walking a directory updates its own times, they must not count.
+        folder = os.path.join(self.cache_dir, "folder")
+        os.utime(folder, (self.now, self.now))
+
+        manager = loadup.CacheManager(self.cache_dir, budget=200)
+        entries = {os.path.basename(path): (last_used, size) for last_used, size, path in manager.scan()}
+        self.assertEqual(entries["folder"], (self.now - 100, 200))
+
+        manager.evict()
+        self.assertEqual(self.remaining(), ["folder"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+"""
+Round-trips synthetic rain through the rain cache format, without Blender.
+
+Run with either:
+    python -m pytest tests
+    python -m unittest discover tests
+"""
+
+import importlib.util
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+# The module imports bpy only when baking, so it loads on its own from its path.
+MODULE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                           "addon-6", "weather_suite", "rain_cache.py")
+
+
+def load_rain_cache():
+    """Imports rain_cache.py from its path, without the rest of the suite."""
+    spec = importlib.util.spec_from_file_location("rain_cache", MODULE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+rain_cache = load_rain_cache()
+
+
+class RainCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.result = rain_cache.measure(10000, 96)
+
+    def test_ids_are_exact(self):
+        self.assertTrue(self.result["ids_exact"])
+
+    def test_positions_within_bound(self):
+        self.assertTrue(self.result["positions_within_bound"],
+                        "position error {0} above bound {1}".format(
+                            self.result["position_error"], self.result["position_bound"]))
+
+    def test_velocities_within_bound(self):
+        self.assertTrue(self.result["velocities_within_bound"],
+                        "velocity error {0} above bound {1}".format(
+                            self.result["velocity_error"], self.result["velocity_bound"]))
+
+    def test_subnormal_velocities_within_floor(self):
+        velocities = np.array([[1e-7, -3e-5, 6e-5], [2 ** -24, 0.0, -9.0]], dtype=np.float32)
+        ids, positions = np.arange(2), np.zeros((2, 3), dtype=np.float32)
+        (_, _, cached), _ = rain_cache.decode_frame(rain_cache.encode_frame(ids, positions, velocities), 0)
+        error = np.abs(cached.astype(np.float64) - velocities)
+        self.assertTrue((error <= rain_cache.get_velocity_bound(velocities)).all())
+        # The old relative bound alone fails on these.
+        self.assertTrue((error[0] > np.abs(velocities[0]) * 2 ** -11).any())
+
+    def test_smaller_than_float32(self):
+        self.assertGreater(self.result["raw_size"] / self.result["size"], 3)
+
+    def test_empty_and_single_drop_frames(self):
+        frames = [
+            (np.empty(0, dtype=np.int64), np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.float32)),
+            (np.array([7]), np.array([[1.5, -2.0, 19.0]], dtype=np.float32),
+             np.array([[0.0, 0.0, -8.0]], dtype=np.float32)),
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "frames.wrc")
+            writer = rain_cache.RainCacheWriter(path, 10, len(frames))
+            for frame, drops in enumerate(frames, 10):
+                writer.write(frame, *drops)
+            writer.close()
+
+            cache = rain_cache.RainCache(path)
+            empty, single = cache.frame(10), cache.frame(11)
+            with self.assertRaises(IndexError):
+                cache.frame(12)
+            cache.close()
+
+        self.assertEqual(len(empty[0]), 0)
+        np.testing.assert_array_equal(single[0], [7])
+        np.testing.assert_array_equal(single[1], frames[1][1])
+        np.testing.assert_array_equal(single[2], frames[1][2])
+
+
+if __name__ == "__main__":
+    unittest.main()